@@ -9,28 +9,29 @@ import os
 import sys
 
 from luna                            import configure_default_logging
-from luna.gateware.usb.usb2.device   import USBDevice
 
 import luna_soc
 from luna_soc.gateware.cpu           import InterruptController, VexRiscv
-from luna_soc.gateware.core          import blockram, timer, uart
+from luna_soc.gateware.core          import blockram, timer, uart, usb2
 from luna_soc.gateware.provider      import cynthion as provider
 from luna_soc.util.readbin           import get_mem_data
 
 from amaranth                        import *
 from amaranth.lib                    import wiring
+from amaranth.utils                  import exact_log2
 
 from amaranth_soc                    import csr, gpio, wishbone
 from amaranth_soc.csr.wishbone       import WishboneCSRBridge
 
 CLOCK_FREQUENCIES_MHZ = {
-    'sync': 60
+    'sync': 60,
+    'usb':  60,
 }
 
 # - HelloSoc ------------------------------------------------------------------
 
 class HelloSoc(wiring.Component):
-    def __init__(self, clock_frequency_hz, domain):
+    def __init__(self, clock_frequency_hz, domain, csr_data_width=8):
         super().__init__({})
 
         self.clock_frequency_hz = clock_frequency_hz
@@ -44,6 +45,14 @@ class HelloSoc(wiring.Component):
         leds_base            = 0x00000000
         uart0_base           = 0x00000300
         timer0_base          = 0x00000500
+        usb0_base            = 0x00000800
+        usb0_ep_control_base = 0x00000900
+        usb0_ep_in_base      = 0x00000a00
+        usb0_ep_out_base     = 0x00000b00
+        usb0_dma_base        = 0x00000c00
+
+        # csr peripheral addresses are given in bytes; convert them to csr bus words
+        csr_ratio = csr_data_width // 8
 
         # cpu
         self.cpu = VexRiscv(
@@ -54,14 +63,9 @@ class HelloSoc(wiring.Component):
         # interrupt controller
         self.interrupt_controller = InterruptController(width=len(self.cpu.irq_external))
 
-        # bus
-        self.wb_arbiter  = wishbone.Arbiter(
-            addr_width=30,
-            data_width=32,
-            granularity=8,
-            features={"cti", "bte", "err"}
-        )
-        self.wb_decoder  = wishbone.Decoder(
+        # bus; each of our targets is arbitrated separately, so that e.g. instruction fetches
+        # from blockram don't wait for peripheral accesses
+        self.wb_crossbar = wishbone.Crossbar(
             addr_width=30,
             data_width=32,
             granularity=8,
@@ -77,43 +81,64 @@ class HelloSoc(wiring.Component):
 
         # blockram
         self.blockram = blockram.Peripheral(size=blockram_size, init=firmware)
-        self.wb_decoder.add(self.blockram.bus, addr=blockram_base, name="blockram")
+        self.wb_crossbar.add_subordinate(self.blockram.bus, addr=blockram_base, name="blockram")
 
         # csr decoder
-        self.csr_decoder = csr.Decoder(addr_width=28, data_width=8)
+        self.csr_decoder = csr.Decoder(addr_width=28 - exact_log2(csr_ratio), data_width=csr_data_width)
 
         # leds
         self.led_count = 6
-        self.leds = gpio.Peripheral(pin_count=self.led_count, addr_width=3, data_width=8)
-        self.csr_decoder.add(self.leds.bus, addr=leds_base, name="leds")
+        self.leds = gpio.Peripheral(pin_count=self.led_count, addr_width=3, data_width=csr_data_width)
+        self.csr_decoder.add(self.leds.bus, addr=leds_base // csr_ratio, name="leds")
 
         # uart0
         uart_baud_rate = 115200
         divisor = int(clock_frequency_hz // uart_baud_rate)
-        self.uart0 = uart.Peripheral(divisor=divisor)
-        self.csr_decoder.add(self.uart0.bus, addr=uart0_base, name="uart0")
+        self.uart0 = uart.Peripheral(divisor=divisor, csr_data_width=csr_data_width)
+        self.csr_decoder.add(self.uart0.bus, addr=uart0_base // csr_ratio, name="uart0")
 
         # timer0
-        self.timer0 = timer.Peripheral(width=32)
-        self.csr_decoder.add(self.timer0.bus, addr=timer0_base, name="timer0")
+        self.timer0 = timer.Peripheral(width=32, csr_data_width=csr_data_width)
+        self.csr_decoder.add(self.timer0.bus, addr=timer0_base // csr_ratio, name="timer0")
         self.interrupt_controller.add(self.timer0, number=0, name="timer0")
 
-        # wishbone csr bridge
-        self.wb_to_csr = WishboneCSRBridge(self.csr_decoder.bus, data_width=32)
-        self.wb_decoder.add(self.wb_to_csr.wb_bus, addr=csr_base, sparse=False, name="wb_to_csr")
+        # usb0
+        self.usb0            = usb2.device.Peripheral(csr_data_width=csr_data_width)
+        self.usb0_ep_control = usb2.ep_control.Peripheral(csr_data_width=csr_data_width)
+        self.usb0_ep_in      = usb2.ep_in.Peripheral(csr_data_width=csr_data_width)
+        self.usb0_ep_out     = usb2.ep_out.Peripheral(nyet=True, csr_data_width=csr_data_width)
+        self.csr_decoder.add(self.usb0.bus,            addr=usb0_base            // csr_ratio, name="usb0")
+        self.csr_decoder.add(self.usb0_ep_control.bus, addr=usb0_ep_control_base // csr_ratio, name="usb0_ep_control")
+        self.csr_decoder.add(self.usb0_ep_in.bus,      addr=usb0_ep_in_base      // csr_ratio, name="usb0_ep_in")
+        self.csr_decoder.add(self.usb0_ep_out.bus,     addr=usb0_ep_out_base     // csr_ratio, name="usb0_ep_out")
+        self.interrupt_controller.add(self.usb0,            number=1, name="usb0")
+        self.interrupt_controller.add(self.usb0_ep_control, number=2, name="usb0_ep_control")
+        self.interrupt_controller.add(self.usb0_ep_in,      number=3, name="usb0_ep_in")
+        self.interrupt_controller.add(self.usb0_ep_out,     number=4, name="usb0_ep_out")
+
+        # usb0 dma; its engine runs alongside our endpoints, in the usb domain, while its bus
+        # initiator shares our crossbar with the cpu
+        self.usb0_dma = usb2.dma.Peripheral(wb_domain="sync", csr_data_width=csr_data_width)
+        self.csr_decoder.add(self.usb0_dma.bus, addr=usb0_dma_base // csr_ratio, name="usb0_dma")
+        self.interrupt_controller.add(self.usb0_dma, number=5, name="usb0_dma")
+
+        # wishbone csr bridge; byte addressed, so that csr buses wider than 8 bits can share our decoder
+        self.wb_to_csr = WishboneCSRBridge(self.csr_decoder.bus, data_width=32, granularity=8,
+                                           skip_unselected=True)
+        self.wb_crossbar.add_subordinate(self.wb_to_csr.wb_bus, addr=csr_base, sparse=False, name="wb_to_csr")
 
 
     def elaborate(self, platform):
         m = Module()
 
         # bus
-        m.submodules += [self.wb_arbiter, self.wb_decoder]
-        wiring.connect(m, self.wb_arbiter.bus, self.wb_decoder.bus)
+        m.submodules += self.wb_crossbar
 
         # cpu
         m.submodules += self.cpu
-        self.wb_arbiter.add(self.cpu.ibus)
-        self.wb_arbiter.add(self.cpu.dbus)
+        self.wb_crossbar.add_initiator(self.cpu.ibus)
+        self.wb_crossbar.add_initiator(self.cpu.dbus)
+        self.wb_crossbar.add_initiator(self.usb0_dma.wb_bus)
 
         # interrupt controller
         m.submodules += self.interrupt_controller
@@ -139,6 +164,21 @@ class HelloSoc(wiring.Component):
         # timer0
         m.submodules += self.timer0
 
+        # usb0; our endpoints are added to the device as its endpoint handlers
+        usb0_provider = provider.ULPIProvider("target_phy")
+        m.submodules += [usb0_provider, self.usb0]
+        usb0_device = usb2.device.USBDevice(bus=usb0_provider.bus)
+        usb0_device.add_endpoint(self.usb0_ep_control)
+        usb0_device.add_endpoint(self.usb0_ep_in)
+        usb0_device.add_endpoint(self.usb0_ep_out)
+        m.d.comb += self.usb0.attach(usb0_device)
+        m.submodules.usb0_device = usb0_device
+
+        # usb0 dma
+        m.submodules += self.usb0_dma
+        wiring.connect(m, self.usb0_dma.ep_in,  self.usb0_ep_in.dma)
+        wiring.connect(m, self.usb0_dma.ep_out, self.usb0_ep_out.dma)
+
         # wishbone csr bridge
         m.submodules += self.wb_to_csr
 
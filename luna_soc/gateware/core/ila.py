@@ -10,6 +10,8 @@ from amaranth.lib.wiring   import In, Out, flipped, connect
 
 from amaranth_soc          import csr
 
+from ..csr                 import check_data_width
+
 
 class Peripheral(wiring.Component):
     """ A simple peripheral interface to the ila. """
@@ -22,15 +24,17 @@ class Peripheral(wiring.Component):
         c: csr.Field(csr.action.W, unsigned(8))
         d: csr.Field(csr.action.W, unsigned(8))
 
-    def __init__(self):
+    def __init__(self, *, csr_data_width=8):
+        check_data_width(csr_data_width)
+
         # registers
-        regs = csr.Builder(addr_width=4, data_width=8)
+        regs = csr.Builder(addr_width=4, data_width=csr_data_width)
         self._control = regs.add("control", self.Control())
         self._trace   = regs.add("trace",   self.Trace())
         self._bridge = csr.Bridge(regs.as_memory_map())
 
         # csr decoder
-        self._decoder = csr.Decoder(addr_width=5, data_width=8)
+        self._decoder = csr.Decoder(addr_width=5, data_width=csr_data_width)
         self._decoder.add(self._bridge.bus)
 
         super().__init__({
@@ -46,7 +46,8 @@ class Peripheral(wiring.Component):
     Also, performs CDC if a different clock is used in the PHY.
     """
     def __init__(self, phy, *, data_width=32, granularity=8, with_controller=True, controller_name=None,
-                 with_mmap=True, mmap_size=None, mmap_name=None, mmap_byteorder="little", domain="sync"):
+                 with_mmap=True, mmap_size=None, mmap_name=None, mmap_byteorder="little", domain="sync",
+                 csr_data_width=8):
 
         self._domain    = domain
         self.data_width = data_width
@@ -59,6 +60,7 @@ class Peripheral(wiring.Component):
                 granularity=granularity,
                 name=controller_name,
                 domain=domain,
+                csr_data_width=csr_data_width,
             )
             self.csr = self.spi_controller.bus
             self.cores.append(self.spi_controller)
@@ -14,6 +14,7 @@ from amaranth.lib.wiring  import In, Out, flipped, connect
 
 from amaranth_soc         import csr
 
+from ...csr               import check_data_width
 from .port                import SPIControlPort
 
 
@@ -68,7 +69,10 @@ class SPIController(wiring.Component):
             })
 
 
-    def __init__(self, *, data_width=32, granularity=8, rx_depth=16, tx_depth=16, name=None, domain="sync"):
+    def __init__(self, *, data_width=32, granularity=8, rx_depth=16, tx_depth=16, name=None, domain="sync",
+                 csr_data_width=8):
+        check_data_width(csr_data_width)
+
         wiring.Component.__init__(self, SPIControlPort(data_width))
 
         self._domain   = domain
@@ -86,7 +90,7 @@ class SPIController(wiring.Component):
         self._tx_fifo = DomainRenamer(domain)(SyncFIFO(width=len(self.source.payload), depth=tx_depth))
 
         # registers
-        regs = csr.Builder(addr_width=5, data_width=8)
+        regs = csr.Builder(addr_width=5, data_width=csr_data_width)
         self._phy    = regs.add("phy",    self.Phy(self.source))
         self._cs     = regs.add("cs",     self.Cs())
         self._status = regs.add("status", self.Status())
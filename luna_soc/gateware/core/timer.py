@@ -12,6 +12,8 @@ from amaranth.lib.wiring  import In, Out, flipped, connect
 
 from amaranth_soc         import csr, event
 
+from ..csr                import check_data_width
+
 
 class Peripheral(wiring.Component):
     class Enable(csr.Register, access="rw"):
@@ -37,17 +39,18 @@ class Peripheral(wiring.Component):
             })
 
 
-    def __init__(self, *, width):
+    def __init__(self, *, width, csr_data_width=8):
         if not isinstance(width, int) or width < 0:
             raise ValueError("Counter width must be a non-negative integer, not {!r}"
                              .format(width))
         if width > 32:
             raise ValueError("Counter width cannot be greater than 32 (was: {})"
                              .format(width))
+        check_data_width(csr_data_width)
         self.width   = width
 
         # registers
-        regs = csr.Builder(addr_width=4, data_width=8)
+        regs = csr.Builder(addr_width=4, data_width=csr_data_width)
         self._enable  = regs.add("enable",  self.Enable())
         self._mode    = regs.add("mode",    self.Mode())
         self._reload  = regs.add("reload",  self.Reload(width))
@@ -60,10 +63,10 @@ class Peripheral(wiring.Component):
         self._zero = EventSource(trigger="rise", path=("zero",))
         event_map = event.EventMap()
         event_map.add(self._zero)
-        self._events = csr.event.EventMonitor(event_map, data_width=8)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
 
         # csr decoder
-        self._decoder = csr.Decoder(addr_width=5, data_width=8)
+        self._decoder = csr.Decoder(addr_width=5, data_width=csr_data_width)
         self._decoder.add(self._bridge.bus)
         self._decoder.add(self._events.bus, name="ev")
 
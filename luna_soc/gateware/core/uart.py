@@ -11,6 +11,8 @@ from amaranth.lib.wiring    import In, Out, flipped, connect
 from amaranth_soc           import csr
 from amaranth_stdio.serial  import AsyncSerialRX, AsyncSerialTX
 
+from ..csr                  import check_data_width
+
 
 __all__ = ["PinSignature", "Peripheral"]
 
@@ -63,10 +65,12 @@ class Peripheral(wiring.Component):
 
 
     """A minimal UART."""
-    def __init__(self, *, divisor):
+    def __init__(self, *, divisor, csr_data_width=8):
+        check_data_width(csr_data_width)
+
         self._init_divisor = divisor
 
-        regs = csr.Builder(addr_width=5, data_width=8)
+        regs = csr.Builder(addr_width=5, data_width=csr_data_width)
 
         self._tx_data   = regs.add("tx_data",  self.TxData(),  offset=0x00)
         self._rx_data   = regs.add("rx_data",  self.RxData(),  offset=0x04)
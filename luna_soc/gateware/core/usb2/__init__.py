@@ -4,9 +4,15 @@
 # Copyright (c) 2023-2024 Great Scott Gadgets <info@greatscottgadgets.com>
 # SPDX-License-Identifier: BSD-3-Clause
 
+from . import coalesce
+from . import completion
 from . import device
+from . import dma
 from . import ep_control
 from . import ep_in
 from . import ep_out
+from . import packetram
+from . import responder
+from . import serial
 
 from . import ulpi
@@ -0,0 +1,104 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Interrupt moderation for our `eptri`-equivalent endpoints.
+
+Gathers several occurrences of an event into a single pulse, which can then be used to drive
+an ``event.Source`` within a ``csr.event.EventMonitor``; reducing the number of interrupts taken
+by the CPU, while keeping their latency bounded.
+"""
+
+from amaranth                         import *
+
+from amaranth_soc                     import csr
+
+
+class EventCoalescer(Elaboratable):
+    """ Coalesces occurrences of an event.
+
+    Each pulse on ``i`` is counted. A single pulse is generated on ``o`` once ``count`` events have
+    occurred; or, if ``timeout`` is non-zero, once ``timeout`` microseconds have passed since the first
+    event that hasn't yet been reported. With a ``count`` of zero or one, every event is reported
+    immediately.
+
+    Attributes
+    ----------
+
+    i: Signal(), input
+        Strobe that indicates an event has occurred.
+    o: Signal(), output
+        Strobe that indicates that one or more events should be reported.
+    """
+
+    class Coalesce(csr.Register, access="rw"):
+        """ Coalesce register
+
+            count:   The number of events that are gathered into a single interrupt. Values of `0` and `1`
+                     raise an interrupt for every event.
+            timeout: The maximum time, in microseconds, that an event may be held before an interrupt is
+                     raised; or `0` to wait for `count` events regardless of how long they take.
+        """
+        count   : csr.Field(csr.action.RW,      unsigned(8))
+        _0      : csr.Field(csr.action.ResRAW0, unsigned(8))
+        timeout : csr.Field(csr.action.RW,      unsigned(16))
+
+
+    def __init__(self, register, *, clock_frequency=60e6):
+        """
+        Parameters
+        ----------
+            register: EventCoalescer.Coalesce
+                The register that holds our configuration.
+            clock_frequency: float, optional
+                The frequency of the clock that drives us, in Hz. Used to measure our timeout.
+                Defaults to the 60 MHz clock used by a ULPI PHY.
+        """
+        if not isinstance(register, self.Coalesce):
+            raise TypeError("Register must be an instance of EventCoalescer.Coalesce, not {!r}"
+                            .format(register))
+        if clock_frequency < 1e6:
+            raise ValueError("Clock frequency must be at least 1 MHz, not {!r}"
+                             .format(clock_frequency))
+
+        self._register        = register
+        self._cycles_per_usec = int(clock_frequency // 1e6)
+
+        self.i = Signal()
+        self.o = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        count   = self._register.f.count.data
+        timeout = self._register.f.timeout.data
+
+        # Keep track of how many events we've yet to report...
+        pending = Signal.like(count)
+        with m.If(self.o):
+            m.d.sync += pending.eq(0)
+        with m.Elif(self.i & (pending != 2 ** len(pending) - 1)):
+            m.d.sync += pending.eq(pending + 1)
+
+        # ... and of how long the oldest of them has been waiting, in microseconds.
+        prescaler = Signal(range(self._cycles_per_usec))
+        elapsed   = Signal.like(timeout)
+        usec_tick = (prescaler == self._cycles_per_usec - 1)
+        with m.If(self.o | (pending == 0)):
+            m.d.sync += [
+                prescaler  .eq(0),
+                elapsed    .eq(0),
+            ]
+        with m.Else():
+            m.d.sync += prescaler.eq(Mux(usec_tick, 0, prescaler + 1))
+            with m.If(usec_tick & (elapsed != 2 ** len(elapsed) - 1)):
+                m.d.sync += elapsed.eq(elapsed + 1)
+
+        # Report our events once we've gathered enough of them, or once they've waited too long.
+        count_reached   = self.i & (pending + 1 >= count)
+        timeout_reached = (timeout != 0) & (pending != 0) & (elapsed >= timeout)
+        m.d.comb += self.o.eq(count_reached | timeout_reached)
+
+        return m
@@ -0,0 +1,119 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Per-endpoint completion bitmap for our `eptri`-equivalent endpoints.
+
+Gathers the completion strobes of the ``ep_control``, ``ep_in`` and ``ep_out`` peripherals into
+a set of sticky bits; so a single interrupt handler can find every endpoint that needs servicing
+without polling each peripheral's status registers.
+"""
+
+from typing                           import Annotated
+
+from amaranth                         import *
+from amaranth.hdl.xfrm                import DomainRenamer
+from amaranth.lib                     import wiring
+from amaranth.lib.wiring              import In, Out, connect, flipped
+
+from amaranth_soc                     import csr, event
+
+from ...csr                           import check_data_width
+
+
+class Peripheral(wiring.Component):
+    """ Completion bitmap for our `eptri`-equivalent interface.
+
+    Each bit is set when the corresponding endpoint completes a packet, and remains set until
+    it's cleared by writing a '1' to it. The IN and OUT bitmaps share a single 32-bit register,
+    so they can be read with a single bus access.
+
+    Firmware would typically clear the ``complete`` event, read the COMPLETE and SETUP registers,
+    service each endpoint with a bit set, and then write those same bits back to clear them.
+
+    Attributes
+    ----------
+
+    in_complete: Signal(16), input
+        Completion strobes from an ``ep_in.Peripheral``.
+    out_complete: Signal(16), input
+        Completion strobes from an ``ep_out.Peripheral``.
+    setup_complete: Signal(), input
+        Completion strobe from an ``ep_control.Peripheral``.
+    """
+
+    class Complete(csr.Register, access="rw"):
+        """ Complete register
+
+            in_mask:  Bit `n` is set when IN endpoint `n` finishes sending a packet that raises its DONE event.
+            out_mask: Bit `n` is set when a packet is received on OUT endpoint `n`.
+
+            Writing a '1' to a bit clears it.
+        """
+        in_mask  : csr.Field(csr.action.RW1C, unsigned(16))
+        out_mask : csr.Field(csr.action.RW1C, unsigned(16))
+
+    class Setup(csr.Register, access="rw"):
+        """ Setup register
+
+            setup: Set when a new SETUP packet is ready to be read. Writing a '1' clears it.
+        """
+        setup : csr.Field(csr.action.RW1C,    unsigned(1))
+        _0    : csr.Field(csr.action.ResRAW0, unsigned(7))
+
+
+    def __init__(self, *, csr_data_width=8):
+        check_data_width(csr_data_width)
+
+        # registers
+        regs = csr.Builder(addr_width=3, data_width=csr_data_width)
+        self._complete = regs.add("complete", self.Complete())
+        self._setup    = regs.add("setup",    self.Setup())
+        self._bridge   = csr.Bridge(regs.as_memory_map())
+
+        # events
+        EventSource = Annotated[event.Source, "Indicates that one or more endpoints have completed a packet."]
+        self._any_complete = EventSource(trigger="rise", path=("complete",))
+        event_map = event.EventMap()
+        event_map.add(self._any_complete)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
+
+        # csr decoder
+        self._decoder = csr.Decoder(addr_width=4, data_width=csr_data_width)
+        self._decoder.add(self._bridge.bus)
+        self._decoder.add(self._events.bus, name="ev")
+
+        super().__init__({
+            "bus":            Out(self._decoder.bus.signature),
+            "irq":            Out(unsigned(1)),
+            "in_complete":    In(unsigned(16)),
+            "out_complete":   In(unsigned(16)),
+            "setup_complete": In(unsigned(1)),
+        })
+        self.bus.memory_map = self._decoder.bus.memory_map
+
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules += [self._bridge, self._events, self._decoder]
+
+        # connect bus
+        connect(m, flipped(self.bus), self._decoder.bus)
+
+        # Latch each completion into our bitmaps.
+        m.d.comb += [
+            self._complete.f.in_mask.set   .eq(self.in_complete),
+            self._complete.f.out_mask.set  .eq(self.out_complete),
+            self._setup.f.setup.set        .eq(self.setup_complete),
+        ]
+
+        # Raise our event whenever any endpoint completes a packet.
+        any_complete = (self.in_complete != 0) | (self.out_complete != 0) | self.setup_complete
+        m.d.comb += self._any_complete.i.eq(any_complete)
+
+        # connect events to irq line
+        m.d.comb += self.irq.eq(self._events.src.i)
+
+        return DomainRenamer({"sync": "usb"})(m)
@@ -17,7 +17,10 @@ from amaranth.lib.wiring            import In, Out, connect, flipped
 
 from amaranth_soc                   import csr, event
 
-from luna.gateware.usb.usb2.device  import USBDevice
+from luna.gateware.usb.usb2.device  import USBDevice as _USBDevice
+from luna.gateware.usb.usb2.packet  import USBHandshakeGenerator
+
+from ...csr                         import check_data_width
 
 
 class Peripheral(wiring.Component):
@@ -35,6 +38,12 @@ class Peripheral(wiring.Component):
 
     connect: Signal(), output
         High when the USBDevice should be allowed to connect to a host.
+    frame_number: Signal(11), input
+        The current USB frame number.
+    microframe_number: Signal(3), input
+        The current USB microframe number. Always 0 on non-HS connections.
+    sof_detected: Signal(), input
+        Pulses for one cycle each time a SOF is detected.
 
     """
 
@@ -60,28 +69,61 @@ class Peripheral(wiring.Component):
         speed : csr.Field(csr.action.R,       unsigned(2))
         _0    : csr.Field(csr.action.ResRAW0, unsigned(6))
 
-    def __init__(self):
+    class Frame(csr.Register, access="r"):
+        """Frame register
+
+            number:     The frame number carried by the most recent SOF packet.
+            microframe: The number of the current microframe within that frame. Always 0 unless
+                        the device is operating at high speed.
+        """
+        number     : csr.Field(csr.action.R,       unsigned(11))
+        microframe : csr.Field(csr.action.R,       unsigned(3))
+        _0         : csr.Field(csr.action.ResRAW0, unsigned(2))
+
+    class Timestamp(csr.Register, access="r"):
+        """Timestamp register
+
+            count: The value of a free-running counter, which increments on every clock cycle, latched
+                   when the most recent SOF packet was received.
+            now:   The current value of that counter. Both fields are captured together when the
+                   register is read; so ``now - count`` is the time elapsed since that SOF.
+        """
+        count : csr.Field(csr.action.R, unsigned(32))
+        now   : csr.Field(csr.action.R, unsigned(32))
+
+    def __init__(self, *, csr_data_width=8):
+        check_data_width(csr_data_width)
+
         # I/O ports  FIXME ambiguity - private or signature ?
         self.connect         = Signal(init=1)
         self.bus_reset       = Signal()
         self.low_speed_only  = Signal()
         self.full_speed_only = Signal()
 
+        self.frame_number      = Signal(11)
+        self.microframe_number = Signal(3)
+        self.sof_detected      = Signal()
+
         # registers
-        regs = csr.Builder(addr_width=3, data_width=8)
-        self._control = regs.add("control", self.Control())
-        self._status  = regs.add("status",  self.Status())
+        regs = csr.Builder(addr_width=4, data_width=csr_data_width)
+        self._control   = regs.add("control",   self.Control())
+        self._status    = regs.add("status",    self.Status())
+        self._frame     = regs.add("frame",     self.Frame())
+        self._timestamp = regs.add("timestamp", self.Timestamp())
         self._bridge = csr.Bridge(regs.as_memory_map())
 
         # events
         EventSource = Annotated[event.Source, "Interrupt that occurs when a USB bus reset is received."]
         self._reset = EventSource(trigger="rise", path=("reset",))
+        EventSource = Annotated[event.Source, "Interrupt that occurs when a start-of-frame packet is received."]
+        self._sof = EventSource(trigger="rise", path=("sof",))
         event_map = event.EventMap()
         event_map.add(self._reset)
-        self._events = csr.event.EventMonitor(event_map, data_width=8)
+        event_map.add(self._sof)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
 
         # csr decoder
-        self._decoder = csr.Decoder(addr_width=4, data_width=8)
+        self._decoder = csr.Decoder(addr_width=5, data_width=csr_data_width)
         self._decoder.add(self._bridge.bus)
         self._decoder.add(self._events.bus, name="ev")
 
@@ -92,7 +134,7 @@ class Peripheral(wiring.Component):
         self.bus.memory_map = self._decoder.bus.memory_map
 
 
-    def attach(self, device: USBDevice):
+    def attach(self, device: _USBDevice):
         """ Returns a list of statements necessary to connect this to a USB controller.
 
         The returned values makes all of the connections necessary to provide control and fetch status
@@ -109,7 +151,10 @@ class Peripheral(wiring.Component):
             device.low_speed_only        .eq(self.low_speed_only),
             device.full_speed_only       .eq(self.full_speed_only),
             self.bus_reset               .eq(device.reset_detected),
-            self._status.f.speed.r_data  .eq(device.speed)
+            self._status.f.speed.r_data  .eq(device.speed),
+            self.frame_number            .eq(device.frame_number),
+            self.microframe_number       .eq(device.microframe_number),
+            self.sof_detected            .eq(device.sof_detected),
         ]
 
 
@@ -131,7 +176,65 @@ class Peripheral(wiring.Component):
         # event: bus reset detected
         m.d.comb += self._reset.i.eq(self.bus_reset)
 
+        # Frame number registers.
+        m.d.comb += [
+            self._frame.f.number.r_data      .eq(self.frame_number),
+            self._frame.f.microframe.r_data  .eq(self.microframe_number),
+        ]
+
+        # Free-running timestamp, latched on each SOF.
+        timestamp = Signal.like(self._timestamp.f.count.r_data)
+        m.d.sync += timestamp.eq(timestamp + 1)
+        m.d.comb += self._timestamp.f.now.r_data.eq(timestamp)
+        with m.If(self.sof_detected):
+            m.d.sync += self._timestamp.f.count.r_data.eq(timestamp)
+
+        # event: start-of-frame received
+        m.d.comb += self._sof.i.eq(self.sof_detected)
+
         # connect events to irq line
         m.d.comb += self.irq.eq(self._events.src.i)
 
         return m
+
+
+class USBDevice(_USBDevice):
+    """ LUNA's :class:`USBDevice`, extended to issue NYET handshakes on behalf of its endpoints.
+
+    LUNA's endpoint multiplexer and handshake generator only carry ACK, NAK and STALL handshakes. We
+    combine our endpoints' ``handshakes_out.nyet`` strobes ourselves; and issue NYETs from a second
+    handshake generator, which shares the device's transmit multiplexer with its other transmitters.
+    Otherwise, this behaves exactly as LUNA's :class:`USBDevice`.
+    """
+
+    def elaborate(self, platform):
+        m = super().elaborate(platform)
+
+        # Our endpoints never issue a NYET alongside any other handshake; so only one of our
+        # generators will ever transmit at once.
+        m.submodules.nyet_generator = nyet_generator = _NYETGenerator()
+        m.submodules.tx_multiplexer.add_input(nyet_generator.tx)
+
+        for endpoint in self._endpoints:
+            with m.If(endpoint.interface.handshakes_out.nyet):
+                m.d.comb += nyet_generator.issue_nyet.eq(1)
+
+        return m
+
+
+class _NYETGenerator(USBHandshakeGenerator):
+    """ Handshake generator that issues NYETs, in place of ACKs.
+
+    Attributes
+    ----------
+
+    issue_nyet: Signal(), input
+        Pulsed to generate a NYET handshake packet. An alias of ``issue_ack``.
+    """
+
+    # Full contents of a NYET packet; including its check bits.
+    _PACKET_ACK = 0b10010110
+
+    def __init__(self):
+        super().__init__()
+        self.issue_nyet = self.issue_ack
@@ -0,0 +1,433 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Wishbone bus-master DMA engine for our `eptri`-equivalent endpoints.
+
+Moves whole packets between system memory and the ``ep_in`` and ``ep_out`` FIFOs,
+so the CPU doesn't need to copy packet data through the endpoint registers.
+"""
+
+from typing                           import Annotated
+
+from amaranth                         import *
+from amaranth.hdl.xfrm                import DomainRenamer
+from amaranth.lib                     import wiring
+from amaranth.lib.cdc                 import FFSynchronizer
+from amaranth.lib.wiring              import In, Out, connect, flipped
+
+from amaranth_soc                     import csr, event, wishbone
+
+from ...csr                           import check_data_width
+from .                                import ep_in, ep_out
+
+
+class Peripheral(wiring.Component):
+    """ DMA engine for our `eptri`-equivalent interface.
+
+    Each transfer is described by a RAM address, a length and an endpoint number, and moves a
+    single packet:
+
+    - IN transfers read ``length`` bytes from RAM, load them into the IN endpoint, and then
+      mark the packet as ready to transmit on the given endpoint. ``length`` should not exceed
+      the IN endpoint's maximum packet size.
+    - OUT transfers wait for a packet to be received by the OUT endpoint, and then write it into
+      RAM; writing no more than ``length`` bytes. Any remaining bytes of the packet are discarded.
+
+    The ``done`` event is raised once a transfer has finished. The endpoints' own ``done`` events
+    continue to be raised as packets are transmitted and received.
+
+    Like our endpoints, this peripheral operates in the ``usb`` domain. Its Wishbone initiator can be
+    placed in another domain, such as that of the SoC bus it shares with the CPU; in which case each of
+    its bus cycles is carried across by an asynchronous bridge.
+
+    Attributes
+    ----------
+
+    wb_bus: wishbone.Interface
+        Wishbone initiator used to access system memory.
+    ep_in: ep_in.DMASignature
+        Port used to load packets into an ``ep_in.Peripheral``.
+    ep_out: ep_out.DMASignature
+        Port used to unload packets from an ``ep_out.Peripheral``.
+    """
+
+    class Address(csr.Register, access="rw"):
+        """ Address register
+
+            address: The byte address of the RAM buffer used by the next transfer. Must be word-aligned.
+        """
+        address : csr.Field(csr.action.RW, unsigned(32))
+
+    class Length(csr.Register, access="rw"):
+        """ Length register
+
+            count: For IN transfers, the number of bytes to be transmitted. For OUT transfers,
+                   the size of the RAM buffer, in bytes.
+        """
+        count : csr.Field(csr.action.RW, unsigned(16))
+
+    class Transfer(csr.Register, access="w"):
+        """ Transfer register
+
+            epno:      The endpoint number used for the transfer. Only used for IN transfers; OUT transfers
+                       accept the next packet received on any endpoint.
+            direction: `1` for an IN transfer, from RAM to the IN endpoint; or `0` for an OUT transfer,
+                       from the OUT endpoint to RAM.
+
+            Writing to this register starts a transfer, and should only be done while the engine is idle.
+        """
+        epno      : csr.Field(csr.action.W,       unsigned(4))
+        direction : csr.Field(csr.action.W,       unsigned(1))
+        _0        : csr.Field(csr.action.ResRAW0, unsigned(3))
+
+    class Status(csr.Register, access="r"):
+        """ Status register
+
+            busy:  This value is `1` while a transfer is in progress.
+            error: This value is `1` if the most recent transfer was abandoned due to a bus error.
+            epno:  Contains the endpoint number of the most recent transfer.
+            count: Contains the number of bytes moved by the most recent transfer. For OUT transfers,
+                   this is the length of the received packet; which may exceed the length of the buffer.
+        """
+        busy  : csr.Field(csr.action.R,       unsigned(1))
+        error : csr.Field(csr.action.R,       unsigned(1))
+        _0    : csr.Field(csr.action.ResRAW0, unsigned(2))
+        epno  : csr.Field(csr.action.R,       unsigned(4))
+        _1    : csr.Field(csr.action.ResRAW0, unsigned(8))
+        count : csr.Field(csr.action.R,       unsigned(16))
+
+
+    def __init__(self, *, wb_domain="usb", csr_data_width=8):
+        """
+        Parameters
+        ----------
+            wb_domain: str, optional
+                The clock domain of our Wishbone initiator. Defaults to the ``usb`` domain.
+            csr_data_width: int, optional
+                The data width of our CSR bus; one of 8, 16 or 32. Wider buses let registers wider
+                than a byte be accessed in fewer bus cycles.
+        """
+        check_data_width(csr_data_width)
+
+        self._wb_domain = wb_domain
+
+        # registers
+        regs = csr.Builder(addr_width=4, data_width=csr_data_width)
+        self._address  = regs.add("address",  self.Address())
+        self._length   = regs.add("length",   self.Length())
+        self._transfer = regs.add("transfer", self.Transfer())
+        self._status   = regs.add("status",   self.Status())
+        self._bridge   = csr.Bridge(regs.as_memory_map())
+
+        # events
+        EventSource = Annotated[event.Source, "Indicates that a DMA transfer has finished."]
+        self._done = EventSource(trigger="rise", path=("done",))
+        event_map = event.EventMap()
+        event_map.add(self._done)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
+
+        # csr decoder
+        self._decoder = csr.Decoder(addr_width=5, data_width=csr_data_width)
+        self._decoder.add(self._bridge.bus)
+        self._decoder.add(self._events.bus, name="ev")
+
+        super().__init__({
+            "bus":    Out(self._decoder.bus.signature),
+            "irq":    Out(unsigned(1)),
+            "wb_bus": Out(wishbone.Signature(
+                addr_width=30,
+                data_width=32,
+                granularity=8,
+                features=("err", "cti", "bte")
+            )),
+            "ep_in":  Out(ep_in.DMASignature()),
+            "ep_out": Out(ep_out.DMASignature()),
+        })
+        self.bus.memory_map = self._decoder.bus.memory_map
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules += [self._bridge, self._events, self._decoder]
+
+        # connect bus
+        connect(m, flipped(self.bus), self._decoder.bus)
+
+        # Shortcuts to our components. If our Wishbone initiator is in another domain, our engine
+        # issues its cycles to an asynchronous bridge; which reissues them in that domain.
+        if self._wb_domain == "usb":
+            wb_bus = self.wb_bus
+        else:
+            wb_bridge = _AsyncBridge(self.wb_bus.signature, i_domain="usb", t_domain=self._wb_domain)
+            wb_bus    = wb_bridge.i_bus
+        in_port   = self.ep_in
+        out_port  = self.ep_out
+
+        # Keep track of the current word address, and the number of bytes left to move.
+        address         = Signal.like(wb_bus.adr)
+        bytes_remaining = Signal.like(self._length.f.count.data)
+
+        # Number of bytes of the current word that are part of the transfer; and the byte lanes holding them.
+        word_count = Mux(bytes_remaining >= 4, 4, bytes_remaining)
+        word_sel   = Mux(bytes_remaining >= 4, 0b1111, (1 << bytes_remaining[:2]) - 1)
+
+        # When unloading an OUT packet, keep track of how many of its words are left in the FIFO.
+        words_remaining = Signal(range(0, (2 ** len(out_port.length) + 3) // 4 + 1))
+
+        # We only issue single classic cycles.
+        m.d.comb += [
+            wb_bus.adr  .eq(address),
+            wb_bus.cti  .eq(wishbone.CycleType.CLASSIC),
+        ]
+
+        # Signals that indicate that our transfer has finished; or was abandoned due to a bus error.
+        done  = Signal()
+        error = Signal()
+
+        with m.FSM(domain="sync") as f:
+            m.d.comb += self._status.f.busy.r_data.eq(~f.ongoing("IDLE"))
+
+            # IDLE -- wait for a transfer to be started.
+            with m.State("IDLE"):
+                with m.If(self._transfer.f.epno.w_stb):
+                    m.d.sync += [
+                        address                        .eq(self._address.f.address.data[2:]),
+                        bytes_remaining                .eq(self._length.f.count.data),
+                        self._status.f.error.r_data    .eq(0),
+                    ]
+
+                    with m.If(self._transfer.f.direction.w_data):
+                        m.d.sync += [
+                            self._status.f.epno.r_data   .eq(self._transfer.f.epno.w_data),
+                            self._status.f.count.r_data  .eq(self._length.f.count.data),
+                        ]
+                        m.next = "IN_WAIT"
+                    with m.Else():
+                        m.next = "OUT_WAIT"
+
+            # IN_WAIT -- wait for the IN endpoint to have room for our packet, and for the CPU to finish
+            # loading any packet it's already started.
+            with m.State("IN_WAIT"):
+                m.d.comb += in_port.active.eq(1)
+                with m.If(in_port.ready):
+                    m.next = "IN_READ"
+
+            # IN_READ -- read our packet from memory, one word at a time, and load it into the IN endpoint.
+            with m.State("IN_READ"):
+                m.d.comb += in_port.active.eq(1)
+                with m.If(bytes_remaining == 0):
+                    m.next = "IN_COMMIT"
+
+                with m.Else():
+                    m.d.comb += [
+                        wb_bus.cyc  .eq(1),
+                        wb_bus.stb  .eq(1),
+                        wb_bus.sel  .eq(word_sel),
+                    ]
+
+                    with m.If(wb_bus.ack):
+                        m.d.comb += [
+                            in_port.data   .eq(wb_bus.dat_r),
+                            in_port.count  .eq(word_count),
+                        ]
+                        m.d.sync += [
+                            address          .eq(address + 1),
+                            bytes_remaining  .eq(bytes_remaining - word_count),
+                        ]
+
+                    # If we encounter a bus error, abandon our transfer. Any data already loaded into
+                    # the IN endpoint will need to be cleared by resetting its FIFO.
+                    with m.Elif(wb_bus.err):
+                        m.d.comb += [
+                            error  .eq(1),
+                            done   .eq(1),
+                        ]
+                        m.next = "IDLE"
+
+            # IN_COMMIT -- mark our packet as ready to transmit, once the IN endpoint can queue it.
+            with m.State("IN_COMMIT"):
+                m.d.comb += [
+                    in_port.active    .eq(1),
+                    in_port.endpoint  .eq(self._status.f.epno.r_data),
+                ]
+                with m.If(in_port.ready):
+                    m.d.comb += [
+                        in_port.commit  .eq(1),
+                        done            .eq(1),
+                    ]
+                    m.next = "IDLE"
+
+            # OUT_WAIT -- wait for the OUT endpoint to receive a packet.
+            with m.State("OUT_WAIT"):
+                with m.If(out_port.valid):
+                    m.d.sync += [
+                        words_remaining              .eq((out_port.length + 3) >> 2),
+                        bytes_remaining              .eq(Mux(out_port.length < bytes_remaining, out_port.length, bytes_remaining)),
+                        self._status.f.epno.r_data   .eq(out_port.endpoint),
+                        self._status.f.count.r_data  .eq(out_port.length),
+                    ]
+                    m.next = "OUT_WRITE"
+
+            # OUT_WRITE -- write our packet into memory, one word at a time, discarding anything that
+            # doesn't fit in our buffer.
+            with m.State("OUT_WRITE"):
+                with m.If(words_remaining == 0):
+                    m.d.comb += [
+                        out_port.release  .eq(1),
+                        done            .eq(1),
+                    ]
+                    m.next = "IDLE"
+
+                with m.Elif(bytes_remaining == 0):
+                    m.d.comb += out_port.next.eq(1)
+                    m.d.sync += words_remaining.eq(words_remaining - 1)
+
+                with m.Else():
+                    m.d.comb += [
+                        wb_bus.cyc    .eq(1),
+                        wb_bus.stb    .eq(1),
+                        wb_bus.we     .eq(1),
+                        wb_bus.sel    .eq(word_sel),
+                        wb_bus.dat_w  .eq(out_port.data),
+                    ]
+
+                    with m.If(wb_bus.ack):
+                        m.d.comb += out_port.next.eq(1)
+                        m.d.sync += [
+                            address          .eq(address + 1),
+                            bytes_remaining  .eq(bytes_remaining - word_count),
+                            words_remaining  .eq(words_remaining - 1),
+                        ]
+
+                    # If we encounter a bus error, stop writing to memory, but still drain the
+                    # rest of our packet, so the OUT endpoint's queue remains consistent.
+                    with m.Elif(wb_bus.err):
+                        m.d.comb += error.eq(1)
+                        m.d.sync += bytes_remaining.eq(0)
+
+        # Latch any bus errors.
+        with m.If(error):
+            m.d.sync += self._status.f.error.r_data.eq(1)
+
+        # connect events to irq line
+        m.d.comb += [
+            self._done.i  .eq(done),
+            self.irq      .eq(self._events.src.i),
+        ]
+
+        engine = DomainRenamer({"sync": "usb"})(m)
+        if self._wb_domain == "usb":
+            return engine
+
+        # Our bridge is added outside of our renamed engine, as its target side may be in ``sync``.
+        top = Module()
+        top.submodules.engine    = engine
+        top.submodules.wb_bridge = wb_bridge
+        connect(top, wb_bridge.t_bus, flipped(self.wb_bus))
+        return top
+
+
+class _AsyncBridge(wiring.Component):
+    """ Carries classic Wishbone cycles from one clock domain to another.
+
+    Each cycle is latched from our initiator and handed across by toggling a request flag; once our
+    target has completed it, its result is handed back by toggling a response flag. Both flags are
+    synchronized into the domain that observes them; while the latched values are held steady until
+    they've been observed. Only a single cycle is in flight at any time; and our initiator must hold
+    each cycle until it's acknowledged.
+
+    Attributes
+    ----------
+
+    i_bus: wishbone.Interface
+        Wishbone target, in ``i_domain``, that accepts cycles from our initiator.
+    t_bus: wishbone.Interface
+        Wishbone initiator, in ``t_domain``, that reissues those cycles to our target.
+    """
+
+    def __init__(self, signature, *, i_domain, t_domain):
+        self._i_domain = i_domain
+        self._t_domain = t_domain
+        super().__init__({
+            "i_bus": In(signature),
+            "t_bus": Out(signature),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        i_bus = self.i_bus
+        t_bus = self.t_bus
+
+        # The cycle in flight, as latched from our initiator; and its result, as latched from our target.
+        adr   = Signal.like(i_bus.adr)
+        dat_w = Signal.like(i_bus.dat_w)
+        sel   = Signal.like(i_bus.sel)
+        we    = Signal()
+        dat_r = Signal.like(t_bus.dat_r)
+        err   = Signal()
+
+        # Our handshake flags; each is toggled in one domain, and observed in the other.
+        request       = Signal()
+        request_sync  = Signal()
+        request_seen  = Signal()
+        response      = Signal()
+        response_sync = Signal()
+        response_seen = Signal()
+        m.submodules.request_sync  = FFSynchronizer(request,  request_sync,  o_domain=self._t_domain)
+        m.submodules.response_sync = FFSynchronizer(response, response_sync, o_domain=self._i_domain)
+
+        # Initiator side: latch each new cycle and hand it across; then wait for its result.
+        busy = Signal()
+        with m.If(~busy):
+            with m.If(i_bus.cyc & i_bus.stb):
+                m.d[self._i_domain] += [
+                    adr      .eq(i_bus.adr),
+                    dat_w    .eq(i_bus.dat_w),
+                    sel      .eq(i_bus.sel),
+                    we       .eq(i_bus.we),
+                    request  .eq(~request),
+                    busy     .eq(1),
+                ]
+        with m.Elif(response_sync != response_seen):
+            m.d[self._i_domain] += [
+                response_seen  .eq(response_sync),
+                busy           .eq(0),
+            ]
+            m.d.comb += [
+                i_bus.ack  .eq(~err),
+                i_bus.err  .eq(err),
+            ]
+        m.d.comb += i_bus.dat_r.eq(dat_r)
+
+        # Target side: issue each cycle handed across; then hand back its result.
+        pending = Signal()
+        m.d.comb += [
+            t_bus.adr    .eq(adr),
+            t_bus.dat_w  .eq(dat_w),
+            t_bus.sel    .eq(sel),
+            t_bus.we     .eq(we),
+            t_bus.cti    .eq(wishbone.CycleType.CLASSIC),
+        ]
+        with m.If(~pending):
+            with m.If(request_sync != request_seen):
+                m.d[self._t_domain] += [
+                    request_seen  .eq(request_sync),
+                    pending       .eq(1),
+                ]
+        with m.Else():
+            m.d.comb += [
+                t_bus.cyc  .eq(1),
+                t_bus.stb  .eq(1),
+            ]
+            with m.If(t_bus.ack | t_bus.err):
+                m.d[self._t_domain] += [
+                    dat_r     .eq(t_bus.dat_r),
+                    err       .eq(t_bus.err),
+                    response  .eq(~response),
+                    pending   .eq(0),
+                ]
+
+        return m
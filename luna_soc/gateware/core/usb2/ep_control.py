@@ -23,6 +23,8 @@ from amaranth_soc                     import csr, event
 
 from luna.gateware.usb.usb2.endpoint  import EndpointInterface
 
+from ...csr                           import check_data_width
+
 
 class Peripheral(wiring.Component):
     """ Setup component of our `eptri`-equivalent interface.
@@ -33,11 +35,21 @@ class Peripheral(wiring.Component):
     and does not allow for any flow control; as a USB device must always be ready to accept
     control packets. [USB2.0: 8.6.1]
 
+    The most recent SETUP packet can also be read in place, from the SETUP_LOW and SETUP_HIGH
+    registers. Each new SETUP packet increments the SEQUENCE register; so firmware that reads
+    both halves of a packet, followed by the sequence count, can detect whether another SETUP
+    packet arrived while it was reading.
+
     Attributes
     ----------
 
     interface: EndpointInterface
         Our primary interface to the core USB device hardware.
+    ep0_handled: Signal(), input
+        High while the current control request is being handled in gateware, by a ``responder.Peripheral``;
+        in which case its SETUP packet is still acknowledged, but isn't reported to the CPU.
+    complete: Signal(), output
+        Strobes whenever a new SETUP packet is ready to be read; for use with a ``completion.Peripheral``.
     """
 
     class Control(csr.Register, access="w"):
@@ -78,17 +90,61 @@ class Peripheral(wiring.Component):
         """
         byte : csr.Field(csr.action.R, unsigned(8))
 
+    class Sequence(csr.Register, access="r"):
+        """ Sequence register
+
+            count: Incremented each time a new SETUP packet is latched into the SETUP_LOW and SETUP_HIGH
+                   registers. Wraps around after 255.
+
+            Firmware should keep the last count it handled. To fetch a SETUP packet, it reads this
+            register; if the count matches the last one handled, no new packet has arrived. Otherwise,
+            it reads SETUP_LOW and SETUP_HIGH, then reads this register again: if the count has changed,
+            a newer packet overwrote the one being read, and the fetch should be retried. If not, the
+            packet is consistent, and its count becomes the last one handled. Only compare counts for
+            equality, as they wrap around.
+        """
+        count : csr.Field(csr.action.R, unsigned(8))
+
+    class SetupLow(csr.Register, access="r"):
+        """ Setup low register
+
+            Holds the first four bytes of the most recently captured SETUP packet.
+
+            request_type: The packet's bmRequestType field.
+            request:      The packet's bRequest field.
+            value:        The packet's wValue field.
+        """
+        request_type : csr.Field(csr.action.R, unsigned(8))
+        request      : csr.Field(csr.action.R, unsigned(8))
+        value        : csr.Field(csr.action.R, unsigned(16))
+
+    class SetupHigh(csr.Register, access="r"):
+        """ Setup high register
+
+            Holds the last four bytes of the most recently captured SETUP packet.
+
+            index:  The packet's wIndex field.
+            length: The packet's wLength field.
+        """
+        index  : csr.Field(csr.action.R, unsigned(16))
+        length : csr.Field(csr.action.R, unsigned(16))
+
+
+    def __init__(self, *, csr_data_width=8):
+        check_data_width(csr_data_width)
 
-    def __init__(self):
         # I/O port  FIXME ambiguity - private or signature ?
         self.interface = EndpointInterface()
 
         # registers
-        regs = csr.Builder(addr_width=4, data_width=8)
+        regs = csr.Builder(addr_width=4, data_width=csr_data_width)
         self._control = regs.add("control", self.Control())
         self._status  = regs.add("status",  self.Status())
         self._reset   = regs.add("reset",   self.Reset())
         self._data    = regs.add("data",    self.Data())
+        self._seq     = regs.add("sequence",   self.Sequence())
+        self._low     = regs.add("setup_low",  self.SetupLow())
+        self._high    = regs.add("setup_high", self.SetupHigh())
         self._bridge = csr.Bridge(regs.as_memory_map())
 
         # events
@@ -97,16 +153,18 @@ class Peripheral(wiring.Component):
         self._setup_received = EventSource(trigger="rise", path=("setup_received",))
         event_map = event.EventMap()
         event_map.add(self._setup_received)
-        self._events = csr.event.EventMonitor(event_map, data_width=8)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
 
         # csr decoder
-        self._decoder = csr.Decoder(addr_width=5, data_width=8)
+        self._decoder = csr.Decoder(addr_width=5, data_width=csr_data_width)
         self._decoder.add(self._bridge.bus)
         self._decoder.add(self._events.bus, name="ev")
 
         super().__init__({
             "bus":    Out(self._decoder.bus.signature),
             "irq":    Out(unsigned(1)),
+            "ep0_handled": In(unsigned(1)),
+            "complete":    Out(unsigned(1)),
         })
         self.bus.memory_map = self._decoder.bus.memory_map
 
@@ -153,10 +211,34 @@ class Peripheral(wiring.Component):
             handshakes_out.ack          .eq(token.is_setup & interface.rx_ready_for_response),
 
             # Trigger a SETUP event as we ACK the setup packet, since that's also the point
-            # where we know we're done receiving data.
-            self._setup_received.i      .eq(handshakes_out.ack)
+            # where we know we're done receiving data; unless the request is being handled in gateware.
+            self._setup_received.i      .eq(handshakes_out.ack & ~self.ep0_handled),
+            self.complete               .eq(self._setup_received.i),
         ]
 
+        #
+        # SETUP window.
+        #
+
+        # Gather the bytes of each SETUP packet as they arrive...
+        packet     = Signal(64)
+        byte_count = Signal(range(0, 9))
+        with m.If(new_setup):
+            m.d.usb += byte_count.eq(0)
+        with m.Elif(fifo.w_en & (byte_count != 8)):
+            m.d.usb += [
+                packet.word_select(byte_count[:3], 8)  .eq(rx.payload),
+                byte_count                             .eq(byte_count + 1),
+            ]
+
+        # ... and latch the complete packet into our window as we report it to the CPU.
+        with m.If(self._setup_received.i):
+            m.d.usb += [
+                Cat(self._low.f.request_type.r_data, self._low.f.request.r_data, self._low.f.value.r_data,
+                    self._high.f.index.r_data, self._high.f.length.r_data)  .eq(packet),
+                self._seq.f.count.r_data                                    .eq(self._seq.f.count.r_data + 1),
+            ]
+
         # control registers
         with m.If(self._control.f.address.w_stb):
             m.d.comb += [
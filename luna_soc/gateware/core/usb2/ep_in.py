@@ -16,27 +16,87 @@ from typing                           import Annotated
 from amaranth                         import *
 from amaranth.hdl.xfrm                import ResetInserter, DomainRenamer
 from amaranth.lib                     import wiring
-from amaranth.lib.fifo                import SyncFIFOBuffered
+from amaranth.lib.fifo                import SyncFIFO, SyncFIFOBuffered
 from amaranth.lib.wiring              import In, Out, connect, flipped
 
 from amaranth_soc                     import csr, event
 
 from luna.gateware.usb.usb2.endpoint  import EndpointInterface
 
+from ...csr                           import check_data_width
+from .coalesce                        import EventCoalescer
+
+
+class DMASignature(wiring.Signature):
+    """ Signature of the port used by a DMA engine to load packets into an IN endpoint.
+
+    Members
+    -------
+
+    data: Out(32)
+        Up to four bytes of packet data, least-significant byte first.
+    count: Out(range(5))
+        The number of bytes of ``data`` to be added to the packet; or zero if no data is being written.
+    endpoint: Out(4)
+        The endpoint the packet is to be transmitted on.
+    commit: Out(1)
+        Strobe that marks the packet as ready to transmit.
+    active: Out(1)
+        High from the time the DMA engine starts waiting to load a packet until it commits it. While
+        it's high, the endpoint ignores register writes that would start a new packet or transfer.
+    ready: In(1)
+        High when the endpoint has room for another packet. Before a packet is started, also requires
+        that no packet or transfer is part-way through being loaded via the endpoint's registers.
+    """
+    def __init__(self):
+        super().__init__({
+            "data":      Out(32),
+            "count":     Out(range(5)),
+            "endpoint":  Out(4),
+            "commit":    Out(1),
+            "active":    Out(1),
+            "ready":     In(1),
+        })
+
 
 class Peripheral(wiring.Component):
     """ IN component of our `eptri`-equivalent interface.
 
     Implements the FIFO that handles `eptri` IN requests. This FIFO collects USB data, and
-    transmits it in response to an IN token. Like all `eptri` interfaces; it can handle only one
-    pending packet at a time.
+    transmits it in response to an IN token. By default, and like all `eptri` interfaces; it can
+    handle only one pending packet at a time. If a ``queue_depth`` greater than one is provided,
+    several packets can be queued for transmission, allowing the CPU to load the next packet while
+    the current one is awaiting an IN token.
+
+    Endpoints listed in ``dedicated_endpoints`` are each given a FIFO of their own, so that a packet
+    queued for one endpoint never blocks transmission on another. The PENDING register reports which
+    endpoints currently have packets queued.
 
+    Endpoints can be made isochronous via the ISOCHRONOUS register; in which case they're never NAK'd
+    or STALL'd, and a zero-length packet is sent whenever an IN token arrives with no packet queued.
+    High-bandwidth endpoints may send up to three packets per microframe, each with the DATA PID
+    required by [USB2.0: 5.9.2]. To stream a high-bandwidth endpoint, use a ``max_packet_size`` of 1024
+    and a ``queue_depth`` of at least 3; or 6, to allow the next microframe's packets to be loaded while
+    the current ones are sent.
+
+    Rather than keeping an endpoint primed, firmware can watch it for NAKs via the NOTIFY register; a
+    ``nak`` event is then raised when the host first polls the endpoint with nothing queued.
 
     Attributes
     ----------
 
     interface: EndpointInterface
         Our primary interface to the core USB device hardware.
+    dma: DMASignature
+        Port that allows a DMA engine to load packets without CPU intervention; see ``usb2.dma``.
+        Whichever of the DMA engine and the CPU starts loading a packet first finishes it before the
+        other may start another; while the DMA engine is active, any other register writes are ignored.
+    ep0_handled: Signal(), input
+        High while the current control request is being handled in gateware, by a ``responder.Peripheral``;
+        in which case we'll ignore any tokens for endpoint zero.
+    complete: Signal(16), output
+        Strobes the bit corresponding to an endpoint whenever that endpoint finishes sending a packet that
+        raises our DONE event; for use with a ``completion.Peripheral``.
 
     """
 
@@ -47,7 +107,8 @@ class Peripheral(wiring.Component):
                     marks the relevant packet as ready to transmit; and thus should only be written after a
                     full packet has been written into the FIFO. If no data has been placed into the DATA FIFO,
                     a zero-length packet is generated.
-                    Note that any IN requests that do not match the endpoint number are automatically NAK'd.
+                    Note that any IN requests that do not match the endpoint number of the packet at the head
+                    of the queue are automatically NAK'd.
         """
         number : csr.Field(csr.action.W,       unsigned(4))
         _0     : csr.Field(csr.action.ResRAW0, unsigned(4))
@@ -73,25 +134,34 @@ class Peripheral(wiring.Component):
     class Status(csr.Register, access="r"):
         """ Status register
 
-            nak:  Contains a bitmask of endpoints that have responded with a NAK since the
-                  last read of this register.
+            nak:  Contains a bitmask of endpoints that have responded with a NAK since a packet
+                  was last queued for them.
             epno: Contains the endpoint being transmitted on.
             idle: This value is `1` if no packet is actively being transmitted.
             have: This value is `1` if data is present in the transmit FIFO.
             pid:  Contains the current PID toggle bit for the given endpoint.
+            full: This value is `1` if the packet queue is full; in which case no further data should be
+                  written until a `done` event indicates that a packet has been transmitted.
+            xfer: This value is `1` while a transfer started via the `transfer` register is being loaded.
+            discard: This value is `1` if any writes to the `data`, `data_wide`, `endpoint` or `transfer`
+                     registers have been discarded since the FIFO was last reset; e.g. because they were
+                     made while the DMA engine was loading a packet, or their data didn't fit.
         """
-        nak  : csr.Field(csr.action.R,        unsigned(16))
-        epno : csr.Field(csr.action.R,        unsigned(4))
-        _0   : csr.Field(csr.action.ResRAW0,  unsigned(4))
-        idle : csr.Field(csr.action.R,        unsigned(1))
-        have : csr.Field(csr.action.R,        unsigned(1))
-        pid  : csr.Field(csr.action.R,        unsigned(1))
-        _1   : csr.Field(csr.action.ResRAW0,  unsigned(5))
+        nak     : csr.Field(csr.action.R,       unsigned(16))
+        epno    : csr.Field(csr.action.R,       unsigned(4))
+        _0      : csr.Field(csr.action.ResRAW0, unsigned(4))
+        idle    : csr.Field(csr.action.R,       unsigned(1))
+        have    : csr.Field(csr.action.R,       unsigned(1))
+        pid     : csr.Field(csr.action.R,       unsigned(1))
+        full    : csr.Field(csr.action.R,       unsigned(1))
+        xfer    : csr.Field(csr.action.R,       unsigned(1))
+        discard : csr.Field(csr.action.R,       unsigned(1))
+        _1      : csr.Field(csr.action.ResRAW0, unsigned(2))
 
     class Reset(csr.Register, access="w"):
         """ Reset register
 
-            fifo: A write to this field Clears the FIFO without transmitting.
+            fifo: A write to this field Clears the FIFO and packet queue without transmitting.
         """
         fifo : csr.Field(csr.action.W,       unsigned(1))
         _1   : csr.Field(csr.action.ResRAW0, unsigned(7))
@@ -100,51 +170,158 @@ class Peripheral(wiring.Component):
         """ Data register
 
             Each write enqueues a byte to be transmitted; gradually building a single packet to
-            be transmitted. This queue should only ever contain a single packet; it is the software's
-            responsibility to handle breaking requests down into packets.
+            be transmitted. Each packet is completed by a write to the `endpoint` register; it is the
+            software's responsibility to handle breaking requests down into packets.
         """
         byte : csr.Field(csr.action.W, unsigned(8)) # desc="" ?
 
+    class DataWide(csr.Register, access="w"):
+        """ Wide data register
+
+            Each write enqueues four bytes to be transmitted, least-significant byte first. This allows
+            a packet to be loaded with a single 32-bit store per four bytes; writes to this register may
+            be freely interleaved with writes to the byte-wide `data` register, which can be used to
+            load the final one to three bytes of a packet.
+        """
+        word : csr.Field(csr.action.W, unsigned(32))
+
+    class Pending(csr.Register, access="r"):
+        """ Pending register
+
+            mask: Contains a bitmask of endpoints that have at least one packet queued for transmission.
+        """
+        mask : csr.Field(csr.action.R, unsigned(16))
+
+    class Transfer(csr.Register, access="w"):
+        """ Transfer register
+
+            Writing to this register starts a transfer of `length` bytes on endpoint `epno`. The transfer's
+            data is then written via the `data` and `data_wide` registers, as usual; and is automatically
+            split into packets of up to our maximum packet size, each of which is queued for transmission
+            as soon as it's complete. Writes beyond the end of the transfer are discarded; as are writes made
+            while the packet queue is full, so the `full` field of the `status` register should be checked
+            before writing each packet's data, and its `discard` field once the transfer has been written.
+            A `done` event is raised only once the final packet of the transfer has been transmitted.
+
+            length: The total number of bytes in the transfer. A transfer of zero bytes is sent as a single
+                    zero-length packet.
+            epno:   The endpoint the transfer is to be transmitted on.
+            zlp:    If `1`, a zero-length packet is appended to the transfer whenever its final packet is
+                    a full, maximum-size packet.
+        """
+        length : csr.Field(csr.action.W,       unsigned(16))
+        epno   : csr.Field(csr.action.W,       unsigned(4))
+        zlp    : csr.Field(csr.action.W,       unsigned(1))
+        _0     : csr.Field(csr.action.ResRAW0, unsigned(11))
+
+    class Isochronous(csr.Register, access="w"):
+        """ Isochronous register
+
+            epno: The endpoint to be configured.
+            mult: The number of packets the endpoint may send in each (micro)frame, or `0` if the endpoint
+                  isn't isochronous. Values of `2` and `3` are only valid for high-bandwidth endpoints,
+                  which operate at high speed.
+        """
+        epno : csr.Field(csr.action.W,       unsigned(4))
+        mult : csr.Field(csr.action.W,       unsigned(2))
+        _0   : csr.Field(csr.action.ResRAW0, unsigned(2))
+
+    class Notify(csr.Register, access="rw"):
+        """ Notify register
+
+            nak: A bitmask of endpoints to be watched for NAKs. The `nak` event is raised whenever a watched
+                 endpoint first responds to an IN token with a NAK after a packet was last queued for it;
+                 so firmware can prime an endpoint only once the host asks for data.
+        """
+        nak : csr.Field(csr.action.RW, unsigned(16))
+
 
-    def __init__(self, max_packet_size=512):
+    def __init__(self, max_packet_size=512, queue_depth=1, dedicated_endpoints=(), excluded_endpoints=(),
+                 csr_data_width=8):
         """
         Parameters
         ----------
             max_packet_size: int, optional
                 Sets the maximum packet size that can be transmitted on this endpoint.
                 This should match the value provided in the relevant endpoint descriptor.
+            queue_depth: int, optional
+                Sets the number of packets that can be queued for transmission at once.
+                Defaults to a single packet.
+            dedicated_endpoints: iterable of int, optional
+                A set of endpoint numbers that should each be given their own FIFO. Packets queued for
+                these endpoints are primed and sent independently of packets for any other endpoint;
+                so e.g. an interrupt endpoint won't be NAK'd while a bulk endpoint awaits an IN token.
+                Packets for all other endpoints share a common FIFO.
+            excluded_endpoints: iterable of int, optional
+                A set of endpoint numbers whose IN tokens are handled by other gateware, such as a
+                ``serial.Peripheral``; and which we'll never respond to.
+            csr_data_width: int, optional
+                The data width of our CSR bus; one of 8, 16 or 32. Wider buses let registers wider
+                than a byte be accessed in fewer bus cycles.
         """
-
-        self._max_packet_size = max_packet_size
+        if not isinstance(queue_depth, int) or queue_depth < 1:
+            raise ValueError("Queue depth must be a positive integer, not {!r}"
+                             .format(queue_depth))
+        dedicated_endpoints = tuple(dedicated_endpoints)
+        for endpoint in dedicated_endpoints:
+            if not isinstance(endpoint, int) or endpoint not in range(16):
+                raise ValueError("Dedicated endpoints must be integers between 0 and 15, not {!r}"
+                                 .format(endpoint))
+        if len(set(dedicated_endpoints)) != len(dedicated_endpoints):
+            raise ValueError("Dedicated endpoints must be unique, not {!r}"
+                             .format(dedicated_endpoints))
+        excluded_endpoints = tuple(excluded_endpoints)
+        for endpoint in excluded_endpoints:
+            if not isinstance(endpoint, int) or endpoint not in range(16):
+                raise ValueError("Excluded endpoints must be integers between 0 and 15, not {!r}"
+                                 .format(endpoint))
+        check_data_width(csr_data_width)
+
+        self._max_packet_size     = max_packet_size
+        self._queue_depth         = queue_depth
+        self._dedicated_endpoints = dedicated_endpoints
+        self._excluded_endpoints  = excluded_endpoints
 
         # I/O port   FIXME ambiguity - private or signature ?
         self.interface = EndpointInterface()
 
         # registers
-        regs = csr.Builder(addr_width=4, data_width=8)
-        self._endpoint = regs.add("endpoint", self.Endpoint())
-        self._stall    = regs.add("stall",    self.Stall())
-        self._pid      = regs.add("pid",      self.Pid())
-        self._status   = regs.add("status",   self.Status())
-        self._reset    = regs.add("reset",    self.Reset())
-        self._data     = regs.add("data",     self.Data())
-        self._bridge   = csr.Bridge(regs.as_memory_map())
+        regs = csr.Builder(addr_width=5, data_width=csr_data_width)
+        self._endpoint  = regs.add("endpoint",  self.Endpoint())
+        self._stall     = regs.add("stall",     self.Stall())
+        self._pid       = regs.add("pid",       self.Pid())
+        self._status    = regs.add("status",    self.Status())
+        self._reset     = regs.add("reset",     self.Reset())
+        self._data      = regs.add("data",      self.Data())
+        self._pending   = regs.add("pending",   self.Pending())
+        self._data_wide = regs.add("data_wide", self.DataWide())
+        self._transfer  = regs.add("transfer",  self.Transfer())
+        self._coalesce  = regs.add("coalesce",  EventCoalescer.Coalesce())
+        self._iso       = regs.add("isochronous", self.Isochronous())
+        self._notify    = regs.add("notify",    self.Notify())
+        self._bridge    = csr.Bridge(regs.as_memory_map())
 
         # events
-        EventSource = Annotated[event.Source, "Indicates that the host has successfully transferred an ``IN`` packet, and that the FIFO is now empty."]
+        EventSource = Annotated[event.Source, "Indicates that the host has successfully transferred an ``IN`` packet, and that the packet has been removed from the queue. For transfers, only raised once the transfer's final packet has been sent."]
         self._done = EventSource(trigger="rise", path=("done",))
+        NakSource = Annotated[event.Source, "Indicates that an endpoint being watched via the ``notify`` register has responded to an ``IN`` token with a NAK."]
+        self._nak  = NakSource(trigger="rise", path=("nak",))
         event_map = event.EventMap()
         event_map.add(self._done)
-        self._events = csr.event.EventMonitor(event_map, data_width=8)
+        event_map.add(self._nak)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
 
         # csr decoder
-        self._decoder = csr.Decoder(addr_width=5, data_width=8)
+        self._decoder = csr.Decoder(addr_width=6, data_width=csr_data_width)
         self._decoder.add(self._bridge.bus)
         self._decoder.add(self._events.bus, name="ev")
 
         super().__init__({
             "bus":    Out(self._decoder.bus.signature),
             "irq":    Out(unsigned(1)),
+            "dma":    In(DMASignature()),
+            "ep0_handled": In(unsigned(1)),
+            "complete":    Out(unsigned(16)),
         })
         self.bus.memory_map = self._decoder.bus.memory_map
 
@@ -164,32 +341,254 @@ class Peripheral(wiring.Component):
         # Core FIFO.
         #
 
-        # Create our FIFO; and set it to be cleared whenever the user requests.
-        m.submodules.fifo = fifo = ResetInserter(self._reset.f.fifo.w_stb)(
-            SyncFIFOBuffered(width=8, depth=self._max_packet_size)
+        # Create our FIFO, which also queues up descriptors for each of the packets it holds;
+        # and set it to be cleared whenever the user requests.
+        m.submodules.queue = queue = ResetInserter(self._reset.f.fifo.w_stb)(
+            _PacketQueue(max_packet_size=self._max_packet_size, depth=self._queue_depth)
+        )
+
+        # Work out how many packets can be held in our FIFOs at once; including any packets held in
+        # per-endpoint FIFOs.
+        fifo_count  = 1 + (len(self._dedicated_endpoints) + 1 if self._dedicated_endpoints else 0)
+        max_packets = self._queue_depth * fifo_count
+
+        # Keep track of the amount of data in our FIFOs, and in the packet currently being written.
+        bytes_in_fifo   = Signal(range(0, self._max_packet_size * max_packets + 1))
+        bytes_in_packet = Signal(range(0, self._max_packet_size + 1))
+
+        # Keep track of any transfer being loaded, and of how many of its bytes are still to be written.
+        transfer_active    = Signal()
+        transfer_remaining = Signal.like(self._transfer.f.length.w_data)
+        transfer_endpoint  = Signal.like(self._transfer.f.epno.w_data)
+        transfer_zlp       = Signal()
+
+        # Our DMA port and our registers can't both load a packet at once. Once the DMA engine becomes
+        # active, our registers may only be used to finish off any packet or transfer they've already
+        # started; the DMA engine waits for that to happen before loading its own packet.
+        user_packet_open = Signal()
+        user_loading     = user_packet_open | transfer_active
+        user_allowed     = ~self.dma.active | user_loading
+
+        # Each write to one of our DATA registers provides either a single byte or a full word.
+        write_data  = Signal(32)
+        write_count = Signal(range(0, 5))
+        with m.If(self.dma.count != 0):
+            m.d.comb += [
+                write_data   .eq(self.dma.data),
+                write_count  .eq(self.dma.count),
+            ]
+        with m.Elif(self._data.f.byte.w_stb & user_allowed):
+            m.d.comb += [
+                write_data   .eq(self._data.f.byte.w_data),
+                write_count  .eq(1),
+            ]
+        with m.Elif(self._data_wide.f.word.w_stb & user_allowed):
+            m.d.comb += [
+                write_data   .eq(self._data_wide.f.word.w_data),
+                write_count  .eq(4),
+            ]
+
+        # Discard any data that wouldn't fit into a single packet, that's written while our
+        # packet queue is full, or that's beyond the end of the current transfer.
+        write_accepted = (
+            (write_count != 0) &
+            (bytes_in_packet + write_count <= self._max_packet_size) &
+            (~transfer_active | (write_count <= transfer_remaining)) &
+            queue.w_rdy
         )
 
+        # The size of the packet being written, and the number of bytes left in the current transfer,
+        # once any data accepted in this cycle has been added.
+        packet_length = Signal.like(bytes_in_packet)
+        transfer_left = Signal.like(transfer_remaining)
+        m.d.comb += [
+            packet_length  .eq(bytes_in_packet + Mux(write_accepted, write_count, 0)),
+            transfer_left  .eq(transfer_remaining - Mux(write_accepted, write_count, 0)),
+        ]
+        packet_full   = (packet_length == self._max_packet_size)
+        transfer_done = (transfer_left == 0)
+
+        # The packet being written is complete once the user writes to our endpoint register,
+        # once our DMA port commits it, or once it completes a packet of the current transfer.
+        packet_ready     = Signal()
+        packet_endpoint  = Signal(4)
+        packet_last      = Signal()
+        packet_committed = Signal()
+
+        # Bytes that don't yet make up a full word are held in a staging register, and are
+        # appended to our FIFO once the word is complete, or once the packet is marked ready.
+        staged_data  = Signal(24)
+        staged_count = Signal(range(0, 4))
+
+        # Combine any staged bytes with our newly-written data.
+        combined_data  = Signal(56)
+        combined_count = Signal(range(0, 8))
         m.d.comb += [
-            # Whenever the user DATA register is written to, add the relevant data to our FIFO.
-            fifo.w_en         .eq(self._data.f.byte.w_stb),
-            fifo.w_data       .eq(self._data.f.byte.w_data),
+            combined_data   .eq(staged_data | (write_data << (staged_count * 8))),
+            combined_count  .eq(staged_count + write_count),
         ]
 
-        # Keep track of the amount of data in our FIFO.
-        bytes_in_fifo = Signal(range(0, self._max_packet_size + 1))
+        with m.If(self._reset.f.fifo.w_stb):
+            m.d.usb += [
+                staged_count     .eq(0),
+                bytes_in_packet  .eq(0),
+            ]
+
+        with m.Elif(write_accepted):
+            m.d.usb += bytes_in_packet.eq(packet_length)
+
+            # If this write completes a packet of the current transfer, queue the packet right away; so
+            # that a write in the very next cycle can start the following packet, rather than being
+            # discarded. We can only do so if the packet's remaining data fits in a single word; which
+            # is always the case for full packets, if our maximum packet size is a multiple of four.
+            with m.If(transfer_active & packet_ready & (combined_count <= 4)):
+                m.d.comb += [
+                    queue.w_en        .eq(1),
+                    queue.w_data      .eq(combined_data[:32]),
+                    packet_committed  .eq(1),
+                ]
+
+            # If we have at least a full word, enqueue it, and keep any remainder staged.
+            with m.Elif(combined_count >= 4):
+                m.d.comb += [
+                    queue.w_en    .eq(1),
+                    queue.w_data  .eq(combined_data[:32]),
+                ]
+                m.d.usb += [
+                    staged_data   .eq(combined_data[32:]),
+                    staged_count  .eq(combined_count - 4),
+                ]
+            with m.Else():
+                m.d.usb += [
+                    staged_data   .eq(combined_data),
+                    staged_count  .eq(combined_count),
+                ]
+
+        # Once the packet has been marked ready, flush out any partial word, and add the packet
+        # to our queue.
+        with m.Elif(packet_ready & queue.w_rdy):
+            with m.If(staged_count != 0):
+                m.d.comb += [
+                    queue.w_en    .eq(1),
+                    queue.w_data  .eq(staged_data),
+                ]
+            m.d.comb += packet_committed.eq(1)
+
+        with m.If(packet_committed):
+            m.d.comb += [
+                queue.w_commit    .eq(1),
+                queue.w_length    .eq(packet_length),
+                queue.w_endpoint  .eq(packet_endpoint),
+                queue.w_last      .eq(packet_last),
+            ]
+            m.d.usb += [
+                staged_data      .eq(0),
+                staged_count     .eq(0),
+                bytes_in_packet  .eq(0),
+            ]
+
+        # Keep track of whether the packet currently being loaded was started via our registers.
+        with m.If(self._reset.f.fifo.w_stb | packet_committed):
+            m.d.usb += user_packet_open.eq(0)
+        with m.Elif(write_accepted & (self.dma.count == 0)):
+            m.d.usb += user_packet_open.eq(1)
+
+
+        #
+        # Per-endpoint FIFOs.
+        #
+
+        # If any endpoints have been given FIFOs of their own, each packet is moved from our core FIFO
+        # into the FIFO for its endpoint as soon as there's room for it; packets for all other endpoints
+        # are moved into a shared FIFO. Otherwise, packets are transmitted directly from our core FIFO.
+        if self._dedicated_endpoints:
+            lanes = []
+            for name in ("shared", *(f"ep{n}" for n in self._dedicated_endpoints)):
+                lane = ResetInserter(self._reset.f.fifo.w_stb)(
+                    _PacketQueue(max_packet_size=self._max_packet_size, depth=self._queue_depth)
+                )
+                m.submodules[f"{name}_queue"] = lane
+                lanes.append(lane)
+        else:
+            lanes = [queue]
+
+        def lane_for(endpoint):
+            """ Returns the index of the FIFO that holds packets for the given endpoint. """
+            index = Signal(range(len(lanes)))
+            with m.Switch(endpoint):
+                for n, dedicated_endpoint in enumerate(self._dedicated_endpoints):
+                    with m.Case(dedicated_endpoint):
+                        m.d.comb += index.eq(n + 1)
+            return index
+
+        if self._dedicated_endpoints:
+            target_lane     = lane_for(queue.r_endpoint)
+            target_w_rdy    = Array(lane.w_rdy for lane in lanes)[target_lane]
+            words_remaining = Signal(range(0, (self._max_packet_size + 3) // 4 + 1))
+
+            with m.FSM(domain="usb", name="distributor"):
+
+                # IDLE -- wait for a packet to be queued in our core FIFO, and for its FIFO to have room.
+                with m.State("IDLE"):
+                    with m.If(queue.r_valid & target_w_rdy):
+                        m.d.usb += words_remaining.eq((queue.r_length + 3) >> 2)
+                        m.next = "MOVE"
+
+                # MOVE -- move the packet's data into its FIFO, and then queue it for transmission.
+                with m.State("MOVE"):
+                    for n, lane in enumerate(lanes):
+                        m.d.comb += lane.w_data.eq(queue.r_data)
+                        with m.If(target_lane == n):
+                            with m.If(words_remaining == 0):
+                                m.d.comb += [
+                                    lane.w_commit    .eq(1),
+                                    lane.w_length    .eq(queue.r_length),
+                                    lane.w_endpoint  .eq(queue.r_endpoint),
+                                    lane.w_last      .eq(queue.r_last),
+                                ]
+                            with m.Elif(queue.r_rdy):
+                                m.d.comb += lane.w_en.eq(1)
+
+                    with m.If(words_remaining == 0):
+                        m.d.comb += queue.r_release.eq(1)
+                        m.next = "IDLE"
+                    with m.Elif(queue.r_rdy):
+                        m.d.comb += queue.r_en.eq(1)
+                        m.d.usb  += words_remaining.eq(words_remaining - 1)
+
+                    # Always return to IDLE on reset.
+                    with m.If(self._reset.f.fifo.w_stb):
+                        m.next = "IDLE"
+
+        # Keep track of which FIFO we're transmitting from, which byte of its current word we're
+        # transmitting, and how many bytes of the current packet remain to be transmitted.
+        active_lane     = Signal(range(len(lanes)))
+        byte_index      = Signal(range(0, 4))
+        bytes_remaining = Signal(range(0, self._max_packet_size + 1))
+
+        # Signals that indicate a byte has been transmitted, advance the active FIFO's data,
+        # and remove its current packet.
+        byte_sent = Signal()
+        advance   = Signal()
+        release   = Signal()
+        for n, lane in enumerate(lanes):
+            m.d.comb += [
+                lane.r_en       .eq(advance & (active_lane == n)),
+                lane.r_release  .eq(release & (active_lane == n)),
+            ]
+
+        # Only the last packet of each transfer raises our DONE event.
+        active_last     = Array(lane.r_last for lane in lanes)[active_lane]
+        active_endpoint = Array(lane.r_endpoint for lane in lanes)[active_lane]
+
+        # Keep track of the amount of data in our FIFOs as data is added or transmitted.
+        increment = Mux(write_accepted, write_count, 0)
 
         # If we're clearing the whole FIFO, reset our data count.
         with m.If(self._reset.f.fifo.w_stb):
             m.d.usb += bytes_in_fifo.eq(0)
-
-        # Keep track of our FIFO's data count as data is added or removed.
-        increment = fifo.w_en & fifo.w_rdy
-        decrement = fifo.r_en & fifo.r_rdy
-
-        with m.Elif(increment & ~decrement):
-            m.d.usb += bytes_in_fifo.eq(bytes_in_fifo + 1)
-        with m.Elif(decrement & ~increment):
-            m.d.usb += bytes_in_fifo.eq(bytes_in_fifo - 1)
+        with m.Else():
+            m.d.usb += bytes_in_fifo.eq(bytes_in_fifo + increment - byte_sent)
 
 
         #
@@ -209,6 +608,15 @@ class Peripheral(wiring.Component):
         # Keep track of which endpoints have responded with a NAK.
         endpoint_nakked  = Array(Signal() for _ in range(16))
 
+        # Keep track of how many packets are queued for each endpoint.
+        endpoint_pending = [Signal(range(0, max_packets + 1)) for _ in range(16)]
+
+        # Keep track of which endpoints are isochronous, and of how many packets each may send per
+        # (micro)frame.
+        endpoint_mult    = Array(Signal(2) for _ in range(16))
+        with m.If(self._iso.f.mult.w_stb):
+            m.d.usb += endpoint_mult[self._iso.f.epno.w_data].eq(self._iso.f.mult.w_data)
+
         # Clear our system state on reset.
         with m.If(self._reset.f.fifo.w_stb):
             for i in range(16):
@@ -216,8 +624,21 @@ class Peripheral(wiring.Component):
                     endpoint_stalled[i]   .eq(0),
                     endpoint_data_pid[i]  .eq(0),
                     endpoint_nakked[i]    .eq(0),
+                    endpoint_pending[i]   .eq(0),
                 ]
 
+        # Otherwise, update our pending counts as packets are queued and transmitted; each packet
+        # is counted against the endpoint it was queued for, as recorded in its descriptor.
+        with m.Else():
+            for i in range(16):
+                queued      = queue.w_commit & (queue.w_endpoint == i)
+                transmitted = release & (active_endpoint == i)
+                m.d.usb += endpoint_pending[i].eq(endpoint_pending[i] + queued - transmitted)
+
+        # Clear an endpoint's NAK status whenever a packet is queued for it.
+        with m.If(queue.w_commit):
+            m.d.usb += endpoint_nakked[queue.w_endpoint].eq(0)
+
         # Set the value of our endpoint `stall` based on our `stall` register...
         with m.If(self._stall.f.stalled.w_stb):
             m.d.usb += endpoint_stalled[self._status.f.epno.r_data].eq(self._stall.f.stalled.w_data)
@@ -237,9 +658,11 @@ class Peripheral(wiring.Component):
         #
 
         m.d.comb += [
-            self._status.f.have.r_data .eq(fifo.r_rdy),
-            self._status.f.pid.r_data  .eq(endpoint_data_pid[self._status.f.epno.r_data]),
-            self._status.f.nak.r_data  .eq(Cat(endpoint_nakked)),
+            self._status.f.have.r_data  .eq(bytes_in_fifo != 0),
+            self._status.f.pid.r_data   .eq(endpoint_data_pid[self._status.f.epno.r_data]),
+            self._status.f.nak.r_data   .eq(Cat(endpoint_nakked)),
+            self._status.f.full.r_data  .eq(~queue.w_rdy),
+            self._pending.f.mask.r_data .eq(Cat(pending != 0 for pending in endpoint_pending)),
         ]
 
 
@@ -247,11 +670,12 @@ class Peripheral(wiring.Component):
         # Data toggle control.
         #
 
-        endpoint_matches = (token.endpoint == self._status.f.epno.r_data)
-        packet_complete  = self.interface.handshakes_in.ack & token.is_in & endpoint_matches
+        # Keep track of whether we've responded to the current IN token with a packet.
+        packet_sent = Signal()
+        with m.If(token.new_token):
+            m.d.usb += packet_sent.eq(0)
 
-        # Always drive the DATA pid we're transmitting with our current data pid.
-        m.d.comb += self.interface.tx_pid_toggle.eq(endpoint_data_pid[token.endpoint])
+        packet_complete = self.interface.handshakes_in.ack & token.is_in & packet_sent
 
         # If our controller is overriding the data PID, accept the override.
         with m.If(self._pid.f.toggle.w_stb):
@@ -268,55 +692,146 @@ class Peripheral(wiring.Component):
 
         # Logic shorthand.
         new_in_token     = (token.is_in & token.ready_for_response)
+
+        # Ignore any IN tokens for endpoint zero while its requests are being handled in gateware.
+        new_in_token     = new_in_token & ~(self.ep0_handled & (token.endpoint == 0))
+
+        # ... and any IN tokens for endpoints that are handled by other gateware.
+        for endpoint in self._excluded_endpoints:
+            new_in_token = new_in_token & (token.endpoint != endpoint)
         stalled          = endpoint_stalled[token.endpoint]
+        isochronous      = (endpoint_mult[token.endpoint] != 0)
 
-        with m.FSM(domain='usb') as f:
+        # Keep track of how many packets each isochronous endpoint has sent in the current (micro)frame.
+        endpoint_iso_sent = Array(Signal(2) for _ in range(16))
+        with m.If(token.new_frame):
+            for i in range(16):
+                m.d.usb += endpoint_iso_sent[i].eq(0)
+        with m.Elif(release & isochronous & (endpoint_iso_sent[token.endpoint] != 3)):
+            m.d.usb += endpoint_iso_sent[token.endpoint].eq(endpoint_iso_sent[token.endpoint] + 1)
+
+        # Isochronous packets carry a DATA PID that indicates how many more packets will be sent in the
+        # current microframe [USB2.0: 5.9.2]; so a packet that's followed by two more is sent as DATA2,
+        # and the final packet is always sent as DATA0.
+        iso_pid       = Signal(2)
+        iso_mult      = endpoint_mult[token.endpoint]
+        iso_sent      = endpoint_iso_sent[token.endpoint]
+        iso_pending   = Array(endpoint_pending)[token.endpoint]
+        iso_allowed   = Signal(2)
+        iso_remaining = Signal(2)
+        m.d.comb += [
+            iso_allowed    .eq(Mux(iso_sent < iso_mult, iso_mult - iso_sent, 0)),
+            iso_remaining  .eq(Mux(iso_pending < iso_allowed, iso_pending, iso_allowed)),
+        ]
+        with m.If(new_in_token):
+            m.d.usb += iso_pid.eq(Mux(iso_remaining > 1, iso_remaining - 1, 0))
 
-            # Drive our IDLE line based on our FSM state.
-            m.d.comb += self._status.f.idle.r_data.eq(f.ongoing('IDLE'))
+        # Always drive the DATA pid we're transmitting with our current data pid.
+        with m.If(isochronous):
+            m.d.comb += self.interface.tx_pid_toggle.eq(iso_pid)
+        with m.Else():
+            m.d.comb += self.interface.tx_pid_toggle.eq(endpoint_data_pid[token.endpoint])
+
+        # Find the FIFO that would hold a packet for the endpoint targeted by the current token,
+        # and check whether the packet at its head is for that endpoint.
+        token_lane       = lane_for(token.endpoint)
+        token_length     = Array(lane.r_length for lane in lanes)[token_lane]
+        endpoint_matches = Array(lane.r_valid & (lane.r_endpoint == token.endpoint) for lane in lanes)[token_lane]
+
+        # Strobe that indicates we've finished sending a packet that should raise our DONE event.
+        packet_done = Signal()
+
+        # Packets loaded by our DMA port are queued once they're committed.
+        with m.If(self.dma.commit):
+            m.d.comb += [
+                packet_ready     .eq(1),
+                packet_endpoint  .eq(self.dma.endpoint),
+                packet_last      .eq(1),
+            ]
 
-            # IDLE -- our CPU hasn't yet requested that we send data.
-            # We'll wait for it to do so, and NAK any packets that arrive.
-            with m.State("IDLE"):
+        # If the user requests that we send data, add the packet to our queue.
+        with m.Elif(self._endpoint.f.number.w_stb & ~stalled & user_allowed):
+            m.d.comb += [
+                packet_ready     .eq(1),
+                packet_endpoint  .eq(self._endpoint.f.number.w_data),
+                packet_last      .eq(1),
+            ]
 
-                # If we get an IN token...
-                with m.If(new_in_token):
+        # While loading a transfer, queue each packet as soon as it's full, or once the transfer's
+        # data has all been written. If the final packet is full-size, and a ZLP has been requested,
+        # it's followed by an extra zero-length packet.
+        with m.Elif(transfer_active):
+            m.d.comb += [
+                packet_ready     .eq(packet_full | transfer_done),
+                packet_endpoint  .eq(transfer_endpoint),
+                packet_last      .eq(transfer_done & ~(packet_full & transfer_zlp)),
+            ]
 
-                    # STALL it, if the endpoint is STALL'd...
-                    with m.If(stalled):
-                        m.d.comb += handshakes_out.stall.eq(1)
+        # Our DMA port may start a packet once the queue has room for it, and we're not part-way through
+        # loading a packet or transfer via our registers; and may commit it once the queue has room.
+        m.d.comb += self.dma.ready.eq(queue.w_rdy & ~user_loading)
 
-                    # Otherwise, NAK.
-                    with m.Else():
-                        m.d.comb += handshakes_out.nak.eq(1)
-                        m.d.usb += endpoint_nakked[token.endpoint].eq(1)
+        # Start a new transfer when the user writes to our transfer register...
+        with m.If(self._reset.f.fifo.w_stb):
+            m.d.usb += transfer_active.eq(0)
+        with m.Elif(self._transfer.f.length.w_stb & ~self.dma.active):
+            m.d.usb += [
+                transfer_active     .eq(1),
+                transfer_remaining  .eq(self._transfer.f.length.w_data),
+                transfer_endpoint   .eq(self._transfer.f.epno.w_data),
+                transfer_zlp        .eq(self._transfer.f.zlp.w_data),
+            ]
+        with m.Elif(transfer_active):
+            # ... keep track of how much of it has been written...
+            m.d.usb += transfer_remaining.eq(transfer_left)
+
+            # ... and finish it once its last packet has been queued. If we're about to send a ZLP,
+            # our final packet will be the ZLP itself.
+            with m.If(packet_committed):
+                with m.If(packet_last):
+                    m.d.usb += transfer_active.eq(0)
+                with m.Elif(transfer_done):
+                    m.d.usb += transfer_zlp.eq(0)
+
+        m.d.comb += self._status.f.xfer.r_data.eq(transfer_active)
+
+        # Note any register writes we've had to discard, so firmware can tell its packets are incomplete.
+        user_data_write = self._data.f.byte.w_stb | self._data_wide.f.word.w_stb
+        with m.If(self._reset.f.fifo.w_stb):
+            m.d.usb += self._status.f.discard.r_data.eq(0)
+        with m.Elif((user_data_write & ~(write_accepted & (self.dma.count == 0))) |
+                    (self._endpoint.f.number.w_stb & ~user_allowed) |
+                    (self._transfer.f.length.w_stb & self.dma.active)):
+            m.d.usb += self._status.f.discard.r_data.eq(1)
 
-                # If the user request that we send data, "prime" the endpoint.
-                # This means we have data to send, but are just waiting for an IN token.
-                with m.If(self._endpoint.f.number.w_stb & ~stalled):
-                    # we can also clear our NAK status now
-                    m.d.usb += endpoint_nakked[token.endpoint].eq(0)
-                    m.next = "PRIMED"
+        with m.FSM(domain='usb') as f:
 
-                # Always return to IDLE on reset.
-                with m.If(self._reset.f.fifo.w_stb):
-                    m.next = "IDLE"
+            # Drive our IDLE line based on our FSM state, and on whether we have any packets queued.
+            m.d.comb += self._status.f.idle.r_data.eq(f.ongoing('IDLE') & (self._pending.f.mask.r_data == 0))
 
-            # PRIMED -- our CPU has provided data, but we haven't been sent an IN token, yet.
-            # Await that IN token.
-            with m.State("PRIMED"):
+            # IDLE -- we're waiting for an IN token. We'll respond to it if we have a packet queued
+            # for its endpoint, and NAK it otherwise.
+            with m.State("IDLE"):
 
+                # If we get an IN token...
                 with m.If(new_in_token):
 
-                    # If the target endpoint is STALL'd, reply with STALL no matter what.
-                    with m.If(stalled):
+                    # STALL it, if the endpoint is STALL'd; isochronous endpoints never handshake...
+                    with m.If(stalled & ~isochronous):
                         m.d.comb += handshakes_out.stall.eq(1)
 
-                    # If we have a new IN token to our endpoint, move to responding to it.
+                    # If we have a packet for the token's endpoint, move to responding to it.
                     with m.Elif(endpoint_matches):
 
-                        # If there's no data in our endpoint, send a ZLP.
-                        with m.If(~fifo.r_rdy):
+                        # We'll always start transmitting from the first byte of a FIFO word.
+                        m.d.usb += [
+                            active_lane      .eq(token_lane),
+                            byte_index       .eq(0),
+                            bytes_remaining  .eq(token_length),
+                        ]
+
+                        # If there's no data in our packet, send a ZLP.
+                        with m.If(token_length == 0):
                             m.next = "SEND_ZLP"
 
                         # Otherwise, send our data, starting with our first byte.
@@ -324,13 +839,14 @@ class Peripheral(wiring.Component):
                             m.d.usb += tx.first.eq(1)
                             m.next = "SEND_DATA"
 
+                    # If an isochronous endpoint has nothing to send, it responds with a ZLP.
+                    with m.Elif(isochronous):
+                        m.next = "SEND_EMPTY"
+
                     # Otherwise, we don't have a response; NAK the packet.
                     with m.Else():
                         m.d.comb += handshakes_out.nak.eq(1)
-
-                # Always return to IDLE on reset.
-                with m.If(self._reset.f.fifo.w_stb):
-                    m.next = "IDLE"
+                        m.d.usb += endpoint_nakked[token.endpoint].eq(1)
 
             # SEND_ZLP -- we're now now ready to respond to an IN token with a ZLP.
             # Send our response.
@@ -339,41 +855,176 @@ class Peripheral(wiring.Component):
                     tx.valid  .eq(1),
                     tx.last   .eq(1)
                 ]
-                # Trigger our DONE event.
-                m.d.comb += self._done.i.eq(1)
+                # Remove the packet from our queue, and trigger our DONE event.
+                m.d.comb += [
+                    release        .eq(1),
+                    packet_done    .eq(active_last),
+                ]
+                m.d.usb += packet_sent.eq(1)
+                m.next = 'IDLE'
+
+            # SEND_EMPTY -- we're responding to an IN token on an isochronous endpoint with no packet
+            # queued; send a ZLP, without removing anything from our queue.
+            with m.State("SEND_EMPTY"):
+                m.d.comb += [
+                    tx.valid  .eq(1),
+                    tx.last   .eq(1)
+                ]
                 m.next = 'IDLE'
 
             # SEND_DATA -- we're now ready to respond to an IN token to our endpoint.
             # Send our response.
             with m.State("SEND_DATA"):
-                last_byte = (bytes_in_fifo == 1)
+                last_byte = (bytes_remaining == 1)
 
                 m.d.comb += [
                     tx.valid    .eq(1),
                     tx.last     .eq(last_byte),
 
-                    # Drive our transmit data directly from our FIFO...
-                    tx.payload  .eq(fifo.r_data),
-
-                    # ... and advance our FIFO each time a data byte is transmitted.
-                    fifo.r_en   .eq(tx.ready)
+                    # Drive our transmit data directly from the current word in our active FIFO.
+                    tx.payload  .eq(Array(lane.r_data for lane in lanes)[active_lane].word_select(byte_index, 8)),
                 ]
 
-                # After we've sent a byte, drop our first flag.
+                # After we've sent a byte, drop our first flag...
                 with m.If(tx.ready):
-                    m.d.usb += tx.first.eq(0)
+                    m.d.usb += [
+                        tx.first         .eq(0),
+                        bytes_remaining  .eq(bytes_remaining - 1),
+                    ]
+                    m.d.comb += byte_sent.eq(1)
+
+                    # ... and advance our FIFO each time the last byte of a word is transmitted.
+                    with m.If((byte_index == 3) | last_byte):
+                        m.d.comb += advance.eq(1)
+                        m.d.usb  += byte_index.eq(0)
+                    with m.Else():
+                        m.d.usb  += byte_index.eq(byte_index + 1)
 
-                # Once we transmit our last packet, we're done transmitting. Move back to IDLE.
+                # Once we transmit our last byte, we're done transmitting this packet. Move back to IDLE,
+                # where we'll await the next IN token.
                 with m.If(last_byte & tx.ready):
-                    # Trigger our DONE event.
-                    m.d.comb += self._done.i.eq(1)
+                    # Remove the packet from our queue, and trigger our DONE event.
+                    m.d.comb += [
+                        release        .eq(1),
+                        packet_done    .eq(active_last),
+                    ]
+                    m.d.usb += packet_sent.eq(1)
                     m.next = 'IDLE'
 
                 # Always return to IDLE on reset.
                 with m.If(self._reset.f.fifo.w_stb):
                     m.next = "IDLE"
 
+        # Coalesce our DONE events, as configured by our coalesce register.
+        m.submodules.coalescer = coalescer = EventCoalescer(self._coalesce)
+        m.d.comb += [
+            coalescer.i    .eq(packet_done),
+            self._done.i   .eq(coalescer.o),
+        ]
+
+        # Notify the CPU the first time a watched endpoint NAKs an IN token, so it can prime a packet.
+        nak_watched = self._notify.f.nak.data.bit_select(token.endpoint, 1)
+        m.d.comb += self._nak.i.eq(handshakes_out.nak & nak_watched & ~endpoint_nakked[token.endpoint])
+
+        # Report each completed packet against its endpoint.
+        with m.If(packet_done):
+            m.d.comb += self.complete.bit_select(active_endpoint, 1).eq(1)
+
         # connect events to irq line
         m.d.comb += self.irq.eq(self._events.src.i)
 
         return DomainRenamer({"sync": "usb"})(m)
+
+
+class _PacketQueue(Elaboratable):
+    """ A FIFO of packet data, accompanied by a queue of descriptors for the packets it holds.
+
+    Packet data is stored as little-endian 32-bit words; and each packet starts on a word boundary.
+
+    Attributes
+    ----------
+
+    w_data: Signal(32), input
+        The word to be added to the data FIFO.
+    w_en: Signal(), input
+        Strobe that adds ``w_data`` to the data FIFO.
+    w_length: Signal(), input
+        The length, in bytes, of the packet most recently added to the data FIFO.
+    w_endpoint: Signal(4), input
+        The endpoint the packet most recently added to the data FIFO should be transmitted on.
+    w_last: Signal(), input
+        High if the packet most recently added to the data FIFO is the last packet of its transfer.
+    w_commit: Signal(), input
+        Strobe that adds a descriptor for the packet most recently added to the data FIFO.
+    w_rdy: Signal(), output
+        High when there's room for another packet.
+
+    r_data: Signal(32), output
+        The word at the head of the data FIFO.
+    r_en: Signal(), input
+        Strobe that removes the word at the head of the data FIFO.
+    r_rdy: Signal(), output
+        High when ``r_data`` is valid.
+    r_length: Signal(), output
+        The length, in bytes, of the packet at the head of the queue.
+    r_endpoint: Signal(4), output
+        The endpoint the packet at the head of the queue should be transmitted on.
+    r_last: Signal(), output
+        High if the packet at the head of the queue is the last packet of its transfer.
+    r_valid: Signal(), output
+        High when there's at least one packet in the queue.
+    r_release: Signal(), input
+        Strobe that removes the descriptor at the head of the queue.
+    """
+
+    def __init__(self, *, max_packet_size, depth):
+        self._words_per_packet = (max_packet_size + 3) // 4
+        self._depth            = depth
+
+        self.w_data     = Signal(32)
+        self.w_en       = Signal()
+        self.w_length   = Signal(range(0, max_packet_size + 1))
+        self.w_endpoint = Signal(4)
+        self.w_last     = Signal()
+        self.w_commit   = Signal()
+        self.w_rdy      = Signal()
+
+        self.r_data     = Signal(32)
+        self.r_en       = Signal()
+        self.r_rdy      = Signal()
+        self.r_length   = Signal.like(self.w_length)
+        self.r_endpoint = Signal.like(self.w_endpoint)
+        self.r_last     = Signal()
+        self.r_valid    = Signal()
+        self.r_release  = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Create our data FIFO, with enough room for a full queue of maximum-size packets. A buffered FIFO
+        # only accepts data while its unbuffered part has room; so we add an extra word of space, which
+        # ensures a word for which there's room is never turned away...
+        m.submodules.fifo = fifo = SyncFIFOBuffered(width=32, depth=self._words_per_packet * self._depth + 1)
+        m.d.comb += [
+            fifo.w_data      .eq(self.w_data),
+            fifo.w_en        .eq(self.w_en),
+            self.r_data      .eq(fifo.r_data),
+            self.r_rdy       .eq(fifo.r_rdy),
+            fifo.r_en        .eq(self.r_en),
+        ]
+
+        # ... and our descriptor queue. Since each packet can't exceed our maximum packet size,
+        # room for a descriptor implies room for the packet's data. This queue is unbuffered, so that
+        # it reports room for another descriptor even in the cycle after one's been added.
+        m.submodules.descriptors = descriptors = SyncFIFO(
+            width=len(self.w_length) + len(self.w_endpoint) + 1, depth=self._depth)
+        m.d.comb += [
+            descriptors.w_data                               .eq(Cat(self.w_length, self.w_endpoint, self.w_last)),
+            descriptors.w_en                                 .eq(self.w_commit),
+            self.w_rdy                                       .eq(descriptors.w_rdy),
+            Cat(self.r_length, self.r_endpoint, self.r_last) .eq(descriptors.r_data),
+            self.r_valid                                     .eq(descriptors.r_rdy),
+            descriptors.r_en                                 .eq(self.r_release),
+        ]
+
+        return m
@@ -21,19 +21,77 @@ from amaranth.lib.wiring              import In, Out, connect, flipped
 
 from amaranth_soc                     import csr, event
 
+from luna.gateware.memory             import TransactionalizedFIFO
+from luna.gateware.usb.usb2           import USBSpeed
 from luna.gateware.usb.usb2.endpoint  import EndpointInterface
 
+from ...csr                           import check_data_width
+from .coalesce                        import EventCoalescer
+
+
+class DMASignature(wiring.Signature):
+    """ Signature of the port used by a DMA engine to unload received packets from an OUT endpoint.
+
+    Members
+    -------
+
+    valid: In(1)
+        High when a received packet is available.
+    length: In(16)
+        The number of bytes in the received packet.
+    endpoint: In(4)
+        The endpoint number on which the packet was received.
+    data: In(32)
+        The next four bytes of the received packet, least-significant byte first.
+    next: Out(1)
+        Strobe that advances ``data`` to the next four bytes of the packet.
+    release: Out(1)
+        Strobe that removes the packet from the receive queue, once all of its data has been read.
+    """
+    def __init__(self):
+        super().__init__({
+            "valid":     In(1),
+            "length":    In(16),
+            "endpoint":  In(4),
+            "data":      In(32),
+            "next":      Out(1),
+            "release":   Out(1),
+        })
+
 
 class Peripheral(wiring.Component):
     """ OUT component of our `eptri`
 
     Implements the OUT FIFO, which handles receiving packets from our host.
 
+    By default, the FIFO receives a single packet at a time. If a ``queue_depth`` greater than one is
+    provided, the FIFO can hold several packets back to back; and a descriptor is queued for each
+    received packet, which can be read back through the `packet` register.
+
+    Endpoints can be made isochronous via the ISOCHRONOUS register; in which case no handshakes are sent,
+    DATA PIDs aren't checked, and packets that arrive while we're not ready to receive them are dropped.
+    High-bandwidth endpoints may receive up to three packets per microframe; each is queued as a separate
+    packet. To stream a high-bandwidth endpoint, use a ``max_packet_size`` of 1024 and a ``queue_depth``
+    of at least 3; or 6, to allow one microframe's packets to be read while the next ones arrive.
+
+    PING tokens are ACK'd only while we have room for a full packet. If ``nyet`` is set, packets received
+    at high speed are answered with a NYET whenever we won't have room for the next one; so the host
+    PINGs us until we do, rather than repeatedly sending packets that would only be NAK'd [USB2.0: 8.5.1].
+
     Attributes
     ----------
 
     interface: EndpointInterface
         Our primary interface to the core USB device hardware.
+    dma: DMASignature
+        Port that allows a DMA engine to unload received packets without CPU intervention; see ``usb2.dma``.
+        Packets shouldn't be read via our registers while the DMA port is in use.
+    ep0_handled: Signal(), input
+        High while the current control request is being handled in gateware, by a ``responder.Peripheral``;
+        in which case we'll ignore any tokens for endpoint zero.
+    complete: Signal(16), output
+        Strobes the bit corresponding to an endpoint whenever a packet is received on that endpoint;
+        for use with a ``completion.Peripheral``.
     """
 
     class Control(csr.Register, access="rw"):
@@ -60,6 +118,9 @@ class Peripheral(wiring.Component):
             enabled: Controls whether any data can be received on any primed OUT endpoint. This bit is
                      automatically cleared on receive in order to give the controller time to read data
                      from the FIFO. It must be re-enabled once the FIFO has been emptied.
+
+                     If the peripheral has a receive queue, this bit is not cleared on receive; instead,
+                     incoming packets are NAK'd only while the queue has no room for another packet.
         """
         enabled : csr.Field(csr.action.W,       unsigned(1))
         _0      : csr.Field(csr.action.ResRAW0, unsigned(7))
@@ -139,49 +200,131 @@ class Peripheral(wiring.Component):
         """
         byte : csr.Field(csr.action.R,       unsigned(8))
 
+    class Length(csr.Register, access="r"):
+        """ Length register
 
-    def __init__(self, max_packet_size=512):
+            count: Contains the number of bytes received in the most recently ACK'd OUT packet.
+                   This value is latched when the packet is ACK'd, and remains valid until the
+                   next packet is ACK'd.
+        """
+        count : csr.Field(csr.action.R,       unsigned(16))
+
+    class DataWide(csr.Register, access="r"):
+        """ Wide data register
+
+            Read-only register. Returns up to four bytes from the FIFO, least-significant byte first,
+            and advances the FIFO past them. Each packet starts on a word boundary; so a packet can be
+            drained with one read per four bytes, using `length` to determine how many bytes of the
+            final word are valid. Any unused bytes in the final word of a packet read as zero.
+
+            Reads from this register may be interleaved with reads from the byte-wide `data` register;
+            in that case, only the remaining bytes of the current word are returned.
+
+            word: Contains the next four received bytes.
+        """
+        word : csr.Field(csr.action.R,       unsigned(32))
+
+    class Packet(csr.Register, access="r"):
+        """ Packet register
+
+            Read-only register. A FIFO of descriptors for the packets held in the data FIFO, in the order
+            in which they were received. Reading this register advances the descriptor FIFO.
+
+            With a ``queue_depth`` of one, this register instead holds the descriptor of the most recently
+            received packet; which remains valid until it's read, or until the FIFO is reset.
+
+            length: The number of bytes in the received packet.
+            epno:   The endpoint number on which the packet was received.
+            valid:  `1` iff this descriptor is valid; `0` if there are no further received packets.
+            pid:    The DATA PID toggle bit carried by the received packet.
+        """
+        length : csr.Field(csr.action.R,       unsigned(16))
+        epno   : csr.Field(csr.action.R,       unsigned(4))
+        _0     : csr.Field(csr.action.ResRAW0, unsigned(4))
+        valid  : csr.Field(csr.action.R,       unsigned(1))
+        pid    : csr.Field(csr.action.R,       unsigned(1))
+        _1     : csr.Field(csr.action.ResRAW0, unsigned(6))
+
+    class Isochronous(csr.Register, access="w"):
+        """ Isochronous register
+
+            epno: The endpoint to be configured.
+            mult: The number of packets the endpoint may receive in each (micro)frame, or `0` if the endpoint
+                  isn't isochronous. Values of `2` and `3` are only valid for high-bandwidth endpoints,
+                  which operate at high speed.
+        """
+        epno : csr.Field(csr.action.W,       unsigned(4))
+        mult : csr.Field(csr.action.W,       unsigned(2))
+        _0   : csr.Field(csr.action.ResRAW0, unsigned(2))
+
+
+    def __init__(self, max_packet_size=512, queue_depth=1, nyet=False, csr_data_width=8):
         """
         Parameters
         ----------
             max_packet_size: int, optional
                 Sets the maximum packet size that can be transmitted on this endpoint.
                 This should match the value provided in the relevant endpoint descriptor.
+            queue_depth: int, optional
+                Sets the number of packets that can be held in the receive queue at once.
+                Defaults to a single packet.
+            nyet: bool, optional
+                If True, high-speed packets that leave us without room for another are answered with a
+                NYET rather than an ACK. This requires a USB device that issues each endpoint's
+                ``handshakes_out.nyet``, such as our ``usb2.device.USBDevice``; LUNA's own ``USBDevice``
+                doesn't, in which case the host will see no handshake, and resend the packet.
+            csr_data_width: int, optional
+                The data width of our CSR bus; one of 8, 16 or 32. Wider buses let registers wider
+                than a byte be accessed in fewer bus cycles.
         """
+        if not isinstance(queue_depth, int) or queue_depth < 1:
+            raise ValueError("Queue depth must be a positive integer, not {!r}"
+                             .format(queue_depth))
+        check_data_width(csr_data_width)
 
         self._max_packet_size = max_packet_size
+        self._queue_depth     = queue_depth
+        self._nyet            = nyet
 
         # I/O port   FIXME ambiguity - private, or use a signature?
         self.interface = EndpointInterface()
 
         # registers
-        regs = csr.Builder(addr_width=5, data_width=8)
-        self._control  = regs.add("control",  self.Control())
-        self._endpoint = regs.add("endpoint", self.Endpoint())
-        self._enable   = regs.add("enable",   self.Enable())
-        self._prime    = regs.add("prime",    self.Prime())
-        self._stall    = regs.add("stall",    self.Stall())
-        self._pid      = regs.add("pid",      self.Pid())
-        self._status   = regs.add("status",   self.Status())
-        self._reset    = regs.add("reset",    self.Reset())
-        self._data     = regs.add("data",     self.Data())
-        self._bridge   = csr.Bridge(regs.as_memory_map())
+        regs = csr.Builder(addr_width=5, data_width=csr_data_width)
+        self._control   = regs.add("control",   self.Control())
+        self._endpoint  = regs.add("endpoint",  self.Endpoint())
+        self._enable    = regs.add("enable",    self.Enable())
+        self._prime     = regs.add("prime",     self.Prime())
+        self._stall     = regs.add("stall",     self.Stall())
+        self._pid       = regs.add("pid",       self.Pid())
+        self._status    = regs.add("status",    self.Status())
+        self._reset     = regs.add("reset",     self.Reset())
+        self._data      = regs.add("data",      self.Data())
+        self._length    = regs.add("length",    self.Length())
+        self._data_wide = regs.add("data_wide", self.DataWide())
+        self._packet    = regs.add("packet",    self.Packet())
+        self._coalesce  = regs.add("coalesce",  EventCoalescer.Coalesce())
+        self._iso       = regs.add("isochronous", self.Isochronous())
+        self._bridge    = csr.Bridge(regs.as_memory_map())
 
         # events
         EventSource = Annotated[event.Source, "Indicates that an ``OUT`` packet has successfully been transferred from the host. This bit must be cleared in order to receive additional packets."]
         self._done = EventSource(trigger="rise", path=("done",))
         event_map = event.EventMap()
         event_map.add(self._done)
-        self._events = csr.event.EventMonitor(event_map, data_width=8)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
 
         # csr decoder
-        self._decoder = csr.Decoder(addr_width=6, data_width=8)
+        self._decoder = csr.Decoder(addr_width=6, data_width=csr_data_width)
         self._decoder.add(self._bridge.bus)
         self._decoder.add(self._events.bus, name="ev")
 
         super().__init__({
             "bus":    Out(self._decoder.bus.signature),
             "irq":    Out(unsigned(1)),
+            "dma":    In(DMASignature()),
+            "ep0_handled": In(unsigned(1)),
+            "complete":    Out(unsigned(16)),
         })
         self.bus.memory_map = self._decoder.bus.memory_map
 
@@ -211,9 +354,22 @@ class Peripheral(wiring.Component):
         # Keep track of the PIDs for each endpoint, which we'll toggle automatically.
         endpoint_data_pid = Array(Signal() for _ in range(16))
 
+        # Keep track of which endpoints are isochronous; we don't need to track how many packets they
+        # receive in each (micro)frame, as we accept every packet we have room for.
+        endpoint_isochronous = Array(Signal() for _ in range(16))
+        with m.If(self._iso.f.mult.w_stb):
+            m.d.usb += endpoint_isochronous[self._iso.f.epno.w_data].eq(self._iso.f.mult.w_data != 0)
+        isochronous = endpoint_isochronous[token.endpoint]
+
+        # Strobe that indicates we've accepted a packet on an isochronous endpoint; which we don't ACK.
+        iso_receive = Signal()
+
         # Keep track of whether our FIFO is ready to receive a new packet.
         fifo_ready = Signal()
 
+        # Keep track of whether our receive queue has room for another packet.
+        queue_has_room = Signal()
+
         # Keep track of whether we're enabled.
         enabled = Signal()
         with m.If(self._enable.f.enabled.w_stb):
@@ -224,12 +380,12 @@ class Peripheral(wiring.Component):
             m.d.usb += endpoint_primed[self._endpoint.f.number.data].eq(self._prime.f.primed.w_data)
 
         # If we've just ACK'd a receive, clear our enable and
-        # clear our FIFO's ready state.
-        with m.If(interface.handshakes_out.ack & token.is_out):
-            m.d.usb += [
-                enabled                          .eq(0),
-                fifo_ready                       .eq(0),
-            ]
+        # clear our FIFO's ready state. If we have a receive queue, we'll
+        # instead remain enabled for as long as the queue has room.
+        with m.If((interface.handshakes_out.ack | interface.handshakes_out.nyet | iso_receive) & token.is_out):
+            m.d.usb += fifo_ready.eq(0)
+            if self._queue_depth == 1:
+                m.d.usb += enabled.eq(0)
             # If we've ACK'd a receive on the control endpoint, un-prime it to
             # ensure we only receive control data _after_ we've had an opportunity
             # to receive the setup packet.
@@ -239,7 +395,7 @@ class Peripheral(wiring.Component):
         # On receipt of a new token, mark our FIFO as ready iff the peripheral is enabled
         # and the destination endpoint for the token is primed.
         with m.If(token.new_token):
-            m.d.usb += fifo_ready.eq(enabled & endpoint_primed[token.endpoint])
+            m.d.usb += fifo_ready.eq(enabled & endpoint_primed[token.endpoint] & queue_has_room)
 
         # Set the value of our endpoint `stall` based on our `stall` register...
         with m.If(self._stall.f.stalled.w_stb):
@@ -261,59 +417,209 @@ class Peripheral(wiring.Component):
         #
         # Core FIFO.
         #
+
+        # Our FIFO stores received data as little-endian 32-bit words, each accompanied by the
+        # index of its last valid byte; so the CPU can read out a full word with a single access.
+        # Words only become readable once their packet has been accepted; the words of a packet
+        # that's never accepted -- e.g. one with a bad CRC -- are discarded, so they can't be
+        # mistaken for the start of the next packet.
+        words_per_packet = (self._max_packet_size + 3) // 4
+        fifo_depth       = words_per_packet * self._queue_depth
         m.submodules.fifo = fifo = ResetInserter(self._reset.f.fifo.w_stb)(
-            SyncFIFOBuffered(width=8, depth=self._max_packet_size)
+            TransactionalizedFIFO(width=32 + 2, depth=fifo_depth)
         )
+        fifo_word       = fifo.read_data[:32]
+        fifo_last_index = fifo.read_data[32:]
+        fifo_has_data   = ~fifo.empty
+        m.d.comb += fifo.read_commit.eq(1)
+
+        # Create a queue of packet descriptors, each holding the length, endpoint and DATA PID
+        # of a received packet.
+        packet_length   = self._packet.f.length.r_data
+        packet_endpoint = self._packet.f.epno.r_data
+        packet_pid      = self._packet.f.pid.r_data
+        descriptor_width = len(packet_length) + len(packet_endpoint) + len(packet_pid)
+        if self._queue_depth > 1:
+            queue = SyncFIFOBuffered(width=descriptor_width, depth=self._queue_depth)
+        else:
+            # Without a receive queue, firmware may never read the packet register; so rather than
+            # queueing descriptors, we keep that of the most recently received packet.
+            queue = _LatestDescriptor(width=descriptor_width)
+        m.submodules.queue = queue = ResetInserter(self._reset.f.fifo.w_stb)(queue)
+        m.d.comb += [
+            Cat(packet_length, packet_endpoint, packet_pid) .eq(queue.r_data),
+            self._packet.f.valid.r_data                     .eq(queue.r_rdy),
+
+            # Reading a descriptor, or releasing a packet from our DMA port, advances our descriptor queue.
+            queue.r_en .eq(self._packet.f.length.r_stb | self.dma.release),
+        ]
+
+        # If we have a receive queue, only accept a new packet if there's room for both its
+        # descriptor and a full packet's worth of data. Without one, we rely on the CPU to
+        # re-enable us once it's done with the previous packet.
+        if self._queue_depth > 1:
+            m.d.comb += queue_has_room.eq(queue.w_rdy & (fifo.space_available >= words_per_packet))
+        else:
+            m.d.comb += queue_has_room.eq(1)
+
+        # Once a packet has been received, its data is already in our FIFO, but its descriptor isn't yet
+        # in our queue; check whether we'll still have room for another packet once it is. Without a
+        # receive queue, we never do, as we'll wait for the CPU to re-enable us.
+        room_for_next = Signal()
+        if self._queue_depth > 1:
+            m.d.comb += room_for_next.eq((queue.level < self._queue_depth - 1) &
+                                         (fifo.space_available >= words_per_packet))
 
         # Shortcut for when we should allow a receive. We'll read when:
         #  - Our `epno` register matches the target register; and
         #  - We've primed the relevant endpoint.
         #  - Our most recent token is an OUT.
         #  - We're not stalled.
-        stalled            = token.is_out & endpoint_stalled[token.endpoint]
+        # We'll ignore any tokens for endpoint zero while its requests are being handled in gateware.
+        ignored            = self.ep0_handled & (token.endpoint == 0)
+        is_out             = token.is_out  & ~ignored
+        is_ping            = token.is_ping & ~ignored
+        stalled            = (is_out | is_ping) & endpoint_stalled[token.endpoint]
         is_endpoint_primed = endpoint_primed[token.endpoint]
         ready_to_receive   = fifo_ready & is_endpoint_primed & enabled & ~stalled
-        allow_receive      = token.is_out & ready_to_receive
-        nak_receives       = token.is_out & ~ready_to_receive & ~stalled
+        has_space          = queue_has_room & is_endpoint_primed & enabled & ~stalled
+        allow_receive      = is_out & ready_to_receive
+        nak_receives       = is_out & ~ready_to_receive & ~stalled
 
         # Shortcut for when we have a "redundant"/incorrect PID. In these cases, we'll assume
-        # the host missed our ACK, and per the USB spec, implicitly ACK the packet.
+        # the host missed our ACK, and per the USB spec, implicitly ACK the packet. Isochronous
+        # endpoints have no retries, and thus no redundant packets.
         is_redundant_pid    = (interface.rx_pid_toggle != endpoint_data_pid[token.endpoint])
-        is_redundant_packet = is_endpoint_primed & token.is_out & is_redundant_pid
+        is_redundant_packet = is_endpoint_primed & is_out & is_redundant_pid & ~isochronous
 
         # Shortcut conditions under which we'll ACK and NAK a receive.
         ack_redundant_packet = (is_redundant_packet & interface.rx_ready_for_response)
         ack_receive          = allow_receive & interface.rx_ready_for_response
         nak_receive          = nak_receives  & interface.rx_ready_for_response & ~ack_redundant_packet
 
-        # Conditions under which we'll ACK or NAK a ping.
-        ack_ping         = ready_to_receive  & token.is_ping & token.ready_for_response
-        nak_ping         = ~ready_to_receive & token.is_ping & token.ready_for_response
+        # Conditions under which we'll ACK or NAK a ping; which reflect whether we currently have room for
+        # a packet, rather than our state when the ping arrived.
+        ack_ping         = has_space  & is_ping & token.ready_for_response
+        nak_ping         = ~has_space & is_ping & token.ready_for_response & ~stalled
+        stall_ping       = stalled    & is_ping & token.ready_for_response
+
+        # At high speed, we'll NYET rather than ACK a packet that leaves us without room for another.
+        if self._nyet:
+            respond_nyet = (interface.speed == USBSpeed.HIGH) & ~room_for_next
+        else:
+            respond_nyet = C(0)
+
+        # We'll capture data iff we've valid data, and we're allowed receive.
+        capture_byte = allow_receive & rx.valid & rx.next & ~is_redundant_packet
+
+        # Received bytes are gathered into words before being written into our FIFO.
+        staged_data  = Signal(32)
+        staged_count = Signal(range(0, 4))
+        with m.If(self._reset.f.fifo.w_stb):
+            m.d.usb += [
+                staged_data   .eq(0),
+                staged_count  .eq(0),
+            ]
+
+        with m.Elif(capture_byte):
+            word = Signal(32)
+            m.d.comb += word.eq(staged_data | (rx.payload << (staged_count * 8)))
+
+            # If this byte completes a word, write it into our FIFO...
+            with m.If(staged_count == 3):
+                m.d.comb += [
+                    fifo.write_en    .eq(1),
+                    fifo.write_data  .eq(Cat(word, C(3, 2))),
+                ]
+                m.d.usb += [
+                    staged_data   .eq(0),
+                    staged_count  .eq(0),
+                ]
+
+            # ... otherwise, keep gathering bytes.
+            with m.Else():
+                m.d.usb += [
+                    staged_data   .eq(word),
+                    staged_count  .eq(staged_count + 1),
+                ]
+
+        # Once the packet has finished, flush out any partial word; this ensures that each
+        # packet starts on a word boundary.
+        with m.Elif(~rx.valid & (staged_count != 0)):
+            m.d.comb += [
+                fifo.write_en    .eq(1),
+                fifo.write_data  .eq(Cat(staged_data, staged_count - 1)),
+            ]
+            m.d.usb += [
+                staged_data   .eq(0),
+                staged_count  .eq(0),
+            ]
 
+        # Keep track of which byte of the current FIFO word the CPU will read next.
+        byte_index = Signal(range(0, 4))
+        with m.If(self._reset.f.fifo.w_stb):
+            m.d.usb += byte_index.eq(0)
+
+        # A read from the byte-wide data CSR advances us by a single byte...
+        with m.Elif(self._data.f.byte.r_stb & fifo_has_data):
+            with m.If(byte_index == fifo_last_index):
+                m.d.comb += fifo.read_en.eq(1)
+                m.d.usb  += byte_index.eq(0)
+            with m.Else():
+                m.d.usb  += byte_index.eq(byte_index + 1)
+
+        # ... while a read from the wide data CSR consumes the rest of the current word.
+        with m.Elif(self._data_wide.f.word.r_stb & fifo_has_data):
+            m.d.comb += fifo.read_en.eq(1)
+            m.d.usb  += byte_index.eq(0)
+
+        # Our DMA port always consumes full words.
+        with m.Elif(self.dma.next & fifo_has_data):
+            m.d.comb += fifo.read_en.eq(1)
+            m.d.usb  += byte_index.eq(0)
+
+        # Present the packet at the head of our queue to our DMA port.
         m.d.comb += [
-            # We'll write to the endpoint iff we've valid data, and we're allowed receive.
-            fifo.w_en                   .eq(allow_receive & rx.valid & rx.next & ~is_redundant_packet),
-            fifo.w_data                 .eq(rx.payload),
+            self.dma.valid     .eq(queue.r_rdy),
+            self.dma.length    .eq(packet_length),
+            self.dma.endpoint  .eq(packet_endpoint),
+            self.dma.data      .eq(fifo_word),
+        ]
 
-            # We'll advance the FIFO whenever our CPU reads from the data CSR;
-            # and we'll always read our data from the FIFO.
-            fifo.r_en                   .eq(self._data.f.byte.r_stb),
-            self._data.f.byte.r_data    .eq(fifo.r_data),
+        # Keep track of how many bytes we've received in the current packet, so we can latch
+        # the packet's length once we ACK it.
+        bytes_received = Signal.like(self._length.f.count.r_data)
+        with m.If(token.new_token):
+            m.d.usb += bytes_received.eq(0)
+        with m.Elif(capture_byte):
+            m.d.usb += bytes_received.eq(bytes_received + 1)
+
+        # Create our DONE event coalescer, as configured by our coalesce register.
+        m.submodules.coalescer = coalescer = EventCoalescer(self._coalesce)
+
+        m.d.comb += [
+            # We'll always read our data from the current word in our FIFO.
+            self._data.f.byte.r_data      .eq(fifo_word.word_select(byte_index, 8)),
+            self._data_wide.f.word.r_data .eq(fifo_word >> (byte_index * 8)),
 
             # Pass the FIFO status on to our CPU.
-            self._status.f.have.r_data  .eq(fifo.r_rdy),
+            self._status.f.have.r_data  .eq(fifo_has_data),
 
-            # If we've just finished an allowed receive, ACK.
-            handshakes_out.ack          .eq(ack_receive | ack_ping | ack_redundant_packet),
+            # If we've just finished an allowed receive, ACK or NYET; unless we're isochronous, and never handshake.
+            handshakes_out.ack          .eq((((ack_receive | ack_redundant_packet) & ~respond_nyet) | ack_ping) & ~isochronous),
+            handshakes_out.nyet         .eq((ack_receive | ack_redundant_packet) & respond_nyet & ~isochronous),
+            iso_receive                 .eq(ack_receive & isochronous),
 
-            # Trigger our DONE interrupt once we ACK a received/allowed packet.
-            self._done.i                .eq(ack_receive),
+            # Trigger our DONE interrupt once we ACK a received/allowed packet; or once we've
+            # ACK'd as many packets as our coalesce register asks us to gather.
+            coalescer.i                 .eq(ack_receive),
+            self._done.i                .eq(coalescer.o),
 
             # If we were stalled, stall.
-            handshakes_out.stall        .eq(stalled & interface.rx_ready_for_response),
+            handshakes_out.stall        .eq(((stalled & interface.rx_ready_for_response) | stall_ping) & ~isochronous),
 
             # If we're not ACK'ing or STALL'ing, NAK all packets.
-            handshakes_out.nak          .eq(nak_receive | nak_ping),
+            handshakes_out.nak          .eq((nak_receive | nak_ping) & ~isochronous),
 
             # Always indicate the current DATA PID in the PID register.
             self._status.f.pid.r_data   .eq(endpoint_data_pid[self._endpoint.f.number.data])
@@ -324,12 +630,77 @@ class Peripheral(wiring.Component):
         with m.If(token.new_token & token.is_out & enabled):
             m.d.usb += self._status.f.epno.r_data.eq(token.endpoint)
 
+        # Whenever we ACK a receive, latch the length of the received packet, make its data
+        # readable, and queue a descriptor for it...
+        with m.If(ack_receive & ~is_redundant_packet):
+            m.d.usb += self._length.f.count.r_data.eq(bytes_received)
+            m.d.comb += [
+                fifo.write_commit  .eq(1),
+                queue.w_en    .eq(1),
+                queue.w_data  .eq(Cat(bytes_received, token.endpoint, endpoint_data_pid[token.endpoint])),
+                self.complete.bit_select(token.endpoint, 1).eq(1),
+            ]
+
+        # ... and discard the data of any packet we don't accept; which we'll know about once it's
+        # found to be corrupt, or at the latest, once the next token arrives.
+        with m.Elif(interface.rx_invalid | token.new_token):
+            m.d.comb += fifo.write_discard.eq(1)
+
         # Whenever we ACK a non-redundant receive, toggle our DATA PID.
         # (unless the user happens to be overriding it by writing to the PID register).
-        with m.If(ack_receive & ~is_redundant_packet & ~self._pid.f.toggle.w_stb):
+        with m.If(ack_receive & ~is_redundant_packet & ~isochronous & ~self._pid.f.toggle.w_stb):
             m.d.usb += endpoint_data_pid[token.endpoint].eq(~endpoint_data_pid[token.endpoint])
 
         # connect events to irq line
         m.d.comb += self.irq.eq(self._events.src.i)
 
         return DomainRenamer({"sync": "usb"})(m)
+
+
+class _LatestDescriptor(Elaboratable):
+    """ Holds the most recently written packet descriptor; with the read/write ports of a FIFO.
+
+    Each write replaces the held descriptor, so writes are always accepted; reading the descriptor
+    empties the register until the next write.
+
+    Attributes
+    ----------
+
+    w_data: Signal(width), input
+        The descriptor to be written.
+    w_en: Signal(), input
+        Strobe that replaces the held descriptor with ``w_data``.
+    w_rdy: Signal(), output
+        Always high.
+
+    r_data: Signal(width), output
+        The held descriptor.
+    r_en: Signal(), input
+        Strobe that empties the register.
+    r_rdy: Signal(), output
+        High when ``r_data`` is valid.
+    """
+
+    def __init__(self, *, width):
+        self.width  = width
+
+        self.w_data = Signal(width)
+        self.w_en   = Signal()
+        self.w_rdy  = Signal(init=1)
+
+        self.r_data = Signal(width)
+        self.r_en   = Signal()
+        self.r_rdy  = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        with m.If(self.w_en):
+            m.d.sync += [
+                self.r_data .eq(self.w_data),
+                self.r_rdy  .eq(1),
+            ]
+        with m.Elif(self.r_en):
+            m.d.sync += self.r_rdy.eq(0)
+
+        return m
@@ -0,0 +1,560 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Zero-copy variant of our `eptri`-equivalent ``IN`` and ``OUT`` endpoints.
+
+Rather than moving packet data through FIFOs behind byte-wide registers, packets are sent from
+and received into a packet RAM that's shared with the CPU over Wishbone; so firmware can build
+and parse packets in place, using ordinary loads and stores.
+"""
+
+from typing                           import Annotated
+
+from amaranth                         import *
+from amaranth.hdl.xfrm                import ResetInserter, DomainRenamer
+from amaranth.lib                     import wiring, memory
+from amaranth.lib.fifo                import SyncFIFOBuffered
+from amaranth.lib.wiring              import In, Out, connect, flipped
+from amaranth.utils                   import exact_log2
+
+from amaranth_soc                     import csr, event, wishbone
+from amaranth_soc.memory              import MemoryMap
+from amaranth_soc.periph              import ConstantMap
+
+from luna.gateware.usb.usb2.endpoint  import EndpointInterface
+
+from ...csr                           import check_data_width
+from .coalesce                        import EventCoalescer
+
+
+class Peripheral(wiring.Component):
+    """ Packet RAM component of our `eptri`-equivalent interface.
+
+    Handles ``IN`` and ``OUT`` transactions on every endpoint, sending packets from and receiving
+    packets into a dual-port packet RAM. The RAM is mapped onto the SoC's Wishbone bus, in the
+    same way as a ``blockram.Peripheral``; while buffers are handed to and from the USB side by
+    writing their offset and length into descriptor registers. SETUP packets are still captured
+    by an ``ep_control.Peripheral``; this peripheral replaces the ``ep_in`` and ``ep_out`` ones.
+
+    Each endpoint can have a single ``IN`` buffer queued, and a single ``OUT`` buffer armed, at
+    any time. Once an ``IN`` buffer has been sent and ACK'd by the host, or an ``OUT`` buffer has
+    received a packet, the buffer is handed back to the CPU and an entry is added to the COMPLETE
+    queue. A SETUP packet cancels any buffers queued on its endpoint, as it aborts any control
+    transfer in progress.
+
+    Like our endpoints, this peripheral operates in the ``usb`` domain. Its Wishbone interface is
+    served from the packet RAM's other port; so it can be placed in any domain, such as that of the
+    SoC bus it shares with the CPU.
+
+    Attributes
+    ----------
+
+    interface: EndpointInterface
+        Our primary interface to the core USB device hardware.
+    wb_bus: wishbone.Interface
+        Wishbone target that provides access to our packet RAM.
+    ep0_handled: Signal(), input
+        High while the current control request is being handled in gateware, by a ``responder.Peripheral``;
+        in which case we'll ignore any tokens for endpoint zero.
+    in_complete: Signal(16), output
+        Strobes the bit corresponding to an endpoint whenever one of its ``IN`` buffers is sent; for use
+        with a ``completion.Peripheral``.
+    out_complete: Signal(16), output
+        Strobes the bit corresponding to an endpoint whenever one of its ``OUT`` buffers receives a packet;
+        for use with a ``completion.Peripheral``.
+    """
+
+    class InBuffer(csr.Register, access="w"):
+        """ IN buffer register
+
+            Writing to this register queues a packet to be sent on endpoint `epno`, in response to the next
+            IN token it receives. Should only be written while no buffer is queued on the endpoint.
+
+            offset: The byte offset of the packet within our packet RAM. Must be word-aligned.
+            length: The number of bytes in the packet; or `0` to send a zero-length packet.
+            epno:   The endpoint the packet is to be sent on.
+        """
+        offset : csr.Field(csr.action.W,       unsigned(16))
+        length : csr.Field(csr.action.W,       unsigned(11))
+        _0     : csr.Field(csr.action.ResRAW0, unsigned(1))
+        epno   : csr.Field(csr.action.W,       unsigned(4))
+
+    class OutBuffer(csr.Register, access="w"):
+        """ OUT buffer register
+
+            Writing to this register arms endpoint `epno` to receive a single packet. OUT packets are NAK'd
+            while an endpoint has no buffer armed. Should only be written while no buffer is armed on the
+            endpoint.
+
+            offset: The byte offset of the buffer within our packet RAM. Must be word-aligned.
+            length: The size of the buffer, in bytes. Any bytes of a packet that don't fit are discarded.
+            epno:   The endpoint the buffer is to receive on.
+        """
+        offset : csr.Field(csr.action.W,       unsigned(16))
+        length : csr.Field(csr.action.W,       unsigned(11))
+        _0     : csr.Field(csr.action.ResRAW0, unsigned(1))
+        epno   : csr.Field(csr.action.W,       unsigned(4))
+
+    class Complete(csr.Register, access="r"):
+        """ Complete register
+
+            Read-only register. A FIFO of the buffers that have been handed back to the CPU, in the order in
+            which they completed. Reading this register advances the FIFO.
+
+            length:    The number of bytes sent or received. For OUT buffers, this is the length of the received
+                       packet; which may exceed the length of the buffer.
+            epno:      The endpoint the buffer was queued on.
+            direction: `1` for an IN buffer, or `0` for an OUT buffer.
+            valid:     `1` iff this entry is valid; `0` if no further buffers have completed.
+        """
+        length    : csr.Field(csr.action.R,       unsigned(11))
+        _0        : csr.Field(csr.action.ResRAW0, unsigned(5))
+        epno      : csr.Field(csr.action.R,       unsigned(4))
+        direction : csr.Field(csr.action.R,       unsigned(1))
+        _1        : csr.Field(csr.action.ResRAW0, unsigned(3))
+        valid     : csr.Field(csr.action.R,       unsigned(1))
+        _2        : csr.Field(csr.action.ResRAW0, unsigned(7))
+
+    class Status(csr.Register, access="r"):
+        """ Status register
+
+            in_pending: Contains a bitmask of endpoints that have an IN buffer queued.
+            out_armed:  Contains a bitmask of endpoints that have an OUT buffer armed.
+        """
+        in_pending : csr.Field(csr.action.R, unsigned(16))
+        out_armed  : csr.Field(csr.action.R, unsigned(16))
+
+    class Stall(csr.Register, access="w"):
+        """ Stall register
+
+            epno:      The endpoint to be configured.
+            direction: `1` to configure the endpoint's IN direction, or `0` for its OUT direction.
+            stalled:   Set or clear STALL on the given endpoint and direction. Stalls on an endpoint are
+                       cleared automatically when it receives a SETUP packet.
+        """
+        epno      : csr.Field(csr.action.W,       unsigned(4))
+        direction : csr.Field(csr.action.W,       unsigned(1))
+        stalled   : csr.Field(csr.action.W,       unsigned(1))
+        _0        : csr.Field(csr.action.ResRAW0, unsigned(2))
+
+    class Pid(csr.Register, access="w"):
+        """ Pid register
+
+            epno:      The endpoint to be configured.
+            direction: `1` to configure the endpoint's IN direction, or `0` for its OUT direction.
+            toggle:    Sets the current PID toggle bit for the given endpoint and direction.
+        """
+        epno      : csr.Field(csr.action.W,       unsigned(4))
+        direction : csr.Field(csr.action.W,       unsigned(1))
+        toggle    : csr.Field(csr.action.W,       unsigned(1))
+        _0        : csr.Field(csr.action.ResRAW0, unsigned(2))
+
+    class Reset(csr.Register, access="w"):
+        """ Reset register
+
+            buffers: A write to this field cancels all queued and armed buffers, and clears the COMPLETE queue.
+        """
+        buffers : csr.Field(csr.action.W,       unsigned(1))
+        _0      : csr.Field(csr.action.ResRAW0, unsigned(7))
+
+
+    def __init__(self, *, size=4096, name="packetram", wb_domain="usb", csr_data_width=8):
+        """
+        Parameters
+        ----------
+            size: int, optional
+                The size of our packet RAM, in bytes. Must be a power of two, of at most 64 KiB.
+            name: str, optional
+                A descriptive name for our packet RAM.
+            wb_domain: str, optional
+                The clock domain of our Wishbone interface. Defaults to the ``usb`` domain.
+            csr_data_width: int, optional
+                The data width of our CSR bus; one of 8, 16 or 32. Wider buses let registers wider
+                than a byte be accessed in fewer bus cycles.
+        """
+        if not isinstance(size, int) or size < 4 or size & size-1:
+            raise ValueError("Size must be an integer power of two of at least 4, not {!r}"
+                             .format(size))
+        if size > 2 ** 16:
+            raise ValueError("Size must be at most 64 KiB, not {!r}"
+                             .format(size))
+        check_data_width(csr_data_width)
+
+        self.size = size
+        self.name = name
+
+        self._wb_domain = wb_domain
+
+        depth = size // 4
+        self._mem = memory.Memory(shape=32, depth=depth, init=[])
+
+        # I/O port
+        self.interface = EndpointInterface()
+
+        # registers
+        regs = csr.Builder(addr_width=5, data_width=csr_data_width)
+        self._in_buffer  = regs.add("in_buffer",  self.InBuffer())
+        self._out_buffer = regs.add("out_buffer", self.OutBuffer())
+        self._complete   = regs.add("complete",   self.Complete())
+        self._status     = regs.add("status",     self.Status())
+        self._stall      = regs.add("stall",      self.Stall())
+        self._pid        = regs.add("pid",        self.Pid())
+        self._reset      = regs.add("reset",      self.Reset())
+        self._coalesce   = regs.add("coalesce",   EventCoalescer.Coalesce())
+        self._bridge     = csr.Bridge(regs.as_memory_map())
+
+        # events
+        EventSource = Annotated[event.Source, "Indicates that one or more buffers have been added to the COMPLETE queue."]
+        self._done = EventSource(trigger="rise", path=("done",))
+        event_map = event.EventMap()
+        event_map.add(self._done)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
+
+        # csr decoder
+        self._decoder = csr.Decoder(addr_width=6, data_width=csr_data_width)
+        self._decoder.add(self._bridge.bus)
+        self._decoder.add(self._events.bus, name="ev")
+
+        super().__init__({
+            "bus":          Out(self._decoder.bus.signature),
+            "irq":          Out(unsigned(1)),
+            "wb_bus":       In(wishbone.Signature(addr_width=exact_log2(depth),
+                                                  data_width=32,
+                                                  granularity=8)),
+            "ep0_handled":  In(unsigned(1)),
+            "in_complete":  Out(unsigned(16)),
+            "out_complete": Out(unsigned(16)),
+        })
+        self.bus.memory_map = self._decoder.bus.memory_map
+
+        memory_map = MemoryMap(addr_width=exact_log2(size), data_width=8)
+        memory_map.add_resource(name=("memory", self.name,), size=size, resource=self)
+        self.wb_bus.memory_map = memory_map
+
+    @property
+    def constant_map(self):
+        return ConstantMap(
+            SIZE = self.size,
+        )
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules += [self._bridge, self._events, self._decoder]
+        m.submodules.mem = self._mem
+
+        # connect bus
+        connect(m, flipped(self.bus), self._decoder.bus)
+
+        # Shortcuts to our components.
+        interface      = self.interface
+        token          = interface.tokenizer
+        rx             = interface.rx
+        tx             = interface.tx
+        handshakes_in  = interface.handshakes_in
+        handshakes_out = interface.handshakes_out
+        wb_bus         = self.wb_bus
+
+
+        #
+        # Wishbone access to our packet RAM.
+        #
+
+        # Like our blockram, we handle each request in a single cycle; and ACK the cycle after it. This
+        # side of our RAM is in its own domain, which is renamed to ``wb_domain`` below.
+        wb_rp = self._mem.read_port(domain="wb")
+        wb_wp = self._mem.write_port(domain="wb", granularity=8)
+        m.d.comb += [
+            wb_rp.addr    .eq(wb_bus.adr),
+            wb_wp.addr    .eq(wb_bus.adr),
+            wb_wp.data    .eq(wb_bus.dat_w),
+            wb_bus.dat_r  .eq(wb_rp.data),
+        ]
+        with m.If(wb_bus.cyc & wb_bus.stb & wb_bus.we):
+            m.d.comb += wb_wp.en.eq(wb_bus.sel)
+        m.d.wb += wb_bus.ack.eq(wb_bus.cyc & wb_bus.stb & ~wb_bus.ack)
+
+        # Our USB side uses the RAM's other port; which only ever sends or receives at any one time.
+        usb_rp = self._mem.read_port(domain="usb")
+        usb_wp = self._mem.write_port(domain="usb", granularity=8)
+        m.d.comb += usb_wp.addr.eq(usb_rp.addr)
+
+
+        #
+        # Endpoint state.
+        #
+
+        # Keep track of the buffers queued on each endpoint, as word offsets into our RAM and lengths.
+        in_pending  = Signal(16)
+        in_offset   = Array(Signal(range(self._mem.depth)) for _ in range(16))
+        in_length   = Array(Signal.like(self._in_buffer.f.length.w_data) for _ in range(16))
+        out_armed   = Signal(16)
+        out_offset  = Array(Signal(range(self._mem.depth)) for _ in range(16))
+        out_length  = Array(Signal.like(self._out_buffer.f.length.w_data) for _ in range(16))
+
+        # Keep track of which endpoints are stalled, and of their current DATA PIDs.
+        in_stalled  = Signal(16)
+        out_stalled = Signal(16)
+        in_pid      = Signal(16)
+        out_pid     = Signal(16)
+
+        # Strobes that indicate an IN or OUT buffer on the current token's endpoint has completed.
+        in_done     = Signal()
+        out_done    = Signal()
+
+        # Logic shorthand. We'll ignore any tokens for endpoint zero while its requests are being handled
+        # in gateware.
+        ignored          = self.ep0_handled & (token.endpoint == 0)
+        is_in            = token.is_in   & ~ignored
+        is_out           = token.is_out  & ~ignored
+        is_ping          = token.is_ping & ~ignored
+        new_setup        = token.is_setup & token.new_token
+        in_write         = self._in_buffer.f.epno.w_stb
+        out_write        = self._out_buffer.f.epno.w_stb
+
+        # Queue and arm buffers as they're written.
+        with m.If(in_write):
+            m.d.usb += [
+                in_offset[self._in_buffer.f.epno.w_data]   .eq(self._in_buffer.f.offset.w_data[2:]),
+                in_length[self._in_buffer.f.epno.w_data]   .eq(self._in_buffer.f.length.w_data),
+            ]
+        with m.If(out_write):
+            m.d.usb += [
+                out_offset[self._out_buffer.f.epno.w_data] .eq(self._out_buffer.f.offset.w_data[2:]),
+                out_length[self._out_buffer.f.epno.w_data] .eq(self._out_buffer.f.length.w_data),
+            ]
+
+        for i in range(16):
+            cancel = self._reset.f.buffers.w_stb | (new_setup & (token.endpoint == i))
+
+            with m.If(in_write & (self._in_buffer.f.epno.w_data == i)):
+                m.d.usb += in_pending[i].eq(1)
+            with m.Elif(cancel | (in_done & (token.endpoint == i))):
+                m.d.usb += in_pending[i].eq(0)
+
+            with m.If(out_write & (self._out_buffer.f.epno.w_data == i)):
+                m.d.usb += out_armed[i].eq(1)
+            with m.Elif(cancel | (out_done & (token.endpoint == i))):
+                m.d.usb += out_armed[i].eq(0)
+
+        # Set or clear our stalls, and override our DATA PIDs, as requested...
+        with m.If(self._stall.f.stalled.w_stb):
+            with m.If(self._stall.f.direction.w_data):
+                m.d.usb += in_stalled.bit_select(self._stall.f.epno.w_data, 1).eq(self._stall.f.stalled.w_data)
+            with m.Else():
+                m.d.usb += out_stalled.bit_select(self._stall.f.epno.w_data, 1).eq(self._stall.f.stalled.w_data)
+
+        with m.If(self._pid.f.toggle.w_stb):
+            with m.If(self._pid.f.direction.w_data):
+                m.d.usb += in_pid.bit_select(self._pid.f.epno.w_data, 1).eq(self._pid.f.toggle.w_data)
+            with m.Else():
+                m.d.usb += out_pid.bit_select(self._pid.f.epno.w_data, 1).eq(self._pid.f.toggle.w_data)
+
+        # ... toggle our DATA PIDs as each buffer completes...
+        with m.Elif(in_done):
+            m.d.usb += in_pid.bit_select(token.endpoint, 1).eq(~in_pid.bit_select(token.endpoint, 1))
+        with m.Elif(out_done):
+            m.d.usb += out_pid.bit_select(token.endpoint, 1).eq(~out_pid.bit_select(token.endpoint, 1))
+
+        # ... and clear our endpoint `stall` when we get a SETUP packet, and reset the endpoint's
+        # data PIDs to DATA1, as per [USB2.0: 8.5.3], the first packet of the DATA or STATUS
+        # phase always carries a DATA1 PID.
+        with m.If(new_setup):
+            m.d.usb += [
+                in_stalled.bit_select(token.endpoint, 1)   .eq(0),
+                out_stalled.bit_select(token.endpoint, 1)  .eq(0),
+                in_pid.bit_select(token.endpoint, 1)       .eq(1),
+                out_pid.bit_select(token.endpoint, 1)      .eq(1),
+            ]
+
+        m.d.comb += [
+            self._status.f.in_pending.r_data  .eq(in_pending),
+            self._status.f.out_armed.r_data   .eq(out_armed),
+        ]
+
+
+        #
+        # IN handling.
+        #
+
+        endpoint_in_pending = in_pending.bit_select(token.endpoint, 1)
+        endpoint_in_stalled = in_stalled.bit_select(token.endpoint, 1)
+        new_in_token        = is_in & token.ready_for_response
+
+        # Keep track of whether we've responded to the current IN token with a packet; once the host
+        # ACKs it, its buffer is complete. If the host doesn't ACK it, we'll send it again.
+        packet_sent = Signal()
+        with m.If(token.new_token):
+            m.d.usb += packet_sent.eq(0)
+        m.d.comb += in_done.eq(handshakes_in.ack & is_in & packet_sent)
+
+        # Always drive the DATA pid we're transmitting with our current data pid.
+        m.d.comb += interface.tx_pid_toggle.eq(in_pid.bit_select(token.endpoint, 1))
+
+        # Keep track of our position within the packet being sent.
+        word_address    = Signal.like(usb_rp.addr)
+        byte_index      = Signal(2)
+        bytes_remaining = Signal.like(self._in_buffer.f.length.w_data)
+        advance         = Signal()
+
+        with m.FSM(domain="usb"):
+
+            # IDLE -- wait for an IN token; meanwhile, fetch the first word of any packet queued for
+            # the endpoint it targets.
+            with m.State("IDLE"):
+                m.d.comb += usb_rp.addr.eq(in_offset[token.endpoint])
+
+                with m.If(new_in_token):
+
+                    # If we're stalled, STALL the token.
+                    with m.If(endpoint_in_stalled):
+                        m.d.comb += handshakes_out.stall.eq(1)
+
+                    # If we have a buffer queued, send it.
+                    with m.Elif(endpoint_in_pending):
+                        m.d.usb += [
+                            word_address     .eq(in_offset[token.endpoint]),
+                            byte_index       .eq(0),
+                            bytes_remaining  .eq(in_length[token.endpoint]),
+                        ]
+                        with m.If(in_length[token.endpoint] == 0):
+                            m.next = "SEND_ZLP"
+                        with m.Else():
+                            m.d.usb += tx.first.eq(1)
+                            m.next = "SEND_DATA"
+
+                    # Otherwise, we don't have a response; NAK the token.
+                    with m.Else():
+                        m.d.comb += handshakes_out.nak.eq(1)
+
+            # SEND_ZLP -- respond to an IN token with a zero-length packet.
+            with m.State("SEND_ZLP"):
+                m.d.comb += [
+                    tx.valid  .eq(1),
+                    tx.last   .eq(1),
+                ]
+                m.d.usb += packet_sent.eq(1)
+                m.next = "IDLE"
+
+            # SEND_DATA -- send our packet, directly from our packet RAM.
+            with m.State("SEND_DATA"):
+                last_byte = (bytes_remaining == 1)
+
+                m.d.comb += [
+                    tx.valid    .eq(1),
+                    tx.last     .eq(last_byte),
+                    tx.payload  .eq(usb_rp.data.word_select(byte_index, 8)),
+
+                    # Fetch the next word as soon as the last byte of the current one is sent; so it's
+                    # available on the following cycle.
+                    advance     .eq(tx.ready & (byte_index == 3)),
+                    usb_rp.addr .eq(Mux(advance, word_address + 1, word_address)),
+                ]
+
+                with m.If(tx.ready):
+                    m.d.usb += [
+                        tx.first         .eq(0),
+                        byte_index       .eq(byte_index + 1),
+                        bytes_remaining  .eq(bytes_remaining - 1),
+                    ]
+                    with m.If(advance):
+                        m.d.usb += word_address.eq(word_address + 1)
+
+                    with m.If(last_byte):
+                        m.d.usb += packet_sent.eq(1)
+                        m.next = "IDLE"
+
+
+        #
+        # OUT handling.
+        #
+
+        endpoint_out_armed   = out_armed.bit_select(token.endpoint, 1)
+        endpoint_out_stalled = out_stalled.bit_select(token.endpoint, 1)
+
+        # Shortcut for when we have a "redundant"/incorrect PID. In these cases, we'll assume
+        # the host missed our ACK, and per the USB spec, implicitly ACK the packet; but we'll
+        # discard its data.
+        is_redundant_packet  = (interface.rx_pid_toggle != out_pid.bit_select(token.endpoint, 1))
+        allow_receive        = is_out & endpoint_out_armed & ~endpoint_out_stalled & ~is_redundant_packet
+
+        # Count the bytes of each packet as they arrive...
+        bytes_received = Signal(range(2 ** len(self._complete.f.length.r_data)))
+        with m.If(token.new_token):
+            m.d.usb += bytes_received.eq(0)
+        with m.Elif(is_out & rx.valid & rx.next & (bytes_received != 2 ** len(bytes_received) - 1)):
+            m.d.usb += bytes_received.eq(bytes_received + 1)
+
+        # ... and write each one straight into its byte lane of our packet RAM, if it fits in our buffer.
+        with m.If(is_out):
+            m.d.comb += usb_rp.addr.eq(out_offset[token.endpoint] + bytes_received[2:])
+        with m.If(allow_receive & rx.valid & rx.next & (bytes_received < out_length[token.endpoint])):
+            m.d.comb += [
+                usb_wp.data  .eq(rx.payload.replicate(4)),
+                usb_wp.en    .eq(C(1, 4) << bytes_received[:2]),
+            ]
+
+        # Respond to each packet once it's complete...
+        with m.If(is_out & interface.rx_ready_for_response):
+            with m.If(endpoint_out_stalled):
+                m.d.comb += handshakes_out.stall.eq(1)
+            with m.Elif(is_redundant_packet):
+                m.d.comb += handshakes_out.ack.eq(1)
+            with m.Elif(endpoint_out_armed):
+                m.d.comb += [
+                    handshakes_out.ack  .eq(1),
+                    out_done            .eq(1),
+                ]
+            with m.Else():
+                m.d.comb += handshakes_out.nak.eq(1)
+
+        # ... and to each PING, depending on whether we've a buffer ready to receive a packet.
+        with m.If(is_ping & token.ready_for_response):
+            with m.If(endpoint_out_stalled):
+                m.d.comb += handshakes_out.stall.eq(1)
+            with m.Elif(endpoint_out_armed):
+                m.d.comb += handshakes_out.ack.eq(1)
+            with m.Else():
+                m.d.comb += handshakes_out.nak.eq(1)
+
+
+        #
+        # Completion queue.
+        #
+
+        # Each endpoint has at most one IN and one OUT buffer outstanding; so as long as the CPU reads
+        # our queue before handing the same buffers back, it can never overflow.
+        completion_length = self._complete.f.length.r_data
+        completion_epno   = self._complete.f.epno.r_data
+        completion_dir    = self._complete.f.direction.r_data
+        m.submodules.queue = queue = ResetInserter(self._reset.f.buffers.w_stb)(
+            SyncFIFOBuffered(width=len(completion_length) + len(completion_epno) + len(completion_dir), depth=32)
+        )
+        m.d.comb += [
+            queue.w_en   .eq(in_done | out_done),
+            queue.w_data .eq(Cat(Mux(in_done, in_length[token.endpoint], bytes_received), token.endpoint, in_done)),
+
+            Cat(completion_length, completion_epno, completion_dir) .eq(queue.r_data),
+            self._complete.f.valid.r_data                           .eq(queue.r_rdy),
+            queue.r_en                                              .eq(self._complete.f.length.r_stb),
+        ]
+
+        # Report each completed buffer against its endpoint.
+        with m.If(in_done):
+            m.d.comb += self.in_complete.bit_select(token.endpoint, 1).eq(1)
+        with m.If(out_done):
+            m.d.comb += self.out_complete.bit_select(token.endpoint, 1).eq(1)
+
+        # Coalesce our DONE events, as configured by our coalesce register.
+        m.submodules.coalescer = coalescer = EventCoalescer(self._coalesce)
+        m.d.comb += [
+            coalescer.i    .eq(in_done | out_done),
+            self._done.i   .eq(coalescer.o),
+        ]
+
+        # connect events to irq line
+        m.d.comb += self.irq.eq(self._events.src.i)
+
+        return DomainRenamer({"sync": "usb", "wb": self._wb_domain})(m)
@@ -0,0 +1,284 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Gateware responder for standard control requests.
+
+Answers the standard requests used during enumeration directly from a descriptor ROM that's
+generated at elaboration time; leaving only class and vendor requests to be handled by firmware
+via our `eptri`-equivalent endpoints.
+"""
+
+from typing                                import Annotated
+
+from amaranth                              import *
+from amaranth.hdl.xfrm                     import DomainRenamer
+from amaranth.lib                          import wiring
+from amaranth.lib.wiring                   import In, Out, connect, flipped
+
+from amaranth_soc                          import csr, event
+
+from luna.gateware.usb.request             import SetupPacket
+from luna.gateware.usb.request.standard    import StandardRequestHandler
+from luna.gateware.usb.usb2.endpoint       import EndpointInterface
+
+from usb_protocol.emitters                 import DeviceDescriptorCollection
+from usb_protocol.types                    import USBRequestType, USBRequestRecipient, USBStandardRequests
+
+from ...csr                                import check_data_width
+
+
+class Peripheral(wiring.Component):
+    """ Standard request responder for our `eptri`-equivalent interface.
+
+    Handles the following standard requests on endpoint zero entirely in gateware:
+
+    - GET_DESCRIPTOR and GET_STATUS, when directed at the device;
+    - SET_ADDRESS; and
+    - SET_CONFIGURATION and GET_CONFIGURATION.
+
+    All other requests -- including standard requests directed at interfaces or endpoints -- are
+    left to be handled by firmware, as usual.
+
+    The responder should be added to the USB device alongside an ``ep_control.Peripheral``, which
+    continues to acknowledge every SETUP packet. Its ``ep0_handled`` output should be connected to the
+    ``ep0_handled`` inputs of the ``ep_control``, ``ep_in`` and ``ep_out`` peripherals; which then ignore
+    endpoint zero for the duration of any request handled in gateware.
+
+    Attributes
+    ----------
+
+    interface: EndpointInterface
+        Our primary interface to the core USB device hardware.
+    ep0_handled: Signal(), output
+        High while the current control request is being handled in gateware.
+    """
+
+    class Status(csr.Register, access="r"):
+        """ Status register
+
+            address:       Holds the current device's active USB address.
+            configuration: Holds the current device's active configuration.
+        """
+        address       : csr.Field(csr.action.R,       unsigned(7))
+        _0            : csr.Field(csr.action.ResRAW0, unsigned(1))
+        configuration : csr.Field(csr.action.R,       unsigned(8))
+
+
+    def __init__(self, descriptors: DeviceDescriptorCollection, max_packet_size=64, avoid_blockram=None,
+                 csr_data_width=8):
+        """
+        Parameters
+        ----------
+            descriptors: DeviceDescriptorCollection
+                The collection of descriptors to be served in response to GET_DESCRIPTOR requests.
+            max_packet_size: int, optional
+                The maximum packet size for endpoint zero.
+            avoid_blockram: bool, optional
+                If True, our descriptors will be placed in logic rather than in block RAM.
+            csr_data_width: int, optional
+                The data width of our CSR bus; one of 8, 16 or 32. Wider buses let registers wider
+                than a byte be accessed in fewer bus cycles.
+        """
+        check_data_width(csr_data_width)
+        self._descriptors     = descriptors
+        self._max_packet_size = max_packet_size
+        self._avoid_blockram  = avoid_blockram
+
+        # I/O port   FIXME ambiguity - private or signature ?
+        self.interface = EndpointInterface()
+
+        # registers
+        regs = csr.Builder(addr_width=3, data_width=csr_data_width)
+        self._status = regs.add("status", self.Status())
+        self._bridge = csr.Bridge(regs.as_memory_map())
+
+        # events
+        EventSource = Annotated[event.Source, "Indicates that the host has selected a new configuration, via a SET_CONFIGURATION request."]
+        self._configured = EventSource(trigger="rise", path=("configured",))
+        event_map = event.EventMap()
+        event_map.add(self._configured)
+        self._events = csr.event.EventMonitor(event_map, data_width=csr_data_width)
+
+        # csr decoder
+        self._decoder = csr.Decoder(addr_width=4, data_width=csr_data_width)
+        self._decoder.add(self._bridge.bus)
+        self._decoder.add(self._events.bus, name="ev")
+
+        super().__init__({
+            "bus":         Out(self._decoder.bus.signature),
+            "irq":         Out(unsigned(1)),
+            "ep0_handled": Out(unsigned(1)),
+        })
+        self.bus.memory_map = self._decoder.bus.memory_map
+
+
+    @staticmethod
+    def handles(setup):
+        """ Returns a condition that's true iff the given SETUP packet is handled in gateware. """
+
+        is_standard  = (setup.type == USBRequestType.STANDARD)
+        for_device   = (setup.recipient == USBRequestRecipient.DEVICE)
+        request      = setup.request
+
+        return is_standard & (
+            ((request == USBStandardRequests.GET_DESCRIPTOR)    & for_device) |
+            ((request == USBStandardRequests.GET_STATUS)        & for_device) |
+            (request  == USBStandardRequests.SET_ADDRESS)                     |
+            (request  == USBStandardRequests.SET_CONFIGURATION)               |
+            (request  == USBStandardRequests.GET_CONFIGURATION)
+        )
+
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules += [self._bridge, self._events, self._decoder]
+
+        # connect bus
+        connect(m, flipped(self.bus), self._decoder.bus)
+
+        # Shortcuts to our components.
+        interface      = self.interface
+        token          = self.interface.tokenizer
+        rx             = self.interface.rx
+
+        #
+        # SETUP packet capture.
+        #
+
+        # Capture the eight bytes of each SETUP packet directed at endpoint zero.
+        setup_bytes = Array(Signal(8, name=f"setup_byte_{i}") for i in range(8))
+        byte_count  = Signal(range(0, 9))
+
+        with m.If(token.new_token & token.is_setup):
+            m.d.usb += byte_count.eq(0)
+        with m.Elif(token.is_setup & (token.endpoint == 0) & rx.valid & rx.next & (byte_count < 8)):
+            m.d.usb += [
+                setup_bytes[byte_count[:3]]  .eq(rx.payload),
+                byte_count                   .eq(byte_count + 1),
+            ]
+
+        # Parse our captured bytes into a setup packet [USB2.0: 9.3].
+        setup = SetupPacket()
+        m.d.comb += [
+            Cat(setup.recipient, setup.type, setup.is_in_request)  .eq(setup_bytes[0]),
+            setup.request                                          .eq(setup_bytes[1]),
+            setup.value                                            .eq(Cat(setup_bytes[2], setup_bytes[3])),
+            setup.index                                            .eq(Cat(setup_bytes[4], setup_bytes[5])),
+            setup.length                                           .eq(Cat(setup_bytes[6], setup_bytes[7])),
+        ]
+
+        # Our SETUP packet is complete once it's been fully received, and the ``ep_control`` peripheral ACKs it.
+        setup_received = token.is_setup & (token.endpoint == 0) & interface.rx_ready_for_response & (byte_count == 8)
+        m.d.comb += setup.received.eq(setup_received)
+
+        # Claim each request we handle as soon as its SETUP packet has been captured; and release
+        # it once the next SETUP packet arrives.
+        claimed = Signal()
+        with m.If(token.new_token & token.is_setup):
+            m.d.usb += claimed.eq(0)
+        with m.Elif(byte_count == 8):
+            m.d.usb += claimed.eq(self.handles(setup))
+        m.d.comb += self.ep0_handled.eq(claimed)
+
+
+        #
+        # Request handler.
+        #
+
+        m.submodules.handler = handler = StandardRequestHandler(
+            self._descriptors,
+            max_packet_size = self._max_packet_size,
+            avoid_blockram  = self._avoid_blockram,
+            skiplist        = [lambda setup: ~self.handles(setup)],
+        )
+        request = handler.interface
+
+        m.d.comb += [
+            request.setup                 .eq(setup),
+            interface.tokenizer           .connect(request.tokenizer),
+            request.active_config         .eq(interface.active_config),
+            interface.handshakes_in       .connect(request.handshakes_in),
+        ]
+
+        # Only drive our outputs while we're handling a request.
+        with m.If(claimed):
+            m.d.comb += [
+                request.tx                    .attach(interface.tx),
+                interface.handshakes_out.ack  .eq(request.handshakes_out.ack),
+                interface.handshakes_out.nak  .eq(request.handshakes_out.nak),
+                interface.handshakes_out.stall.eq(request.handshakes_out.stall),
+                interface.tx_pid_toggle       .eq(request.tx_data_pid),
+
+                interface.address_changed     .eq(request.address_changed),
+                interface.new_address         .eq(request.new_address),
+                interface.config_changed      .eq(request.config_changed),
+                interface.new_config          .eq(request.new_config),
+            ]
+
+
+        #
+        # Control transfer stages [USB2.0: 8.5.3].
+        #
+
+        # We only handle requests that have either no data stage, or an IN data stage.
+        endpoint_targeted = (token.endpoint == 0)
+
+        def release_on_new_setup():
+            """ Returns to the SETUP stage once we're no longer handling the current request. """
+            with m.If(~claimed):
+                m.next = "SETUP"
+
+        with m.FSM(domain="usb"):
+
+            # SETUP -- wait for a SETUP packet that we're handling.
+            with m.State("SETUP"):
+                with m.If(setup_received & self.handles(setup)):
+                    with m.If(setup.length != 0):
+                        m.next = "DATA_IN"
+                    with m.Else():
+                        m.next = "STATUS_IN"
+
+            # DATA_IN -- the host is reading the response to our request.
+            with m.State("DATA_IN"):
+                release_on_new_setup()
+                with m.If(endpoint_targeted & token.is_in & token.ready_for_response):
+                    m.d.comb += request.data_requested.eq(1)
+
+                # Once we get an OUT token, we move on to the STATUS stage.
+                with m.If(endpoint_targeted & token.new_token & (token.is_out | token.is_ping)):
+                    m.next = "STATUS_OUT"
+
+            # STATUS_IN -- the host is expecting a ZLP to complete our request.
+            with m.State("STATUS_IN"):
+                release_on_new_setup()
+                with m.If(endpoint_targeted & token.is_in & token.ready_for_response):
+                    m.d.comb += request.status_requested.eq(1)
+
+            # STATUS_OUT -- the host is sending a ZLP to complete our request.
+            with m.State("STATUS_OUT"):
+                release_on_new_setup()
+                with m.If(endpoint_targeted & token.is_out & interface.rx_ready_for_response):
+                    m.d.comb += request.status_requested.eq(1)
+
+                # Respond to PING tokens [USB2.0: 8.5.1].
+                with m.If(endpoint_targeted & token.is_ping & token.ready_for_response):
+                    m.d.comb += interface.handshakes_out.ack.eq(1)
+
+
+        #
+        # Status registers.
+        #
+
+        m.d.comb += [
+            self._status.f.address.r_data        .eq(interface.active_address),
+            self._status.f.configuration.r_data  .eq(interface.active_config),
+            self._configured.i                   .eq(claimed & request.config_changed),
+        ]
+
+        # connect events to irq line
+        m.d.comb += self.irq.eq(self._events.src.i)
+
+        return DomainRenamer({"sync": "usb"})(m)
@@ -0,0 +1,169 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Gateware byte-stream bridge from the CPU to a USB ``IN`` endpoint.
+
+Lets firmware write console or log output into a deep FIFO, which is then sent to the host in
+gateware, at USB speed; typically as the data ``IN`` endpoint of a CDC-ACM serial port.
+"""
+
+from amaranth                                   import *
+from amaranth.hdl.xfrm                          import ResetInserter, DomainRenamer
+from amaranth.lib                               import wiring
+from amaranth.lib.fifo                          import SyncFIFOBuffered
+from amaranth.lib.wiring                        import In, connect, flipped
+
+from amaranth_soc                               import csr
+
+from luna.gateware.usb.usb2.endpoints.stream    import USBStreamInEndpoint
+
+from ...csr                                     import check_data_width
+
+
+class Peripheral(wiring.Component):
+    """ Serial bridge for our `eptri`-equivalent interface.
+
+    Bytes written to the TX_DATA register are queued in a FIFO, and sent to the host in response
+    to ``IN`` tokens on a single bulk endpoint, without further CPU intervention. Writes never
+    block; if the FIFO is full, the byte is discarded and the ``overrun`` flag is set.
+
+    The bridge only handles its data ``IN`` endpoint. Its descriptors, any CDC-ACM class requests,
+    and its notification and ``OUT`` endpoints are left to firmware and our other endpoints; an
+    ``ep_in.Peripheral`` used alongside the bridge should list the bridge's endpoint in its
+    ``excluded_endpoints``.
+
+    Like our endpoints, this peripheral operates in the ``usb`` domain.
+
+    Attributes
+    ----------
+
+    interface: EndpointInterface
+        Our primary interface to the core USB device hardware.
+    """
+
+    class Control(csr.Register, access="rw"):
+        """ Control register
+
+            enable: Set this bit to '1' to allow queued data to be sent to the host. While this bit is '0', IN
+                    tokens are NAK'd, and data accumulates in the FIFO; so firmware can wait for the host
+                    to open the port, e.g. by raising DTR.
+            flush:  If '1', queued data is sent as soon as the host asks for it, in packets as short as
+                    necessary. If '0', only full packets are sent.
+        """
+        enable : csr.Field(csr.action.RW,      unsigned(1))
+        flush  : csr.Field(csr.action.RW,      unsigned(1), init=1)
+        _0     : csr.Field(csr.action.ResRAW0, unsigned(6))
+
+    class TxData(csr.Register, access="w"):
+        """ TX data register
+
+            byte: Each write queues a byte to be sent to the host.
+        """
+        byte : csr.Field(csr.action.W, unsigned(8))
+
+    class Reset(csr.Register, access="w"):
+        """ Reset register
+
+            fifo: A write to this field discards any data that's yet to be sent.
+        """
+        fifo : csr.Field(csr.action.W,       unsigned(1))
+        _0   : csr.Field(csr.action.ResRAW0, unsigned(7))
+
+    class Status(csr.Register, access="r"):
+        """ Status register
+
+            level:   The number of bytes in the FIFO, yet to be sent.
+            full:    This value is `1` if the FIFO is full; in which case further writes are discarded.
+            overrun: This value is `1` if any bytes have been discarded since the last read of this register.
+        """
+        level   : csr.Field(csr.action.R,       unsigned(16))
+        full    : csr.Field(csr.action.R,       unsigned(1))
+        overrun : csr.Field(csr.action.R,       unsigned(1))
+        _0      : csr.Field(csr.action.ResRAW0, unsigned(14))
+
+
+    def __init__(self, *, endpoint_number, max_packet_size=512, fifo_depth=1024, csr_data_width=8):
+        """
+        Parameters
+        ----------
+            endpoint_number: int
+                The number of the endpoint our data is sent on.
+            max_packet_size: int, optional
+                The maximum packet size for our endpoint. Should match the value provided in the
+                relevant endpoint descriptor.
+            fifo_depth: int, optional
+                The number of bytes our FIFO can hold.
+            csr_data_width: int, optional
+                The data width of our CSR bus; one of 8, 16 or 32. Wider buses let registers wider
+                than a byte be accessed in fewer bus cycles.
+        """
+        if not isinstance(endpoint_number, int) or endpoint_number not in range(1, 16):
+            raise ValueError("Endpoint number must be an integer between 1 and 15, not {!r}"
+                             .format(endpoint_number))
+        if not isinstance(fifo_depth, int) or fifo_depth not in range(1, 2 ** 16):
+            raise ValueError("FIFO depth must be a positive integer less than 65536, not {!r}"
+                             .format(fifo_depth))
+        check_data_width(csr_data_width)
+
+        self._fifo_depth = fifo_depth
+
+        # Our stream endpoint handles our USB transactions; so its interface becomes ours.
+        self._endpoint = USBStreamInEndpoint(endpoint_number=endpoint_number, max_packet_size=max_packet_size)
+        self.interface = self._endpoint.interface
+
+        # registers
+        regs = csr.Builder(addr_width=3, data_width=csr_data_width)
+        self._control = regs.add("control", self.Control())
+        self._tx_data = regs.add("tx_data", self.TxData())
+        self._reset   = regs.add("reset",   self.Reset())
+        self._status  = regs.add("status",  self.Status())
+        self._bridge  = csr.Bridge(regs.as_memory_map())
+
+        super().__init__({
+            "bus":  In(csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)),
+        })
+        self.bus.memory_map = self._bridge.bus.memory_map
+
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.bridge   = self._bridge
+        m.submodules.endpoint = endpoint = self._endpoint
+
+        # connect bus
+        connect(m, flipped(self.bus), self._bridge.bus)
+
+        # Queue each byte written by the CPU, as long as we've room for it...
+        m.submodules.fifo = fifo = ResetInserter(self._reset.f.fifo.w_stb)(
+            SyncFIFOBuffered(width=8, depth=self._fifo_depth)
+        )
+        m.d.comb += [
+            fifo.w_data  .eq(self._tx_data.f.byte.w_data),
+            fifo.w_en    .eq(self._tx_data.f.byte.w_stb),
+        ]
+
+        # ... and note any bytes we've had to discard.
+        with m.If(self._tx_data.f.byte.w_stb & ~fifo.w_rdy):
+            m.d.sync += self._status.f.overrun.r_data.eq(1)
+        with m.Elif(self._status.f.overrun.r_stb):
+            m.d.sync += self._status.f.overrun.r_data.eq(0)
+
+        # Feed our FIFO's contents to our endpoint, as a continuous stream; while we're enabled.
+        enabled = self._control.f.enable.data
+        m.d.comb += [
+            endpoint.stream.valid    .eq(fifo.r_rdy & enabled),
+            endpoint.stream.payload  .eq(fifo.r_data),
+            fifo.r_en                .eq(endpoint.stream.valid & endpoint.stream.ready),
+            endpoint.flush           .eq(self._control.f.flush.data),
+            endpoint.discard         .eq(self._reset.f.fifo.w_stb),
+        ]
+
+        m.d.comb += [
+            self._status.f.level.r_data  .eq(fifo.level),
+            self._status.f.full.r_data   .eq(~fifo.w_rdy),
+        ]
+
+        return DomainRenamer({"sync": "usb"})(m)
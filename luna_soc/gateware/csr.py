@@ -0,0 +1,25 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Helpers shared by our CSR peripherals. """
+
+__all__ = ["check_data_width"]
+
+
+def check_data_width(csr_data_width):
+    """ Checks that a peripheral's CSR bus data width is one of 8, 16 or 32.
+
+    Wider buses let registers wider than a byte be accessed in fewer bus cycles; our peripherals
+    support any of the widths used by a CPU's byte, halfword and word accesses.
+
+    Raises
+    ------
+    ValueError
+        If ``csr_data_width`` is not one of 8, 16 or 32.
+    """
+    if csr_data_width not in (8, 16, 32):
+        raise ValueError("CSR data width must be 8, 16 or 32, not {!r}"
+                         .format(csr_data_width))
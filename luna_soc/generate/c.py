@@ -66,9 +66,10 @@ class LinkerScript():
 
 
 class Header():
-    def __init__(self, memory_map: MemoryMap, interrupts: InterruptMap):
+    def __init__(self, memory_map: MemoryMap, interrupts: InterruptMap, bus_latency: int = 0):
         self.memory_map      = memory_map
         self.interrupts      = interrupts
+        self.bus_latency     = bus_latency
 
     def generate(self, file=None, macro_name="SOC_RESOURCES", platform_name="Generic Platform"):
         """ Generate a C header file that simplifies access to the platform's resources.
@@ -115,6 +116,11 @@ class Header():
         emit(f"#define PLATFORM_NAME \"{platform_name}\"")
         emit("")
 
+        # Emit the number of cycles our bus decoder adds to each access, if it's pipelined.
+        if self.bus_latency:
+            emit(f"#define BUS_DECODER_LATENCY ({self.bus_latency})")
+            emit("")
+
         # Emit our constant data for all Minerva CPUs.
         # TODO Support vexriscv
         self._emit_minerva_basics(emit)
@@ -23,13 +23,15 @@ from ..gateware.cpu.ic    import InterruptMap
 def soc(fragment: wiring.Component) -> wiring.Component:
     if hasattr(fragment, "soc"):
         fragment = fragment.soc
-    if not hasattr(fragment, "wb_decoder"):
-        logging.warning("SoC designs need to have a 'wb_decoder' attribute.")
+    if not hasattr(fragment, "wb_decoder") and not hasattr(fragment, "wb_crossbar"):
+        logging.warning("SoC designs need to have a 'wb_decoder' or 'wb_crossbar' attribute.")
     if not hasattr(fragment, "interrupt_controller"):
         logging.warning("SoC designs need to have an 'interrupt_controller' attribute.")
     return fragment
 
 def memory_map(fragment: wiring.Component) -> MemoryMap:
+    if hasattr(fragment, "wb_crossbar"):
+        return fragment.wb_crossbar.memory_map
     return fragment.wb_decoder.bus.memory_map
 
 def interrupts(fragment: wiring.Component) -> InterruptMap:
@@ -38,6 +40,12 @@ def interrupts(fragment: wiring.Component) -> InterruptMap:
 def reset_addr(fragment: wiring.Component) -> MemoryMap:
     return fragment.cpu.reset_addr
 
+def bus_latency(fragment: wiring.Component) -> int:
+    """Number of cycles the SoC's bus decoder adds to each access; e.g. if it's pipelined."""
+    if hasattr(fragment, "wb_crossbar"):
+        return getattr(fragment.wb_crossbar, "latency", 0)
+    return getattr(fragment.wb_decoder, "latency", 0)
+
 
 # - soc introspections --------------------------------------------------------
 
@@ -22,8 +22,9 @@ from ..gateware.cpu.ic      import InterruptMap
 from .                      import introspect
 
 class SVD:
-    def __init__(self, memory_map: MemoryMap, interrupts: InterruptMap):
+    def __init__(self, memory_map: MemoryMap, interrupts: InterruptMap, bus_latency: int = 0):
         self.interrupts      = interrupts
+        self.bus_latency     = bus_latency
         self.csr_base        = introspect.csr_base(memory_map)
         self.csr_peripherals = introspect.csr_peripherals(memory_map)
         self.wb_peripherals  = introspect.wb_peripherals(memory_map)
@@ -104,6 +105,9 @@ class SVD:
 
         logging.debug("\n---------------\n")
 
+        # <vendorExtensions />
+        self._vendorExtensions(device)
+
         # generate output
         output = ElementTree.tostring(device, 'utf-8')
         output = minidom.parseString(output)
@@ -222,5 +226,14 @@ class SVD:
         return field
 
 
-    def _vendorExtensions(self):
-        pass
+    def _vendorExtensions(self, root):
+        # only emitted if our bus decoder adds cycles to each access, e.g. if it's pipelined
+        if not self.bus_latency:
+            return None
+
+        vendorExtensions = SubElement(root, "vendorExtensions")
+
+        el = SubElement(vendorExtensions, "busDecoderLatency")
+        el.text = "{:d}".format(self.bus_latency)
+
+        return vendorExtensions
@@ -115,7 +115,8 @@ def top_level_cli(fragment, *pos_args, **kwargs):
         soc        = introspect.soc(fragment)
         memory_map = introspect.memory_map(soc)
         interrupts = introspect.interrupts(soc)
-        c.Header(memory_map, interrupts).generate(file=None)
+        latency    = introspect.bus_latency(soc)
+        c.Header(memory_map, interrupts, latency).generate(file=None)
         sys.exit(0)
 
     # If we've been asked to generate C linker region info, generate -only- that.
@@ -145,7 +146,8 @@ def top_level_cli(fragment, *pos_args, **kwargs):
         soc        = introspect.soc(fragment)
         memory_map = introspect.memory_map(soc)
         interrupts = introspect.interrupts(soc)
-        svd.SVD(memory_map, interrupts).generate(file=None)
+        latency    = introspect.bus_latency(soc)
+        svd.SVD(memory_map, interrupts, latency).generate(file=None)
         sys.exit(0)
 
     # If we've been asked for the cpu reset address, generate _only_ that.
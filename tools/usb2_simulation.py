@@ -0,0 +1,1460 @@
+#
+# This file is part of LUNA.
+#
+# Copyright (c) 2025 Great Scott Gadgets <info@greatscottgadgets.com>
+# SPDX-License-Identifier: BSD-3-Clause
+
+""" Simulation harness for our `eptri`-equivalent endpoints.
+
+Provides a transaction-level model of a USB host, which drives an ``EndpointInterface`` directly
+from the Amaranth simulator; and a set of throughput benchmarks that run bulk, control and
+isochronous transfers against the ``ep_control``, ``ep_in`` and ``ep_out`` peripherals; and bulk
+transfers against the ``packetram`` peripheral, and through the ``dma`` peripheral; and the enumeration
+of a device whose standard requests are answered by the ``responder`` peripheral.
+
+The benchmarks can be run from the command line, and will exit with an error if any of them
+fails to reach a minimum throughput::
+
+    python tools/usb2_simulation.py --min-throughput 10000000
+
+Bus timing is modelled at the granularity of the 60 MHz ULPI clock; token, data and handshake
+packets, and the gaps between them, occupy the bus for roughly as long as they would on a real
+bus. Bit-stuffing isn't modelled; instead, the host never carries more bulk data packets in a
+(micro)frame than the specification allows, which caps sustained high-speed bulk transfers at
+~53.2 MB/s. The CPU is modelled as an ideal CSR initiator, so the results are an upper bound on
+the throughput that can be achieved by real firmware.
+"""
+
+import argparse
+import enum
+import sys
+
+from functools                          import partial
+
+from luna.gateware.usb.usb2             import USBSpeed
+from luna.gateware.usb.usb2.endpoint    import EndpointInterface, USBEndpointMultiplexer
+
+from luna_soc.gateware.core             import blockram
+from luna_soc.gateware.core.usb2        import dma, ep_control, ep_in, ep_out, packetram, responder, serial
+
+from amaranth                           import *
+from amaranth.lib.wiring                import connect
+from amaranth.sim                       import Simulator
+
+from amaranth_soc                       import wishbone
+
+from usb_protocol.emitters              import DeviceDescriptorCollection
+from usb_protocol.types                 import DescriptorTypes
+
+
+# Number of 60 MHz clock cycles taken to transmit a single byte, at each speed.
+_BYTE_CYCLES = {
+    USBSpeed.HIGH: 1,
+    USBSpeed.FULL: 40,
+    USBSpeed.LOW:  320,
+}
+
+# Number of byte times taken by each packet's SYNC and EOP fields.
+_PACKET_OVERHEAD = {
+    USBSpeed.HIGH: 5,
+    USBSpeed.FULL: 1,
+    USBSpeed.LOW:  1,
+}
+
+# Number of byte times between the end of one packet and the start of the next.
+_INTERPACKET_DELAY = {
+    USBSpeed.HIGH: 12,
+    USBSpeed.FULL: 2,
+    USBSpeed.LOW:  2,
+}
+
+# Number of 60 MHz clock cycles in each (micro)frame.
+_FRAME_CYCLES = {
+    USBSpeed.HIGH: 7500,
+    USBSpeed.FULL: 60000,
+    USBSpeed.LOW:  60000,
+}
+
+# Maximum number of max-size bulk data packets in each (micro)frame [USB2.0: Tables 5-9, 5-10]. Our
+# bus timing doesn't account for bit-stuffing, so we enforce these limits explicitly.
+_BULK_PACKETS_PER_FRAME = {
+    USBSpeed.HIGH: 13,
+    USBSpeed.FULL: 19,
+}
+
+
+class Response(enum.Enum):
+    """ The outcome of a single USB transaction, as seen by the host. """
+
+    ACK     = "ACK"
+    NAK     = "NAK"
+    STALL   = "STALL"
+    NYET    = "NYET"
+    #: No handshake is exchanged, as for isochronous transactions.
+    NONE    = "NONE"
+    #: The device failed to respond in time.
+    TIMEOUT = "TIMEOUT"
+
+
+class TransferStatistics:
+    """ Accumulates performance statistics for a sequence of transactions.
+
+    Attributes
+    ----------
+
+    bytes: int
+        The number of data bytes successfully transferred.
+    packets: int
+        The number of data packets successfully transferred.
+    attempts: int
+        The number of transactions issued; including those that were NAK'd.
+    naks: int
+        The number of transactions that were NAK'd.
+    latencies: list of int
+        For each packet, the number of cycles between the host's first attempt to transfer it,
+        and the completion of the transaction that succeeded.
+    """
+
+    def __init__(self, clock_frequency=60e6):
+        self.clock_frequency = clock_frequency
+        self.reset()
+
+
+    def reset(self):
+        """ Clears all of the statistics gathered so far. """
+        self.bytes     = 0
+        self.packets   = 0
+        self.attempts  = 0
+        self.naks      = 0
+        self.latencies = []
+        self.start     = None
+        self.end       = None
+
+
+    def record(self, *, start, end, length, attempts, naks, latency=None):
+        """ Records a successfully transferred packet, which occupied the bus from ``start`` to ``end``.
+        By default, its latency is assumed to be the time between the two. """
+        self.bytes     += length
+        self.packets   += 1
+        self.attempts  += attempts
+        self.naks      += naks
+        self.latencies.append(end - start if latency is None else latency)
+
+        if self.start is None:
+            self.start = start
+        self.end = end
+
+
+    @property
+    def cycles(self):
+        """ The number of cycles between the start of the first packet and the end of the last. """
+        if self.start is None:
+            return 0
+        return self.end - self.start
+
+    @property
+    def bytes_per_second(self):
+        if self.cycles == 0:
+            return 0.
+        return self.bytes * self.clock_frequency / self.cycles
+
+    @property
+    def nak_ratio(self):
+        if self.attempts == 0:
+            return 0.
+        return self.naks / self.attempts
+
+    @property
+    def mean_latency(self):
+        """ The mean per-packet latency, in seconds. """
+        if not self.latencies:
+            return 0.
+        return sum(self.latencies) / len(self.latencies) / self.clock_frequency
+
+    @property
+    def max_latency(self):
+        """ The worst-case per-packet latency, in seconds. """
+        if not self.latencies:
+            return 0.
+        return max(self.latencies) / self.clock_frequency
+
+
+    def __str__(self):
+        return ("{:10.3f} MB/s  {:6d} bytes  {:5d} packets  {:6.1%} NAK  "
+                "latency {:8.2f} us mean, {:8.2f} us max").format(
+            self.bytes_per_second / 1e6, self.bytes, self.packets, self.nak_ratio,
+            self.mean_latency * 1e6, self.max_latency * 1e6)
+
+
+class USBHostModel:
+    """ Transaction-level model of a USB host.
+
+    Drives the device side of an ``EndpointInterface`` -- as the LUNA ``USBDevice`` would -- from
+    a simulator testbench. Individual transactions can be issued with :meth:`in_transaction`,
+    :meth:`out_transaction`, :meth:`setup_transaction` and :meth:`ping_transaction`; and complete
+    transfers, which retry NAK'd transactions and track DATA PIDs, with the ``bulk_*``, ``control_*``
+    and ``isochronous_*`` methods.
+
+    Start-of-frame tokens are issued between transactions, once per (micro)frame. Bulk transfers carry
+no more data packets in each (micro)frame than the specification allows for max-size packets.
+
+    Attributes
+    ----------
+
+    interface: EndpointInterface
+        The interface being driven.
+    statistics: TransferStatistics
+        Statistics for every packet transferred by the ``bulk_*``, ``control_*`` and ``isochronous_*``
+        methods.
+    cycles: int
+        The number of clock cycles that have elapsed since the model was created.
+    data_pid: int
+        The DATA PID of the most recent data packet received; where 0 = DATA0, 1 = DATA1, 2 = DATA2
+        and 3 = MDATA.
+    """
+
+    def __init__(self, interface: EndpointInterface, *, speed=USBSpeed.HIGH, domain="usb",
+                 clock_frequency=60e6, response_timeout=1024, nak_retry_delay=0):
+        """
+        Parameters
+        ----------
+            interface: EndpointInterface
+                The interface to be driven.
+            speed: USBSpeed, optional
+                The speed at which the simulated bus operates.
+            domain: str, optional
+                The clock domain in which the interface operates.
+            clock_frequency: float, optional
+                The frequency of that clock domain, in Hz.
+            response_timeout: int, optional
+                The number of cycles to wait for a device to respond to an IN token.
+            nak_retry_delay: int, optional
+                The number of cycles to wait before retrying a NAK'd transaction.
+        """
+        if speed not in _BYTE_CYCLES:
+            raise ValueError("Speed must be a USBSpeed, not {!r}"
+                             .format(speed))
+
+        self.interface        = interface
+        self.speed            = speed
+        self.domain           = domain
+        self.response_timeout = response_timeout
+        self.nak_retry_delay  = nak_retry_delay
+
+        self.statistics       = TransferStatistics(clock_frequency)
+        self.cycles           = 0
+        self.data_pid         = None
+
+        self._microframe      = 0
+        self._next_frame      = 0
+        self._frame_packets   = 0
+        self._data_pid        = {}
+        self._ping_required   = set()
+
+
+    #
+    # Bus timing.
+    #
+
+    async def _tick(self, ctx, count=1):
+        if count > 0:
+            await ctx.tick(self.domain).repeat(count)
+            self.cycles += count
+
+    def _packet_cycles(self, length):
+        """ Returns the number of cycles taken to transmit a packet of ``length`` bytes, including its PID. """
+        return (_PACKET_OVERHEAD[self.speed] + length) * _BYTE_CYCLES[self.speed]
+
+    async def _interpacket_delay(self, ctx):
+        await self._tick(ctx, _INTERPACKET_DELAY[self.speed] * _BYTE_CYCLES[self.speed])
+
+
+    #
+    # Frames.
+    #
+
+    @property
+    def frame(self):
+        """ The current frame number. """
+        if self.speed == USBSpeed.HIGH:
+            return (self._microframe // 8) % 2048
+        return self._microframe % 2048
+
+    async def _start_of_frame(self, ctx):
+        tokenizer = self.interface.tokenizer
+
+        await self._tick(ctx, self._packet_cycles(3))
+        ctx.set(tokenizer.frame, self.frame)
+        ctx.set(tokenizer.new_frame, 1)
+        await self._tick(ctx)
+        ctx.set(tokenizer.new_frame, 0)
+        await self._interpacket_delay(ctx)
+
+        self._microframe    += 1
+        self._frame_packets  = 0
+
+    async def _start_frame_if_due(self, ctx):
+        """ Issues a start-of-frame token, if one is due. """
+        if self.cycles >= self._next_frame:
+            self._next_frame += _FRAME_CYCLES[self.speed] * ((self.cycles - self._next_frame) // _FRAME_CYCLES[self.speed] + 1)
+            await self._start_of_frame(ctx)
+
+    async def _start_bulk_transaction(self, ctx):
+        """ Issues a start-of-frame token, if one is due; and waits for the next (micro)frame, if the
+        current one has already carried as many bulk data packets as it can. """
+        await self._start_frame_if_due(ctx)
+        if self._frame_packets >= _BULK_PACKETS_PER_FRAME.get(self.speed, self._frame_packets + 1):
+            await self.wait_for_frame(ctx)
+
+    async def wait_for_frame(self, ctx):
+        """ Waits for the start of the next (micro)frame, and issues its start-of-frame token. """
+        await self._tick(ctx, max(self._next_frame - self.cycles, 0))
+        await self._start_frame_if_due(ctx)
+
+
+    #
+    # Transactions.
+    #
+
+    async def _token(self, ctx, endpoint, kind):
+        tokenizer = self.interface.tokenizer
+
+        await self._tick(ctx, self._packet_cycles(3))
+        ctx.set(tokenizer.endpoint, endpoint)
+        for name in ("in", "out", "setup", "ping"):
+            ctx.set(getattr(tokenizer, "is_" + name), name == kind)
+        ctx.set(tokenizer.new_token, 1)
+        await self._tick(ctx)
+        ctx.set(tokenizer.new_token, 0)
+
+    async def _handshake(self, ctx, response):
+        """ Sends a handshake packet to the device. """
+        handshakes_in = self.interface.handshakes_in
+
+        await self._interpacket_delay(ctx)
+        if response == Response.ACK:
+            ctx.set(handshakes_in.ack, 1)
+        await self._tick(ctx)
+        ctx.set(handshakes_in.ack, 0)
+        await self._tick(ctx, self._packet_cycles(0) - 1)
+
+    def _sample_handshake(self, ctx):
+        """ Returns the handshake being driven by the device, if any. """
+        handshakes_out = self.interface.handshakes_out
+
+        if ctx.get(handshakes_out.stall):
+            return Response.STALL
+        if ctx.get(handshakes_out.nak):
+            return Response.NAK
+        if ctx.get(handshakes_out.nyet):
+            return Response.NYET
+        if ctx.get(handshakes_out.ack):
+            return Response.ACK
+        return None
+
+    async def in_transaction(self, ctx, endpoint, *, isochronous=False):
+        """ Issues a single IN transaction.
+
+        Returns a ``(response, data)`` tuple; where ``data`` is a list of the bytes received, or ``None``
+        if no data packet was received. The host ACKs every data packet it receives, unless the
+        transaction is isochronous.
+        """
+        tx = self.interface.tx
+
+        await self._token(ctx, endpoint, "in")
+        await self._interpacket_delay(ctx)
+
+        # Let the device respond to our token...
+        ctx.set(self.interface.tokenizer.ready_for_response, 1)
+        response = self._sample_handshake(ctx)
+        if response is not None:
+            await self._tick(ctx)
+            ctx.set(self.interface.tokenizer.ready_for_response, 0)
+            await self._tick(ctx, self._packet_cycles(0) - 1)
+            return response, None
+
+        # ... and then receive its data packet.
+        data    = []
+        waited  = 0
+        while True:
+            if ctx.get(tx.valid):
+                self.data_pid = ctx.get(self.interface.tx_pid_toggle)
+
+                # A packet that ends without ever starting is a zero-length packet.
+                if not data and ctx.get(tx.last) and not ctx.get(tx.first):
+                    await self._tick(ctx)
+                    break
+
+                data.append(ctx.get(tx.payload))
+                last = ctx.get(tx.last)
+
+                ctx.set(tx.ready, 1)
+                await self._tick(ctx)
+                ctx.set(tx.ready, 0)
+                ctx.set(self.interface.tokenizer.ready_for_response, 0)
+                await self._tick(ctx, _BYTE_CYCLES[self.speed] - 1)
+
+                if last:
+                    break
+
+            elif waited >= self.response_timeout:
+                ctx.set(self.interface.tokenizer.ready_for_response, 0)
+                return Response.TIMEOUT, None
+
+            else:
+                await self._tick(ctx)
+                ctx.set(self.interface.tokenizer.ready_for_response, 0)
+                waited += 1
+
+        ctx.set(self.interface.tokenizer.ready_for_response, 0)
+
+        # Account for the PID, CRC and framing of the data packet; and then acknowledge it.
+        await self._tick(ctx, self._packet_cycles(2))
+        if isochronous:
+            return Response.NONE, data
+
+        await self._handshake(ctx, Response.ACK)
+        return Response.ACK, data
+
+    async def _data_out(self, ctx, endpoint, data, *, kind, pid, corrupt=False):
+        interface = self.interface
+        rx        = interface.rx
+
+        await self._token(ctx, endpoint, kind)
+        await self._interpacket_delay(ctx)
+
+        # Send our data packet...
+        ctx.set(interface.rx_pid_toggle, pid)
+        await self._tick(ctx, (_PACKET_OVERHEAD[self.speed] + 1) * _BYTE_CYCLES[self.speed])
+        ctx.set(rx.valid, 1)
+        for byte in data:
+            ctx.set(rx.next, 1)
+            ctx.set(rx.payload, byte)
+            await self._tick(ctx)
+            ctx.set(rx.next, 0)
+            await self._tick(ctx, _BYTE_CYCLES[self.speed] - 1)
+        await self._tick(ctx, 2 * _BYTE_CYCLES[self.speed])
+        ctx.set(rx.valid, 0)
+
+        # If our packet was corrupted, the device's receiver reports a CRC mismatch; and the device
+        # never gets to respond.
+        if corrupt:
+            ctx.set(interface.rx_invalid, 1)
+            await self._tick(ctx)
+            ctx.set(interface.rx_invalid, 0)
+            await self._tick(ctx, self.response_timeout)
+            return None
+
+        ctx.set(interface.rx_complete, 1)
+        await self._tick(ctx)
+        ctx.set(interface.rx_complete, 0)
+
+        # ... and collect the device's handshake.
+        await self._interpacket_delay(ctx)
+        ctx.set(interface.rx_ready_for_response, 1)
+        response = self._sample_handshake(ctx)
+        await self._tick(ctx)
+        ctx.set(interface.rx_ready_for_response, 0)
+        await self._tick(ctx, self._packet_cycles(0) - 1)
+
+        return response
+
+    async def out_transaction(self, ctx, endpoint, data, *, pid, isochronous=False, corrupt=False):
+        """ Issues a single OUT transaction, with the given DATA PID toggle; and returns the device's response.
+
+        If ``corrupt`` is set, the data packet is received with a bad CRC; as though it were damaged on the bus.
+        """
+        response = await self._data_out(ctx, endpoint, data, kind="out", pid=pid, corrupt=corrupt)
+        if isochronous:
+            return Response.NONE
+        return response if response is not None else Response.TIMEOUT
+
+    async def setup_transaction(self, ctx, endpoint, data):
+        """ Issues a single SETUP transaction; and returns the device's response. """
+        response = await self._data_out(ctx, endpoint, data, kind="setup", pid=0)
+        return response if response is not None else Response.TIMEOUT
+
+    async def ping_transaction(self, ctx, endpoint):
+        """ Issues a single PING transaction; and returns the device's response. """
+        await self._token(ctx, endpoint, "ping")
+        await self._interpacket_delay(ctx)
+
+        ctx.set(self.interface.tokenizer.ready_for_response, 1)
+        response = self._sample_handshake(ctx)
+        await self._tick(ctx)
+        ctx.set(self.interface.tokenizer.ready_for_response, 0)
+        await self._tick(ctx, self._packet_cycles(0) - 1)
+
+        return response if response is not None else Response.TIMEOUT
+
+
+    #
+    # Transfers.
+    #
+
+    async def _packet_in(self, ctx, endpoint):
+        """ Receives a single packet, retrying until it isn't NAK'd. """
+        start    = self.cycles
+        attempts = 0
+        naks     = 0
+
+        while True:
+            await self._start_bulk_transaction(ctx)
+            response, data = await self.in_transaction(ctx, endpoint)
+            attempts += 1
+
+            if response == Response.ACK:
+                self._frame_packets += 1
+                break
+            if response != Response.NAK:
+                raise RuntimeError("IN transaction on endpoint {} failed with {}"
+                                   .format(endpoint, response.name))
+            naks += 1
+            await self._tick(ctx, self.nak_retry_delay)
+
+        self._data_pid[endpoint, "in"] = not self._data_pid.get((endpoint, "in"), 0)
+        self.statistics.record(start=start, end=self.cycles, length=len(data), attempts=attempts, naks=naks)
+        return data
+
+    async def _packet_out(self, ctx, endpoint, data, *, corrupt=False):
+        """ Sends a single packet, retrying until it isn't NAK'd. At high speed, NAK'd and NYET'd
+        packets are followed by PING transactions, as per [USB2.0: 8.5.1]. If ``corrupt`` is set,
+        the packet's first attempt is received with a bad CRC, and times out. """
+        start    = self.cycles
+        attempts = 0
+        naks     = 0
+
+        if corrupt:
+            await self._start_bulk_transaction(ctx)
+            pid      = self._data_pid.get((endpoint, "out"), 0)
+            damaged  = [byte ^ 0xff for byte in data]
+            response = await self.out_transaction(ctx, endpoint, damaged, pid=pid, corrupt=True)
+            attempts += 1
+            self._frame_packets += 1
+            if response != Response.TIMEOUT:
+                raise RuntimeError("Corrupted OUT transaction on endpoint {} was answered with {}"
+                                   .format(endpoint, response.name))
+
+        while True:
+            await self._start_frame_if_due(ctx)
+
+            if (self.speed == USBSpeed.HIGH) and (endpoint in self._ping_required):
+                response = await self.ping_transaction(ctx, endpoint)
+                attempts += 1
+                if response == Response.NAK:
+                    naks += 1
+                    await self._tick(ctx, self.nak_retry_delay)
+                    continue
+                if response != Response.ACK:
+                    raise RuntimeError("PING transaction on endpoint {} failed with {}"
+                                       .format(endpoint, response.name))
+                self._ping_required.discard(endpoint)
+
+            await self._start_bulk_transaction(ctx)
+            pid      = self._data_pid.get((endpoint, "out"), 0)
+            response = await self.out_transaction(ctx, endpoint, data, pid=pid)
+            attempts += 1
+            self._frame_packets += 1
+
+            if response in (Response.ACK, Response.NYET):
+                if response == Response.NYET:
+                    self._ping_required.add(endpoint)
+                break
+            if response != Response.NAK:
+                raise RuntimeError("OUT transaction on endpoint {} failed with {}"
+                                   .format(endpoint, response.name))
+            naks += 1
+            self._ping_required.add(endpoint)
+            await self._tick(ctx, self.nak_retry_delay)
+
+        self._data_pid[endpoint, "out"] = not pid
+        self.statistics.record(start=start, end=self.cycles, length=len(data), attempts=attempts, naks=naks)
+
+    async def bulk_in(self, ctx, endpoint, length, *, max_packet_size):
+        """ Performs a bulk IN transfer of up to ``length`` bytes; and returns the data received. """
+        data = []
+        while len(data) < length:
+            packet = await self._packet_in(ctx, endpoint)
+            data.extend(packet)
+            if len(packet) < max_packet_size:
+                break
+        return data
+
+    async def stream_in(self, ctx, endpoint, length):
+        """ Reads packets from a streaming bulk endpoint until ``length`` bytes have been received; as
+        a serial driver would, short packets don't end the stream. Returns the data received. """
+        data = []
+        while len(data) < length:
+            data.extend(await self._packet_in(ctx, endpoint))
+        return data
+
+    async def bulk_out(self, ctx, endpoint, data, *, max_packet_size, corrupt_every=0):
+        """ Performs a bulk OUT transfer of ``data``. If ``corrupt_every`` is non-zero, the first attempt
+        to send every ``corrupt_every``-th packet is corrupted. """
+        for index, offset in enumerate(range(0, len(data), max_packet_size)):
+            corrupt = bool(corrupt_every) and (index % corrupt_every == corrupt_every - 1)
+            await self._packet_out(ctx, endpoint, data[offset:offset + max_packet_size], corrupt=corrupt)
+
+    async def _setup(self, ctx, setup):
+        await self._start_frame_if_due(ctx)
+        response = await self.setup_transaction(ctx, 0, setup)
+        if response != Response.ACK:
+            raise RuntimeError("SETUP transaction failed with {}"
+                               .format(response.name))
+
+        # The data and status stages of a control transfer always begin with DATA1 [USB2.0: 8.5.3].
+        self._data_pid[0, "in"]  = 1
+        self._data_pid[0, "out"] = 1
+        self._ping_required.discard(0)
+
+    async def control_in(self, ctx, setup, *, max_packet_size=64):
+        """ Performs a control transfer with an IN data stage; and returns the data received. """
+        await self._setup(ctx, setup)
+        length = setup[6] | (setup[7] << 8)
+        data   = await self.bulk_in(ctx, 0, length, max_packet_size=max_packet_size) if length else []
+        await self._packet_out(ctx, 0, [])
+        return data
+
+    async def control_out(self, ctx, setup, data=(), *, max_packet_size=64):
+        """ Performs a control transfer with an optional OUT data stage. """
+        await self._setup(ctx, setup)
+        await self.bulk_out(ctx, 0, list(data), max_packet_size=max_packet_size)
+        await self._packet_in(ctx, 0)
+
+    async def isochronous_in(self, ctx, endpoint, *, mult=1):
+        """ Performs the isochronous IN transactions for the next (micro)frame; and returns a list of
+        the packets received.
+
+        Up to ``mult`` transactions are issued; stopping early once a DATA0 packet is received, which
+        indicates the device has no more data for this (micro)frame [USB2.0: 5.9.2].
+        """
+        await self.wait_for_frame(ctx)
+        frame_start = self._next_frame - _FRAME_CYCLES[self.speed]
+
+        packets = []
+        for _ in range(mult):
+            start = self.cycles
+            response, data = await self.in_transaction(ctx, endpoint, isochronous=True)
+            if data is None:
+                break
+
+            # Each isochronous packet occupies its whole (micro)frame.
+            packets.append(data)
+            self.statistics.record(start=frame_start, end=self._next_frame, length=len(data), attempts=1,
+                naks=0, latency=self.cycles - start)
+
+            if self.data_pid == 0:
+                break
+
+        return packets
+
+    async def isochronous_out(self, ctx, endpoint, packets):
+        """ Performs the isochronous OUT transactions for the next (micro)frame; sending each of the
+        given packets, with the DATA PIDs required by [USB2.0: 5.9.2].
+        """
+        await self.wait_for_frame(ctx)
+        frame_start = self._next_frame - _FRAME_CYCLES[self.speed]
+
+        for index, data in enumerate(packets):
+            start = self.cycles
+
+            # A single packet is sent as DATA0; otherwise, every packet but the last is sent as MDATA,
+            # and the last indicates how many packets were sent. Our endpoints only see the PID's
+            # most significant bit.
+            if index != len(packets) - 1:
+                pid = 0b1111
+            else:
+                pid = (0b0011, 0b1011, 0b0111)[len(packets) - 1]
+            await self.out_transaction(ctx, endpoint, data, pid=pid >> 3, isochronous=True)
+
+            # Each isochronous packet occupies its whole (micro)frame.
+            self.statistics.record(start=frame_start, end=self._next_frame, length=len(data), attempts=1,
+                naks=0, latency=self.cycles - start)
+
+
+#
+# Benchmarks.
+#
+
+class CSRDriver:
+    """ Accesses the registers of a peripheral by name, from a simulator testbench. """
+
+    def __init__(self, peripheral, *, domain="usb"):
+        self._bus       = peripheral.bus
+        self._domain    = domain
+        self._registers = {}
+
+        for resource in peripheral.bus.memory_map.all_resources():
+            name = ".".join("_".join(part) for part in resource.path)
+            self._registers[name] = resource
+
+    def _resource(self, name):
+        try:
+            return self._registers[name]
+        except KeyError:
+            raise ValueError("Unknown register {!r}; expected one of {}"
+                             .format(name, ", ".join(self._registers))) from None
+
+    async def read(self, ctx, name):
+        resource = self._resource(name)
+        value    = 0
+        for index, address in enumerate(range(resource.start, resource.end)):
+            ctx.set(self._bus.addr, address)
+            ctx.set(self._bus.r_stb, 1)
+            await ctx.tick(self._domain)
+            ctx.set(self._bus.r_stb, 0)
+            value |= ctx.get(self._bus.r_data) << (index * len(self._bus.r_data))
+        return value
+
+    async def write(self, ctx, name, value):
+        resource = self._resource(name)
+        width    = len(self._bus.w_data)
+        for index, address in enumerate(range(resource.start, resource.end)):
+            ctx.set(self._bus.addr, address)
+            ctx.set(self._bus.w_data, (value >> (index * width)) & ((1 << width) - 1))
+            ctx.set(self._bus.w_stb, 1)
+            await ctx.tick(self._domain)
+        ctx.set(self._bus.w_stb, 0)
+
+        # Give our write a cycle to take effect before our next access; as a bus bridge would.
+        await ctx.tick(self._domain)
+
+    async def write_burst(self, ctx, name, values):
+        """ Writes each of ``values`` to register ``name`` in back-to-back bus cycles; as a pipelined
+        bus bridge would, when the CPU issues a run of stores. """
+        resource = self._resource(name)
+        width    = len(self._bus.w_data)
+        for value in values:
+            for index, address in enumerate(range(resource.start, resource.end)):
+                ctx.set(self._bus.addr, address)
+                ctx.set(self._bus.w_data, (value >> (index * width)) & ((1 << width) - 1))
+                ctx.set(self._bus.w_stb, 1)
+                await ctx.tick(self._domain)
+        ctx.set(self._bus.w_stb, 0)
+        await ctx.tick(self._domain)
+
+    def field(self, name, value, field):
+        """ Extracts the value of ``field`` from a value read from register ``name``. """
+        offset = 0
+        for path, action in self._resource(name).resource:
+            width = Shape.cast(action.port.shape).width
+            if path == (field,):
+                return (value >> offset) & ((1 << width) - 1)
+            offset += width
+        raise ValueError("Register {!r} has no field {!r}"
+                         .format(name, field))
+
+
+class _EptriHarness(Elaboratable):
+    """ Our `eptri`-equivalent endpoints, sharing a single endpoint interface. """
+
+    def __init__(self, *, max_packet_size, in_queue_depth=1, out_queue_depth=1, nyet=False, serial_endpoint=None,
+                 in_csr_data_width=8, descriptors=None):
+        self.ep_control  = ep_control.Peripheral()
+        self.ep_in       = ep_in.Peripheral(max_packet_size=max_packet_size, queue_depth=in_queue_depth,
+                                            excluded_endpoints=() if serial_endpoint is None else (serial_endpoint,),
+                                            csr_data_width=in_csr_data_width)
+        self.ep_out      = ep_out.Peripheral(max_packet_size=max_packet_size, queue_depth=out_queue_depth,
+                                             nyet=nyet)
+        self.peripherals = [self.ep_control, self.ep_in, self.ep_out]
+
+        # If requested, add a serial bridge alongside our endpoints.
+        if serial_endpoint is not None:
+            self.serial  = serial.Peripheral(endpoint_number=serial_endpoint, max_packet_size=max_packet_size)
+            self.peripherals.append(self.serial)
+
+        # If we're given descriptors, answer standard requests from them in gateware.
+        self.responder   = None
+        if descriptors is not None:
+            self.responder = responder.Peripheral(descriptors)
+            self.peripherals.append(self.responder)
+
+        self.multiplexer = USBEndpointMultiplexer()
+        for peripheral in self.peripherals:
+            self.multiplexer.add_interface(peripheral.interface)
+        self.interface   = self.multiplexer.shared
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules += self.peripherals
+        m.submodules.multiplexer = self.multiplexer
+
+        # Like LUNA's device, our multiplexer doesn't carry NYET handshakes; so we forward them ourselves,
+        # as our ``usb2.device.USBDevice`` does. Only our OUT endpoint issues them.
+        m.d.comb += self.interface.handshakes_out.nyet.eq(self.ep_out.interface.handshakes_out.nyet)
+
+        # Requests answered by our responder are hidden from our other endpoint zero handlers.
+        if self.responder is not None:
+            for peripheral in (self.ep_control, self.ep_in, self.ep_out):
+                m.d.comb += peripheral.ep0_handled.eq(self.responder.ep0_handled)
+
+        # Apply any changes to our address and configuration; as a ``USBDevice`` would.
+        with m.If(self.interface.address_changed):
+            m.d.usb += self.interface.active_address.eq(self.interface.new_address)
+        with m.If(self.interface.config_changed):
+            m.d.usb += self.interface.active_config.eq(self.interface.new_config)
+        return m
+
+
+class WishboneDriver:
+    """ Accesses a Wishbone target one word at a time, from a simulator testbench. """
+
+    def __init__(self, bus, *, domain="usb"):
+        self._bus    = bus
+        self._domain = domain
+
+    async def _cycle(self, ctx, address, *, we, value=0):
+        ctx.set(self._bus.adr, address >> 2)
+        ctx.set(self._bus.dat_w, value)
+        ctx.set(self._bus.sel, 0b1111)
+        ctx.set(self._bus.we, we)
+        ctx.set(self._bus.cyc, 1)
+        ctx.set(self._bus.stb, 1)
+        await ctx.tick(self._domain).until(self._bus.ack)
+        data = ctx.get(self._bus.dat_r)
+        ctx.set(self._bus.cyc, 0)
+        ctx.set(self._bus.stb, 0)
+        await ctx.tick(self._domain)
+        return data
+
+    async def read(self, ctx, address):
+        """ Reads the word at byte ``address``. """
+        return await self._cycle(ctx, address, we=0)
+
+    async def write(self, ctx, address, value):
+        """ Writes ``value`` to the word at byte ``address``. """
+        await self._cycle(ctx, address, we=1, value=value)
+
+
+class _PacketRAMHarness(Elaboratable):
+    """ Our zero-copy `eptri`-equivalent endpoints, sharing a single endpoint interface. The packet RAM's
+    Wishbone interface is in ``wb_domain``.
+    """
+
+    def __init__(self, *, size=4096, wb_domain="usb"):
+        self.ep_control  = ep_control.Peripheral()
+        self.packetram   = packetram.Peripheral(size=size, wb_domain=wb_domain)
+
+        self.multiplexer = USBEndpointMultiplexer()
+        for peripheral in (self.ep_control, self.packetram):
+            self.multiplexer.add_interface(peripheral.interface)
+        self.interface   = self.multiplexer.shared
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.ep_control  = self.ep_control
+        m.submodules.packetram   = self.packetram
+        m.submodules.multiplexer = self.multiplexer
+        return m
+
+
+class _DMAHarness(_EptriHarness):
+    """ Our `eptri`-equivalent endpoints, with a DMA engine that moves packets to and from a block RAM;
+    which the CPU shares via a Wishbone arbiter. The RAM and arbiter are in ``wb_domain``.
+    """
+
+    def __init__(self, *, max_packet_size, ram_size, in_queue_depth=1, out_queue_depth=1, init=(),
+                 wb_domain="usb"):
+        super().__init__(max_packet_size=max_packet_size, in_queue_depth=in_queue_depth,
+                         out_queue_depth=out_queue_depth)
+        self.wb_domain = wb_domain
+
+        self.dma     = dma.Peripheral(wb_domain=wb_domain)
+        self.ram     = blockram.Peripheral(size=ram_size, init=init)
+        self.arbiter = wishbone.Arbiter(addr_width=len(self.dma.wb_bus.adr), data_width=32, granularity=8,
+                                        features={"err", "cti", "bte"})
+        self.cpu_bus = wishbone.Interface(addr_width=len(self.dma.wb_bus.adr), data_width=32, granularity=8,
+                                          features={"err", "cti", "bte"}, path=("cpu_bus",))
+        self.arbiter.add(self.dma.wb_bus)
+        self.arbiter.add(self.cpu_bus)
+
+    def elaborate(self, platform):
+        m = super().elaborate(platform)
+        m.submodules.dma     = self.dma
+        m.submodules.ram     = DomainRenamer({"sync": self.wb_domain})(self.ram)
+        m.submodules.arbiter = DomainRenamer({"sync": self.wb_domain})(self.arbiter)
+
+        connect(m, self.dma.ep_in,  self.ep_in.dma)
+        connect(m, self.dma.ep_out, self.ep_out.dma)
+
+        # Our RAM doesn't decode addresses beyond its own size, and never signals an error.
+        bus = self.arbiter.bus
+        m.d.comb += [
+            self.ram.bus.adr    .eq(bus.adr),
+            self.ram.bus.dat_w  .eq(bus.dat_w),
+            self.ram.bus.sel    .eq(bus.sel),
+            self.ram.bus.cyc    .eq(bus.cyc),
+            self.ram.bus.stb    .eq(bus.stb),
+            self.ram.bus.we     .eq(bus.we),
+            self.ram.bus.cti    .eq(bus.cti),
+            self.ram.bus.bte    .eq(bus.bte),
+            bus.dat_r           .eq(self.ram.bus.dat_r),
+            bus.ack             .eq(self.ram.bus.ack),
+        ]
+        return m
+
+
+def _pattern(length, seed=0):
+    return [(seed + i * 7) & 0xff for i in range(length)]
+
+
+async def _load_in_packet(ctx, regs, endpoint, packet):
+    """ Loads a single packet into an ``ep_in.Peripheral``, once it has room for it. """
+    while regs.field("status", await regs.read(ctx, "status"), "full"):
+        pass
+
+    words = len(packet) // 4
+    for i in range(words):
+        await regs.write(ctx, "data_wide", int.from_bytes(bytes(packet[i * 4:i * 4 + 4]), "little"))
+    for byte in packet[words * 4:]:
+        await regs.write(ctx, "data", byte)
+    await regs.write(ctx, "endpoint", endpoint)
+
+
+async def _unload_out_packet(ctx, regs):
+    """ Waits for a packet to be received by an ``ep_out.Peripheral``, and returns its data. """
+    while True:
+        descriptor = await regs.read(ctx, "packet")
+        if regs.field("packet", descriptor, "valid"):
+            break
+
+    length = regs.field("packet", descriptor, "length")
+    data   = []
+    for _ in range((length + 3) // 4):
+        data.extend((await regs.read(ctx, "data_wide")).to_bytes(4, "little"))
+    return data[:length]
+
+
+def _run(harness, host_process, firmware_process, *, speed, timeout=10e-3, firmware_background=False):
+    """ Runs a benchmark until both its host and firmware processes have finished; and returns its
+    host's statistics. If ``firmware_background`` is set, the firmware process is abandoned once
+    the host has finished.
+    """
+    host = USBHostModel(harness.interface, speed=speed)
+    sim  = Simulator(harness)
+    sim.add_clock(1 / 60e6, domain="usb")
+
+    # Any SoC-side domain runs from a clock unrelated to our USB one.
+    sim.add_clock(1 / 50e6, domain="sync", if_exists=True)
+
+    async def host_testbench(ctx):
+        ctx.set(harness.interface.speed, speed)
+        await host_process(ctx, host)
+
+    async def firmware_testbench(ctx):
+        await firmware_process(ctx)
+
+    async def watchdog(ctx):
+        await ctx.delay(timeout)
+        raise RuntimeError("Benchmark did not complete within {} seconds of simulated time"
+                           .format(timeout))
+
+    sim.add_testbench(host_testbench)
+    sim.add_testbench(firmware_testbench, background=firmware_background)
+    sim.add_testbench(watchdog, background=True)
+    sim.run()
+
+    return host.statistics
+
+
+def benchmark_bulk_in(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, queue_depth=2):
+    """ Measures the throughput of a bulk IN transfer from an ``ep_in.Peripheral``. """
+    harness = _EptriHarness(max_packet_size=max_packet_size, in_queue_depth=queue_depth)
+    regs    = CSRDriver(harness.ep_in)
+    payload = _pattern(length)
+    result  = []
+
+    async def host_process(ctx, host):
+        result.extend(await host.bulk_in(ctx, 1, length, max_packet_size=max_packet_size))
+
+    async def firmware_process(ctx):
+        for offset in range(0, length, max_packet_size):
+            await _load_in_packet(ctx, regs, 1, payload[offset:offset + max_packet_size])
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("Bulk IN data mismatch")
+    return statistics
+
+
+def benchmark_transfer_bulk_in(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, queue_depth=2):
+    """ Measures the throughput of a bulk IN transfer loaded into an ``ep_in.Peripheral`` via its TRANSFER
+    register; writing a full queue's worth of packets at a time, in back-to-back 32-bit bus cycles. """
+    harness = _EptriHarness(max_packet_size=max_packet_size, in_queue_depth=queue_depth, in_csr_data_width=32)
+    regs    = CSRDriver(harness.ep_in)
+    payload = _pattern(length)
+    result  = []
+
+    async def host_process(ctx, host):
+        result.extend(await host.bulk_in(ctx, 1, length, max_packet_size=max_packet_size))
+
+    async def firmware_process(ctx):
+        await regs.write(ctx, "transfer", length | (1 << 16))
+        for offset in range(0, length, max_packet_size * queue_depth):
+            while await regs.read(ctx, "pending"):
+                pass
+            chunk = payload[offset:offset + max_packet_size * queue_depth]
+            words = len(chunk) // 4
+            await regs.write_burst(ctx, "data_wide",
+                [int.from_bytes(bytes(chunk[i * 4:i * 4 + 4]), "little") for i in range(words)])
+            await regs.write_burst(ctx, "data", chunk[words * 4:])
+        if regs.field("status", await regs.read(ctx, "status"), "discard"):
+            raise RuntimeError("Transfer IN data was discarded")
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("Transfer IN data mismatch")
+    return statistics
+
+
+def benchmark_bulk_out(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, queue_depth=2, nyet=False,
+                       corrupt_every=0):
+    """ Measures the throughput of a bulk OUT transfer to an ``ep_out.Peripheral``. """
+    harness = _EptriHarness(max_packet_size=max_packet_size, out_queue_depth=queue_depth, nyet=nyet)
+    regs    = CSRDriver(harness.ep_out)
+    payload = _pattern(length)
+    result  = []
+
+    async def host_process(ctx, host):
+        await host.bulk_out(ctx, 1, payload, max_packet_size=max_packet_size, corrupt_every=corrupt_every)
+
+    async def firmware_process(ctx):
+        await regs.write(ctx, "endpoint", 1)
+        await regs.write(ctx, "prime", 1)
+        await regs.write(ctx, "enable", 1)
+        while len(result) < length:
+            result.extend(await _unload_out_packet(ctx, regs))
+            if queue_depth == 1:
+                await regs.write(ctx, "enable", 1)
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("Bulk OUT data mismatch")
+    return statistics
+
+
+def benchmark_bulk_out_nyet(**kwargs):
+    """ Measures the throughput of a bulk OUT transfer to an ``ep_out.Peripheral`` that uses NYET flow control. """
+    return benchmark_bulk_out(nyet=True, **kwargs)
+
+
+def benchmark_bulk_out_errors(**kwargs):
+    """ Measures the throughput of a bulk OUT transfer to an ``ep_out.Peripheral``, when every third packet
+    first arrives with a bad CRC; and checks that the damaged packets' data is discarded. """
+    return benchmark_bulk_out(corrupt_every=3, **kwargs)
+
+
+def benchmark_serial_in(*, speed=USBSpeed.HIGH, length=4096, max_packet_size=512):
+    """ Measures the throughput of log output written to a ``serial.Peripheral``, one byte at a time. """
+    harness = _EptriHarness(max_packet_size=max_packet_size, serial_endpoint=3)
+    regs    = CSRDriver(harness.serial)
+    payload = _pattern(length)
+    result  = []
+
+    async def host_process(ctx, host):
+        result.extend(await host.stream_in(ctx, 3, length))
+
+    async def firmware_process(ctx):
+        await regs.write(ctx, "control", 0b11)
+        for byte in payload:
+            while regs.field("status", await regs.read(ctx, "status"), "full"):
+                pass
+            await regs.write(ctx, "tx_data", byte)
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("Serial IN data mismatch")
+    return statistics
+
+
+def benchmark_packetram_bulk_in(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, wb_domain="usb"):
+    """ Measures the throughput of a bulk IN transfer sent from a ``packetram.Peripheral``. """
+    harness = _PacketRAMHarness(wb_domain=wb_domain)
+    regs    = CSRDriver(harness.packetram)
+    ram     = WishboneDriver(harness.packetram.wb_bus, domain=wb_domain)
+    payload = _pattern(length)
+    result  = []
+
+    async def host_process(ctx, host):
+        result.extend(await host.bulk_in(ctx, 1, length, max_packet_size=max_packet_size))
+
+    async def firmware_process(ctx):
+        # Build each packet in place, alternating between two buffers; and queue it as soon as the
+        # previous one has been sent.
+        for index, offset in enumerate(range(0, length, max_packet_size)):
+            packet = payload[offset:offset + max_packet_size]
+            buffer = (index % 2) * max_packet_size
+            for i in range(0, len(packet), 4):
+                await ram.write(ctx, buffer + i, int.from_bytes(bytes(packet[i:i + 4]), "little"))
+            while regs.field("status", await regs.read(ctx, "status"), "in_pending") & (1 << 1):
+                pass
+            await regs.write(ctx, "in_buffer", buffer | (len(packet) << 16) | (1 << 28))
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("Packet RAM bulk IN data mismatch")
+    return statistics
+
+
+def benchmark_packetram_bulk_out(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, wb_domain="usb"):
+    """ Measures the throughput of a bulk OUT transfer received into a ``packetram.Peripheral``. """
+    harness = _PacketRAMHarness(wb_domain=wb_domain)
+    regs    = CSRDriver(harness.packetram)
+    ram     = WishboneDriver(harness.packetram.wb_bus, domain=wb_domain)
+    payload = _pattern(length)
+    result  = []
+
+    async def host_process(ctx, host):
+        await host.bulk_out(ctx, 1, payload, max_packet_size=max_packet_size)
+
+    async def firmware_process(ctx):
+        # Alternate between two buffers; arming the next one as soon as a packet arrives, and then
+        # parsing the received packet in place.
+        index = 0
+        await regs.write(ctx, "out_buffer", (max_packet_size << 16) | (1 << 28))
+        while len(result) < length:
+            complete = await regs.read(ctx, "complete")
+            if not regs.field("complete", complete, "valid"):
+                continue
+            index += 1
+            buffer = (index % 2) * max_packet_size
+            await regs.write(ctx, "out_buffer", buffer | (max_packet_size << 16) | (1 << 28))
+
+            received = regs.field("complete", complete, "length")
+            data     = []
+            for i in range(0, received, 4):
+                data.extend((await ram.read(ctx, max_packet_size - buffer + i)).to_bytes(4, "little"))
+            result.extend(data[:received])
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("Packet RAM bulk OUT data mismatch")
+    return statistics
+
+
+async def _dma_transfer(ctx, regs, *, address, length, endpoint=0, direction):
+    """ Runs a single transfer on a ``dma.Peripheral``, and returns the number of bytes it moved. """
+    await regs.write(ctx, "address", address)
+    await regs.write(ctx, "length", length)
+    await regs.write(ctx, "transfer", endpoint | (direction << 4))
+    while True:
+        status = await regs.read(ctx, "status")
+        if not regs.field("status", status, "busy"):
+            break
+    if regs.field("status", status, "error"):
+        raise RuntimeError("DMA transfer failed with a bus error")
+    return regs.field("status", status, "count")
+
+
+def benchmark_dma_bulk_in(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, queue_depth=2,
+                          wb_domain="usb"):
+    """ Measures the throughput of a bulk IN transfer loaded into an ``ep_in.Peripheral`` from RAM,
+    by a ``dma.Peripheral``. """
+    payload = _pattern(length)
+    words   = [int.from_bytes(bytes(payload[i:i + 4]), "little") for i in range(0, length, 4)]
+    harness = _DMAHarness(max_packet_size=max_packet_size, ram_size=1 << (length - 1).bit_length(),
+                          in_queue_depth=queue_depth, init=words, wb_domain=wb_domain)
+    regs    = CSRDriver(harness.dma)
+    result  = []
+
+    async def host_process(ctx, host):
+        result.extend(await host.bulk_in(ctx, 1, length, max_packet_size=max_packet_size))
+
+    async def firmware_process(ctx):
+        for offset in range(0, length, max_packet_size):
+            await _dma_transfer(ctx, regs, address=offset, length=min(max_packet_size, length - offset),
+                                endpoint=1, direction=1)
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("DMA bulk IN data mismatch")
+    return statistics
+
+
+def benchmark_dma_bulk_out(*, speed=USBSpeed.HIGH, length=8192, max_packet_size=512, queue_depth=2,
+                           wb_domain="usb"):
+    """ Measures the throughput of a bulk OUT transfer unloaded from an ``ep_out.Peripheral`` into RAM,
+    by a ``dma.Peripheral``. """
+    harness  = _DMAHarness(max_packet_size=max_packet_size, ram_size=1 << (length - 1).bit_length(),
+                           out_queue_depth=queue_depth, wb_domain=wb_domain)
+    regs     = CSRDriver(harness.dma)
+    regs_out = CSRDriver(harness.ep_out)
+    ram      = WishboneDriver(harness.cpu_bus, domain=wb_domain)
+    payload  = _pattern(length)
+    result   = []
+
+    async def host_process(ctx, host):
+        await host.bulk_out(ctx, 1, payload, max_packet_size=max_packet_size)
+
+    async def firmware_process(ctx):
+        await regs_out.write(ctx, "endpoint", 1)
+        await regs_out.write(ctx, "prime", 1)
+        await regs_out.write(ctx, "enable", 1)
+        received = 0
+        while received < length:
+            received += await _dma_transfer(ctx, regs, address=received, length=max_packet_size, direction=0)
+
+        # Once everything has arrived, read it back from RAM, through our CPU's side of the arbiter.
+        for address in range(0, length, 4):
+            result.extend((await ram.read(ctx, address)).to_bytes(4, "little"))
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if result != payload:
+        raise RuntimeError("DMA bulk OUT data mismatch")
+    return statistics
+
+
+def benchmark_control_in(*, speed=USBSpeed.HIGH, transfers=8, length=64, max_packet_size=64):
+    """ Measures the throughput of control transfers with an IN data stage, handled by firmware. """
+    harness   = _EptriHarness(max_packet_size=max_packet_size)
+    control   = CSRDriver(harness.ep_control)
+    regs_in   = CSRDriver(harness.ep_in)
+    regs_out  = CSRDriver(harness.ep_out)
+    # A GET_DESCRIPTOR(DEVICE) request for `length` bytes.
+    setup     = [0x80, 0x06, 0x00, 0x01, 0x00, 0x00, length & 0xff, length >> 8]
+    payload   = _pattern(length)
+    results   = []
+
+    async def host_process(ctx, host):
+        for _ in range(transfers):
+            results.append(await host.control_in(ctx, setup, max_packet_size=max_packet_size))
+
+    async def firmware_process(ctx):
+        sequence = 0
+        for _ in range(transfers):
+            # Wait for a new SETUP packet, and read it from the SETUP window.
+            while control.field("sequence", await control.read(ctx, "sequence"), "count") == sequence:
+                pass
+            sequence       = (sequence + 1) % 256
+            request_length = control.field("setup_high", await control.read(ctx, "setup_high"), "length")
+
+            # Prepare to receive the status stage...
+            await regs_out.write(ctx, "endpoint", 0)
+            await regs_out.write(ctx, "prime", 1)
+            await regs_out.write(ctx, "enable", 1)
+
+            # ... send our data stage; since we always return the full length requested, we never
+            # need to terminate it with a ZLP...
+            for offset in range(0, request_length, max_packet_size):
+                await _load_in_packet(ctx, regs_in, 0, payload[offset:offset + max_packet_size])
+
+            # ... and wait for the status stage to complete.
+            await _unload_out_packet(ctx, regs_out)
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if results != [payload] * transfers:
+        raise RuntimeError("Control IN data mismatch")
+    return statistics
+
+
+def _enumeration_descriptors():
+    """ Returns the descriptors of a simple device, with a single bulk endpoint in each direction. """
+    descriptors = DeviceDescriptorCollection()
+
+    with descriptors.DeviceDescriptor() as d:
+        d.idVendor           = 0x1209
+        d.idProduct          = 0x0001
+        d.iManufacturer      = "LUNA"
+        d.iProduct           = "Enumeration benchmark"
+        d.iSerialNumber      = "0123456789"
+        d.bNumConfigurations = 1
+
+    with descriptors.ConfigurationDescriptor() as c:
+        with c.InterfaceDescriptor() as i:
+            i.bInterfaceNumber = 0
+            with i.EndpointDescriptor() as e:
+                e.bEndpointAddress = 0x81
+                e.wMaxPacketSize   = 512
+            with i.EndpointDescriptor() as e:
+                e.bEndpointAddress = 0x01
+                e.wMaxPacketSize   = 512
+
+    return descriptors
+
+
+def benchmark_control_enumeration(*, speed=USBSpeed.HIGH, max_packet_size=64):
+    """ Measures the time taken to enumerate a device whose standard requests are answered by a
+    ``responder.Peripheral``; following the sequence of requests a typical host issues, and then
+    checking that a vendor request is still passed on to firmware. """
+    descriptors = _enumeration_descriptors()
+    harness     = _EptriHarness(max_packet_size=max_packet_size, descriptors=descriptors)
+    control     = CSRDriver(harness.ep_control)
+    regs_in     = CSRDriver(harness.ep_in)
+    regs_out    = CSRDriver(harness.ep_out)
+    status      = CSRDriver(harness.responder)
+    vendor_data = _pattern(16)
+    results     = []
+    expected    = []
+
+    def get_descriptor(kind, index, length, language=0):
+        return [0x80, 0x06, index, kind, language & 0xff, language >> 8, length & 0xff, length >> 8]
+
+    def descriptor(kind, index, length):
+        return list(descriptors.get_descriptor_bytes(kind, index))[:length]
+
+    configuration = descriptor(DescriptorTypes.CONFIGURATION, 0, 255)
+    total_length  = configuration[2] | (configuration[3] << 8)
+
+    # Each request, and the data we expect in response to it.
+    requests = [
+        (get_descriptor(DescriptorTypes.DEVICE, 0, 64),                  descriptor(DescriptorTypes.DEVICE, 0, 64)),
+        ([0x00, 0x05, 0x05, 0x00, 0x00, 0x00, 0x00, 0x00],               None),  # SET_ADDRESS(5)
+        (get_descriptor(DescriptorTypes.DEVICE, 0, 18),                  descriptor(DescriptorTypes.DEVICE, 0, 18)),
+        (get_descriptor(DescriptorTypes.CONFIGURATION, 0, 9),            configuration[:9]),
+        (get_descriptor(DescriptorTypes.CONFIGURATION, 0, total_length), configuration[:total_length]),
+        (get_descriptor(DescriptorTypes.STRING, 0, 255),                 descriptor(DescriptorTypes.STRING, 0, 255)),
+    ]
+    for index in range(1, 4):
+        requests.append((get_descriptor(DescriptorTypes.STRING, index, 255, language=0x0409),
+                         descriptor(DescriptorTypes.STRING, index, 255)))
+    requests += [
+        ([0x00, 0x09, 0x01, 0x00, 0x00, 0x00, 0x00, 0x00],               None),  # SET_CONFIGURATION(1)
+        ([0x80, 0x08, 0x00, 0x00, 0x00, 0x00, 0x01, 0x00],               [1]),   # GET_CONFIGURATION
+        ([0xc0, 0x01, 0x00, 0x00, 0x00, 0x00, len(vendor_data), 0x00],   vendor_data),
+    ]
+
+    async def host_process(ctx, host):
+        for setup, response in requests:
+            if response is None:
+                await host.control_out(ctx, setup, max_packet_size=max_packet_size)
+            else:
+                expected.append(response)
+                results.append(await host.control_in(ctx, setup, max_packet_size=max_packet_size))
+
+    async def firmware_process(ctx):
+        # Only our vendor request should ever reach firmware.
+        while control.field("sequence", await control.read(ctx, "sequence"), "count") == 0:
+            pass
+        setup = await control.read(ctx, "setup_low")
+        if control.field("setup_low", setup, "request_type") != 0xc0:
+            raise RuntimeError("Standard request was passed on to firmware")
+
+        await regs_out.write(ctx, "endpoint", 0)
+        await regs_out.write(ctx, "prime", 1)
+        await regs_out.write(ctx, "enable", 1)
+        await _load_in_packet(ctx, regs_in, 0, vendor_data)
+        await _unload_out_packet(ctx, regs_out)
+
+        # By now, the responder should have applied our address and configuration.
+        value = await status.read(ctx, "status")
+        if (status.field("status", value, "address"), status.field("status", value, "configuration")) != (5, 1):
+            raise RuntimeError("Responder did not apply SET_ADDRESS and SET_CONFIGURATION")
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed)
+    if results != expected:
+        raise RuntimeError("Enumeration data mismatch")
+    return statistics
+
+
+def benchmark_isochronous_in(*, speed=USBSpeed.HIGH, frames=4, max_packet_size=1024, mult=None):
+    """ Measures the throughput of an isochronous IN stream from an ``ep_in.Peripheral``; by default,
+    using a high-bandwidth endpoint at high speed. """
+    if mult is None:
+        mult = 3 if speed == USBSpeed.HIGH else 1
+
+    harness = _EptriHarness(max_packet_size=max_packet_size, in_queue_depth=2 * mult)
+    regs    = CSRDriver(harness.ep_in)
+    payload = [_pattern(max_packet_size, seed=n) for n in range(frames * mult)]
+    results = []
+
+    async def host_process(ctx, host):
+        # Give our firmware a frame to load its first packets.
+        await host.wait_for_frame(ctx)
+        for _ in range(frames):
+            results.extend(await host.isochronous_in(ctx, 1, mult=mult))
+
+    async def firmware_process(ctx):
+        await regs.write(ctx, "isochronous", 1 | (mult << 4))
+        for packet in payload:
+            await _load_in_packet(ctx, regs, 1, packet)
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed, timeout=(frames + 2) * 1e-3)
+    if results != payload:
+        raise RuntimeError("Isochronous IN data mismatch")
+    return statistics
+
+
+def benchmark_isochronous_out(*, speed=USBSpeed.HIGH, frames=4, max_packet_size=1024, mult=None):
+    """ Measures the throughput of an isochronous OUT stream to an ``ep_out.Peripheral``; by default,
+    using a high-bandwidth endpoint at high speed. """
+    if mult is None:
+        mult = 3 if speed == USBSpeed.HIGH else 1
+
+    harness = _EptriHarness(max_packet_size=max_packet_size, out_queue_depth=2 * mult)
+    regs    = CSRDriver(harness.ep_out)
+    payload = [_pattern(max_packet_size, seed=n) for n in range(frames * mult)]
+    results = []
+
+    async def host_process(ctx, host):
+        # Give our firmware a frame to prepare for our first packets.
+        await host.wait_for_frame(ctx)
+        for frame in range(frames):
+            await host.isochronous_out(ctx, 1, payload[frame * mult:(frame + 1) * mult])
+
+    async def firmware_process(ctx):
+        await regs.write(ctx, "isochronous", 1 | (mult << 4))
+        await regs.write(ctx, "endpoint", 1)
+        await regs.write(ctx, "prime", 1)
+        await regs.write(ctx, "enable", 1)
+        while len(results) < len(payload):
+            results.append(await _unload_out_packet(ctx, regs))
+
+    statistics = _run(harness, host_process, firmware_process, speed=speed, timeout=(frames + 2) * 1e-3)
+    if results != payload:
+        raise RuntimeError("Isochronous OUT data mismatch")
+    return statistics
+
+
+BENCHMARKS = {
+    "bulk_in":                benchmark_bulk_in,
+    "transfer_bulk_in":       benchmark_transfer_bulk_in,
+    "bulk_out":               benchmark_bulk_out,
+    "bulk_out_nyet":          benchmark_bulk_out_nyet,
+    "bulk_out_errors":        benchmark_bulk_out_errors,
+    "serial_in":              benchmark_serial_in,
+    "packetram_bulk_in":      benchmark_packetram_bulk_in,
+    "packetram_bulk_out":     benchmark_packetram_bulk_out,
+    "packetram_bulk_in_cdc":  partial(benchmark_packetram_bulk_in,  wb_domain="sync"),
+    "packetram_bulk_out_cdc": partial(benchmark_packetram_bulk_out, wb_domain="sync"),
+    "dma_bulk_in":            benchmark_dma_bulk_in,
+    "dma_bulk_out":           benchmark_dma_bulk_out,
+    "dma_bulk_in_cdc":        partial(benchmark_dma_bulk_in,  wb_domain="sync"),
+    "dma_bulk_out_cdc":       partial(benchmark_dma_bulk_out, wb_domain="sync"),
+    "control_in":             benchmark_control_in,
+    "control_enumeration":    benchmark_control_enumeration,
+    "isochronous_in":         benchmark_isochronous_in,
+    "isochronous_out":        benchmark_isochronous_out,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs throughput benchmarks for the eptri endpoints in simulation.")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help="the benchmarks to run, from {}; by default, all of them".format(", ".join(BENCHMARKS)))
+    parser.add_argument("--speed", choices=["high", "full"], default="high",
+                        help="the speed of the simulated bus")
+    parser.add_argument("--min-throughput", type=float, default=0, metavar="BYTES_PER_SECOND",
+                        help="exit with an error if any benchmark falls below this throughput")
+    args = parser.parse_args(argv)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark {!r}".format(name))
+
+    speed  = USBSpeed.HIGH if args.speed == "high" else USBSpeed.FULL
+    failed = False
+    for name in args.benchmarks or BENCHMARKS:
+        kwargs = {"speed": speed}
+        if speed == USBSpeed.FULL and not name.startswith("control"):
+            kwargs["max_packet_size"] = 64 if "bulk" in name else 1023
+
+        statistics = BENCHMARKS[name](**kwargs)
+        too_slow   = statistics.bytes_per_second < args.min_throughput
+        failed    |= too_slow
+        print("{:24s} {}{}".format(name, statistics, "  [below minimum]" if too_slow else ""))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())